@@ -0,0 +1,103 @@
+import math
+
+import torch
+import torch.nn.functional as F
+
+MAX_ROTATION_DEG = 15.0  # sensor re-seated slightly differently
+GAIN_STD = 0.05          # per-axis sensitivity spread
+NOISE_STD = 0.05         # additive noise, relative to each window's per-axis std
+MAX_WARP = 0.1           # playback speed within 1 +/- MAX_WARP
+MAX_SHIFT = 8            # samples the window start may move by
+
+
+def random_rotations(batch, max_angle, generator=None):
+    """(batch, 3, 3) rotations about uniformly random axes by angles up to max_angle radians"""
+    axis = torch.randn(batch, 3, generator=generator)
+    axis = axis / axis.norm(dim=1, keepdim=True).clamp_min(1e-12)
+    angle = (torch.rand(batch, generator=generator) * 2 - 1) * max_angle
+
+    # Rodrigues: R = I + sin(a) K + (1 - cos(a)) K^2, K the cross-product matrix of the axis
+    x, y, z = axis.unbind(dim=1)
+    zero = torch.zeros_like(x)
+    k = torch.stack([zero, -z, y, z, zero, -x, -y, x, zero], dim=1).view(batch, 3, 3)
+    sin = angle.sin().view(batch, 1, 1)
+    cos = angle.cos().view(batch, 1, 1)
+    return torch.eye(3).expand(batch, 3, 3) + sin * k + (1 - cos) * (k @ k)
+
+
+def resample_positions(windows, positions):
+    """
+    windows (B, C, T) read at fractional sample positions (B, T), linearly
+    interpolated and clamped to the window's ends. Done as a one-row grid_sample,
+    which is several times faster than two gathers.
+    """
+    length = windows.shape[-1]
+    x = positions.to(windows.dtype) / max(length - 1, 1) * 2 - 1
+    grid = torch.stack([x, torch.zeros_like(x)], dim=-1).unsqueeze(1)  # (B, 1, T, 2)
+    return F.grid_sample(windows.unsqueeze(2), grid, mode='bilinear', padding_mode='border',
+                         align_corners=True).squeeze(2)
+
+
+class BatchAugment:
+    """
+    Random 3-D rotation, gain jitter, additive noise, time warp and window shift
+    applied to a whole (batch, 3, window) training batch with a handful of tensor
+    ops, on whatever device the batch is on.
+
+    Each transform is applied to a random fraction `p` of the windows, and only
+    those windows are resampled or get noise drawn for them. Time warp
+    and shift are one resampling pass: window sample t is read from
+    (t - centre) * speed + centre + shift, clamped to the window. Noise is scaled
+    by each window's own per-axis standard deviation, since still and moving
+    windows differ by orders of magnitude. Random numbers are drawn on the CPU
+    from `generator` (seed it for reproducible augmentation) and moved over.
+    """
+
+    def __init__(self, max_rotation_deg=MAX_ROTATION_DEG, gain_std=GAIN_STD, noise_std=NOISE_STD,
+                 max_warp=MAX_WARP, max_shift=MAX_SHIFT, p=0.5, generator=None):
+        self.max_rotation = math.radians(max_rotation_deg)
+        self.gain_std = gain_std
+        self.noise_std = noise_std
+        self.max_warp = max_warp
+        self.max_shift = max_shift
+        self.p = p
+        self.generator = generator
+
+    def _mask(self, batch):
+        return torch.rand(batch, generator=self.generator) < self.p
+
+    def __call__(self, windows):
+        batch, channels, length = windows.shape
+        device, dtype = windows.device, windows.dtype
+        gen = self.generator
+
+        # Rotation and gain are folded into one (batch, channels, channels) matrix product
+        mix = torch.eye(channels).repeat(batch, 1, 1)
+        if self.max_rotation > 0 and channels == 3:
+            rotated = self._mask(batch)
+            mix[rotated] = random_rotations(int(rotated.sum()), self.max_rotation, gen)
+        if self.gain_std > 0:
+            gain = 1 + torch.randn(batch, channels, 1, generator=gen) * self.gain_std
+            gain = torch.where(self._mask(batch).view(batch, 1, 1), gain, torch.ones_like(gain))
+            mix = gain * mix
+        if self.max_rotation > 0 or self.gain_std > 0:
+            windows = mix.to(device, dtype) @ windows
+
+        if self.max_warp > 0 or self.max_shift > 0:
+            index = self._mask(batch).nonzero().squeeze(1)
+            speed = 1 + (torch.rand(len(index), 1, generator=gen) * 2 - 1) * self.max_warp
+            shift = torch.randint(-self.max_shift, self.max_shift + 1, (len(index), 1), generator=gen)
+            centre = (length - 1) / 2
+            positions = (torch.arange(length) - centre) * speed + centre + shift
+            index = index.to(device)
+            windows = windows.index_copy(0, index, resample_positions(windows[index], positions.to(device)))
+
+        if self.noise_std > 0:
+            index = self._mask(batch).nonzero().squeeze(1).to(device)
+            chosen = windows[index]
+            noise = torch.randn(chosen.shape, generator=gen).to(device, dtype)
+            # Spelled out: torch's std() along the last axis is several times slower on CPU
+            std = (chosen - chosen.mean(dim=2, keepdim=True)).square().mean(dim=2, keepdim=True).sqrt()
+            windows = windows.index_copy(0, index, chosen + noise * std * self.noise_std)
+
+        return windows
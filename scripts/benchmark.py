@@ -0,0 +1,255 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from data_paths import dataset_path, model_path
+
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+WINDOW_SIZE = 128
+MANIFEST = dataset_path("manifest.csv")
+MODEL_PATH = model_path("motion_model.pth")
+DEFAULT_THRESHOLD = 0.10  # relative change counted as a regression
+
+
+def time_calls(fn, repeat=20, number=1, warmup=3):
+    """Seconds per call: median, p95 and min over `repeat` timings of `number` calls"""
+    for _ in range(warmup):
+        fn()
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings[i] = (time.perf_counter() - start) / number
+    return {'median': float(np.median(timings)),
+            'p95': float(np.percentile(timings, 95)),
+            'min': float(timings.min())}
+
+
+def result(value, unit, higher_is_better, **extra):
+    return dict(value=value, unit=unit, higher_is_better=higher_is_better, **extra)
+
+
+# ------------------------
+# Inputs
+# ------------------------
+def synthetic_samples(num_samples, seed=0):
+    """Raw 14-bit counts: gravity on z plus noise and a slow sway, reproducible from seed"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples) / 50.0
+    g = np.stack([0.1 * np.sin(2 * np.pi * 0.5 * t),
+                  0.1 * np.cos(2 * np.pi * 0.3 * t),
+                  np.ones_like(t)], axis=1)
+    g += rng.normal(0, 0.02, g.shape)
+    from replay_transport import to_raw
+    return to_raw(g)
+
+
+def dataset_samples(manifest=MANIFEST):
+    from recording_cache import load_manifest
+    from replay_transport import to_raw
+    return to_raw(np.concatenate([recording.xyz for recording, _ in load_manifest(manifest)]))
+
+
+def notifications(raw):
+    """Notification payloads exactly as the firmware sends them"""
+    from replay_transport import firmware_bursts
+    return [chunk for burst in firmware_bursts(raw) for chunk in burst]
+
+
+# ------------------------
+# Benchmarks
+# ------------------------
+def bench_decode(raw, repeat):
+    from frame_decoder import FrameDecoder
+    from ring_buffer import SampleRingBuffer
+
+    payloads = notifications(raw)
+    num_samples = sum(len(p) for p in payloads) // 6
+
+    def live_path():
+        decoder = FrameDecoder()
+        buffer = SampleRingBuffer(4096)
+        for data in payloads:
+            buffer.extend(decoder.feed(data))
+
+    timing = time_calls(live_path, repeat=repeat)
+    results = {'decode.live': result(num_samples / timing['median'], 'samples/s', True,
+                                     notifications=len(payloads), **timing)}
+
+    try:
+        import ble_receive
+    except ImportError as e:
+        print(f"Skipping decode.capture: {e}")
+        return results
+
+    logging.getLogger(ble_receive.__name__).setLevel(logging.WARNING)
+
+    def capture_path():
+        decoder = FrameDecoder()
+        captured = {'raw_x': [], 'raw_y': [], 'raw_z': []}
+        for data in payloads:
+            ble_receive.notification_handler(None, data, captured, decoder)
+
+    timing = time_calls(capture_path, repeat=repeat)
+    results['decode.capture'] = result(num_samples / timing['median'], 'samples/s', True, **timing)
+    return results
+
+
+def bench_convert(raw, repeat):
+    from live_ML import convert_values
+
+    results = {}
+    # One notification burst, a full live buffer, and the whole input
+    for name, block in (('n150', raw[:150]), ('n4096', raw[:4096]), ('all', raw)):
+        timing = time_calls(lambda: convert_values(block), repeat=repeat, number=10)
+        results[f'convert_values.{name}'] = result(timing['median'] * 1e6, 'us', False,
+                                                   samples=len(block), **timing)
+    return results
+
+
+def bench_model(repeat, threads=None):
+    import torch
+    from motionDetection import MotionDetection
+
+    if threads:
+        torch.set_num_threads(threads)
+    model = MotionDetection.load(MODEL_PATH, WINDOW_SIZE)
+
+    results = {}
+    generator = torch.Generator().manual_seed(0)
+    with torch.no_grad():
+        for batch_size in BATCH_SIZES:
+            x = torch.randn(batch_size, 3, WINDOW_SIZE, generator=generator)
+            timing = time_calls(lambda: model(x), repeat=repeat)
+            results[f'model.batch{batch_size}.latency'] = result(timing['median'] * 1e3, 'ms', False, **timing)
+            results[f'model.batch{batch_size}.throughput'] = result(batch_size / timing['median'], 'windows/s', True)
+    return results
+
+
+def bench_update(raw, repeat):
+    import matplotlib
+    matplotlib.use("Agg")
+    import live_ML
+    from ring_buffer import SampleRingBuffer
+
+    captured = SampleRingBuffer(live_ML.CAPTURE_CAPACITY)
+    captured.extend(raw[:live_ML.CAPTURE_CAPACITY])
+    from pulse_store import PulseStore
+    pulse = PulseStore(max_age=live_ML.PULSE_RETENTION_SEC)
+    pulse.extend(time.time() - np.arange(6000)[::-1] / 100.0, np.arange(6000))
+    fig, view = live_ML.make_live_plot(captured, pulse, {'label': "GOOD"})
+    fig.canvas.draw()  # caches the background the frames blit onto
+
+    timing = time_calls(view.update, repeat=repeat)
+    results = {'update.live_ML': result(timing['median'] * 1e3, 'ms', False, **timing)}
+
+    # Whole frame: update, restore background, draw lines, blit
+    timing = time_calls(view.frame, repeat=repeat)
+    results['update.live_ML.draw'] = result(timing['median'] * 1e3, 'ms', False,
+                                            full_draws=view.full_draws, **timing)
+    return results
+
+
+SUITES = ['decode', 'convert', 'model', 'update']
+
+
+def run(suites, source, repeat, threads=None, seed=0):
+    raw = dataset_samples() if source == 'dataset' else synthetic_samples(60 * 50 * 10, seed)
+
+    results = {}
+    if 'decode' in suites:
+        results.update(bench_decode(raw, repeat))
+    if 'convert' in suites:
+        results.update(bench_convert(raw, repeat))
+    if 'model' in suites:
+        results.update(bench_model(repeat, threads))
+    if 'update' in suites:
+        results.update(bench_update(raw, repeat))
+
+    meta = {
+        'time': datetime.now().astimezone().isoformat(),
+        'source': source,
+        'seed': seed,
+        'samples': int(len(raw)),
+        'repeat': repeat,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+    try:
+        import torch
+        meta['torch'] = torch.__version__
+        meta['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+
+    return {'meta': meta, 'results': results}
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Rows of (name, baseline, current, relative change, regressed) for shared metrics"""
+    rows = []
+    for name, base in baseline['results'].items():
+        if name not in current['results']:
+            continue
+        new = current['results'][name]
+        change = (new['value'] - base['value']) / base['value'] if base['value'] else 0.0
+        # Positive `worse` means the metric moved in the bad direction
+        worse = -change if base['higher_is_better'] else change
+        rows.append((name, base['value'], new['value'], change, worse > threshold, base['unit']))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the earworm host-side hot paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run benchmarks and write JSON results")
+    run_parser.add_argument("--suite", action="append", choices=SUITES, help="suite to run (default: all)")
+    run_parser.add_argument("--source", choices=["synthetic", "dataset"], default="synthetic")
+    run_parser.add_argument("--repeat", type=int, default=20)
+    run_parser.add_argument("--threads", type=int, help="torch.set_num_threads for the model suite")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default="benchmark.json")
+
+    compare_parser = subparsers.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.suite or SUITES, args.source, args.repeat, args.threads, args.seed)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        for name, r in report['results'].items():
+            print(f"{name:32s} {r['value']:14.3f} {r['unit']}")
+        print(f"Saved to \"{args.output}\"")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    for name, base, new, change, regressed, unit in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:32s} {base:14.3f} -> {new:14.3f} {unit:10s} {change:+7.1%} {flag}")
+    regressions = sum(row[4] for row in rows)
+    print(f"{regressions} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,267 +1,6 @@
-<<<<<<< HEAD
-import asyncio
-import logging
-import os
-import threading
-import numpy as np
-import scipy as sp
-from bleak import BleakClient, BleakScanner
-from matplotlib import pyplot as plt
-from datetime import datetime
-from functools import partial
-import hdf5storage as h5
-import serial
-
-EARWORM_MAC = "EF:90:1:F7:43:EA"
-EARWORM_NAME = "earworm_ble"
-UART_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
-
-DATA_OFFSET = 0
-
-FRAME_SIZE = 6
-XYZ_SIZE = 2
-X_OFFSET = 0
-Y_OFFSET = 2
-Z_OFFSET = 4
-
-XYZ_SENSITIVITY = 0.001
-RANGE=2
-GRAVITY = 9.8
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-
-async def discover_device():
-    logger.info("Scanning for BLE devices...")
-
-    # Scan for available devices
-    devices = await BleakScanner.discover()
-    logger.info(f"Found {len(devices)} devices.")
-
-    # Look for the target device by MAC address or name
-    for device in devices:
-        logger.info(
-            f"Discovered device: {device.name} ({device.address})"
-        )  # Log all discovered devices
-        if device.address == EARWORM_MAC or device.name == EARWORM_NAME:
-            logger.info(f"Found target device: {device.name} ({device.address})")
-            return device
-    return None
-
-# Define the notification handler function
-def notification_handler(sender, data, captured_data):
-    """Callback for received BLE notifications"""
-    logger.info(f"Notification from {sender}")
-    logger.info(f"Packet length: {len(data)}")
-    try:
-        for i in range(0, len(data), FRAME_SIZE):
-            frame = data[i:i+FRAME_SIZE]
-
-            raw_x = int.from_bytes(frame[X_OFFSET:X_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_y = int.from_bytes(frame[Y_OFFSET:Y_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_z = int.from_bytes(frame[Z_OFFSET:Z_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-
-            captured_data['raw_x'].append(raw_x)
-            captured_data['raw_y'].append(raw_y)
-            captured_data['raw_z'].append(raw_z)
-
-    except Exception as e:
-        logger.error(f"Error in notification handler: {e}")
-
-async def connect_and_dump_packets(device, capture_time_sec=60.0):
-    captured_data = {'raw_x': [], 'raw_y': [], 'raw_z': []}
-    async with BleakClient(device.address) as client:
-        logger.info(f"Connected to {device.name} ({device.address})")
-
-        services = await client.get_services()
-        for service in services:
-            for char in service.characteristics:
-                logger.info(f"Service: {service.uuid}, Characteristic: {char.uuid}, Properties: {char.properties}")
-
-        # This part dumps all incoming packets
-        print(f"Starting data capture...")
-        await client.start_notify(UART_UUID, partial(notification_handler, captured_data=captured_data))
-        await asyncio.sleep(5)
-        await asyncio.sleep(capture_time_sec)
-        await client.stop_notify(UART_UUID)
-        print(f"Data capture complete!")
-
-    return captured_data
-
-async def connect_device(device):
-    client = BleakClient(device.address)
-    await client.connect()
-    logger.info(f"Connected to {device.name} ({device.address})")
-    await asyncio.sleep(1)
-    services = await client.get_services()
-    for service in services:
-        for char in service.characteristics:
-            logger.info(f"Service: {service.uuid}, Characteristic: {char.uuid}, Properties: {char.properties}")
-
-    return client
-
-async def dump_packets(client, capture_time_sec=60.0):
-    captured_data = {'raw_x': [], 'raw_y': [], 'raw_z': []}
-
-    await client.start_notify(UART_UUID, lambda sender, data: notification_handler(sender, data, captured_data))
-    await asyncio.sleep(1)
-    await asyncio.sleep(capture_time_sec)
-    await client.stop_notify(UART_UUID)
-
-    return captured_data
-
-def convert_values(raw_values, resolution=14):
-    min_val = 2**(resolution-1)
-    max_val = 2**resolution-1
-    scale_factor = (2 * GRAVITY) / (max_val - min_val)
-
-    return [val * scale_factor for val in raw_values]
-
-
-def read_serial_pulse(port='COM3', baudrate=9600, pulse_data=None, duration=60):
-    try:
-        ser = serial.Serial(port, baudrate, timeout=1)
-        print(f"Serial port {port} opened.")
-        start_time = time.time()
-
-        while time.time() - start_time < duration:
-            line = ser.readline().decode('utf-8').strip()
-            if line.isdigit():
-                value = int(line)
-                timestamp = time.time()
-                pulse_data['timestamps'].append(timestamp)
-                pulse_data['values'].append(value)
-    except Exception as e:
-        print(f"Error reading from serial: {e}")
-
-def plot_accel(accel_values, fs=50.0):
-    x_vals = accel_values['accel_x']
-    y_vals = accel_values['accel_y']
-    z_vals = accel_values['accel_z']
-
-    #print(f"x_val len: {len(x_vals)}")
-    #print(f"y_val len: {len(x_vals)}")
-    #print(f"z_val len: {len(x_vals)}")
-
-    time = np.arange(len(x_vals)) / fs
-
-    plt.figure(figsize=(10,5))
-
-    plt.plot(time, x_vals, label='X-axis', color='r')
-    plt.plot(time, y_vals, label='Y-axis', color='g')
-    plt.plot(time, z_vals, label='Z-axis', color='b')
-
-
-    plt.xlabel('Time (s)')
-    plt.ylabel('Acceleration (g)')
-    plt.title('Unaltered acceleration data')
-    plt.legend()
-    plt.grid(True)
-    plt.show()
-
-def plot_accel_n_pulse(accel_values, pulse_data=None, fs=50.0):
-    x_vals = accel_values['accel_x']
-    y_vals = accel_values['accel_y']
-    z_vals = accel_values['accel_z']
-    time_vals = np.arange(len(x_vals)) / fs
-
-    plt.figure(figsize=(12, 8))
-
-    plt.subplot(4, 1, 1)
-    plt.plot(time_vals, x_vals, 'r', label='X-axis')
-    plt.ylabel('Accel X (g)')
-    plt.grid()
-    plt.legend()
-
-    plt.subplot(4, 1, 2)
-    plt.plot(time_vals, y_vals, 'g', label='Y-axis')
-    plt.ylabel('Accel Y (g)')
-    plt.grid()
-    plt.legend()
-
-    plt.subplot(4, 1, 3)
-    plt.plot(time_vals, z_vals, 'b', label='Z-axis')
-    plt.ylabel('Accel Z (g)')
-    plt.grid()
-    plt.legend()
-
-    if pulse_data:
-        pulse_t = np.array(pulse_data['timestamps'])
-        pulse_y = np.array(pulse_data['values'])
-
-        # Normalize time axis relative to pulse start time
-        pulse_t -= pulse_t[0]
-        plt.subplot(4, 1, 4)
-        plt.plot(pulse_t, pulse_y, color='purple', label='PulseSensor')
-        plt.xlabel('Time (s)')
-        plt.ylabel('Pulse (a.u.)')
-        plt.grid()
-        plt.legend()
-
-    plt.tight_layout()
-    plt.show()
-
-
-async def eventCap(capture_time_sec=60.0, prefix='dataCapture', sample_rate=50,
-                   timestamp_tick=20000, returnDict=None):
-
-    # Set up data collection
-    data = {}
-    data['timeinfo'] = {}
-    data['timeinfo']['tickHz'] = 20000
-    data['timeinfo']['timezone'] = datetime.now().astimezone().tzname()
-    data['Fs'] = sample_rate
-
-    pulse_data = {'timestamps': [], 'values': []}
-    pulse_thread = threading.Thread(target=read_serial_pulse,
-                                    args=('COM3', 9600, pulse_data, capture_time_sec),
-                                    daemon=True)
-    pulse_thread.start()
-
-    # Discover and connect to target device
-    device = await discover_device()
-    client = await connect_device(device)
-
-    print(f"Starting data capture...")
-    start_time = datetime.now().astimezone()
-    captured = await dump_packets(client, capture_time_sec=60.0)
-    print(f"Data capture complete!")
-
-    #print(f"Captured data: {captured}")
-
-    data['sData'] = {}
-    data['sData']['Time'] = np.arange(len(captured['raw_x'])) * data['timeinfo']['tickHz'] / sample_rate
-    data['sData']['accel_x'] = convert_values(captured['raw_x'])
-    data['sData']['accel_y'] = convert_values(captured['raw_y'])
-    data['sData']['accel_z'] = convert_values(captured['raw_z'])
-
-    # Save data
-    filename = prefix + start_time.strftime('-%Y-%m-%dT%H-%M-%S') + '.mat'
-
-    print(f"Saving to file \"{filename}\"")
-#    h5.write(data, filename)
-
-    pulse_thread.join()  # Wait for pulse thread to finish
-
-    plot_accel_n_pulse(data['sData'], pulse_data=pulse_data)
-
-    # plot_accel(data['sData'])
-
-    if returnDict is not None:
-        returnDict['filename'] = filename
-        returnDict['sampleCount'] = len(captured['raw_x'])
-        returnDict['startTime'] = start_time
-
-if __name__ == "__main__":
-    asyncio.run(eventCap(60.0))
-=======
 import asyncio
 import logging
-import os
-import threading
-import torch
+import time
 import numpy as np
 import scipy as sp
 from bleak import BleakClient, BleakScanner
@@ -269,6 +8,12 @@ from matplotlib import pyplot as plt
 from datetime import datetime
 from functools import partial
 import hdf5storage as h5
+from frame_decoder import FrameDecoder
+from capture_log import CaptureLogWriter, to_mat_dict
+from pulse_store import PulseStore
+from serial_reader import read_into, PULSE_RAW
+from stream_align import align
+from link_telemetry import LinkTelemetry
 
 STORAGE_OPTIONS = h5.Options(
     store_python_metadata=True,
@@ -284,25 +29,13 @@ UART_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
 
 DATA_OFFSET = 0
 
-FRAME_SIZE = 6
-XYZ_SIZE = 2
-X_OFFSET = 0
-Y_OFFSET = 2
-Z_OFFSET = 4
-
 XYZ_SENSITIVITY = 0.001
 RANGE=2
 GRAVITY = 9.8
-WINDOW_SIZE = 64
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_model(filename):
-    # Load in the motion detection model
-    model = torch.load(filename)
-    return model
-
 async def discover_device():
     logger.info("Scanning for BLE devices...")
 
@@ -321,25 +54,51 @@ async def discover_device():
     return None
 
 # Define the notification handler function
-def notification_handler(sender, data, captured_data):
+def notification_handler(sender, data, captured_data, decoder, telemetry=None):
     """Callback for received BLE notifications"""
-    logger.info(f"Notification from {sender}")
-    logger.info(f"Packet length: {len(data)}")
     try:
-        for i in range(0, len(data), FRAME_SIZE):
-            frame = data[i:i+FRAME_SIZE]
-
-            raw_x = int.from_bytes(frame[X_OFFSET:X_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_y = int.from_bytes(frame[Y_OFFSET:Y_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_z = int.from_bytes(frame[Z_OFFSET:Z_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
+        frames = decoder.feed(data)
+        captured_data['raw_x'].extend(frames[:, 0].tolist())
+        captured_data['raw_y'].extend(frames[:, 1].tolist())
+        captured_data['raw_z'].extend(frames[:, 2].tolist())
+        if telemetry is not None:
+            telemetry.record(len(data), len(frames))
 
-            captured_data['raw_x'].append(raw_x)
-            captured_data['raw_y'].append(raw_y)
-            captured_data['raw_z'].append(raw_z)
+    except Exception as e:
+        logger.error(f"Error in notification handler: {e}")
 
+def log_notification_handler(sender, data, capture_log, decoder, telemetry=None):
+    """Callback that appends received samples straight to the capture log"""
+    try:
+        arrival = time.time()
+        frames = decoder.feed(data)
+        capture_log.append(frames, arrival)
+        if telemetry is not None:
+            telemetry.record(len(data), len(frames), arrival)
     except Exception as e:
         logger.error(f"Error in notification handler: {e}")
 
+async def connect_and_dump_packets(device, capture_time_sec=60.0):
+    captured_data = {'raw_x': [], 'raw_y': [], 'raw_z': []}
+    async with BleakClient(device.address) as client:
+        logger.info(f"Connected to {device.name} ({device.address})")
+
+        services = await client.get_services()
+        for service in services:
+            for char in service.characteristics:
+                logger.info(f"Service: {service.uuid}, Characteristic: {char.uuid}, Properties: {char.properties}")
+
+        # This part dumps all incoming packets
+        print(f"Starting data capture...")
+        await client.start_notify(UART_UUID, partial(notification_handler, captured_data=captured_data,
+                                                     decoder=FrameDecoder()))
+        await asyncio.sleep(5)
+        await asyncio.sleep(capture_time_sec)
+        await client.stop_notify(UART_UUID)
+        print(f"Data capture complete!")
+
+    return captured_data
+
 async def connect_device(device):
     client = BleakClient(device.address)
     await client.connect()
@@ -354,16 +113,35 @@ async def connect_device(device):
 
     return client
 
-async def dump_packets(client, capture_time_sec=60.0):
+async def stream_for(client, handler, capture_time_sec, telemetry):
+    """Run notifications through handler for capture_time_sec, logging link telemetry as it goes"""
+    reporter = asyncio.create_task(telemetry.report())
+    await client.start_notify(UART_UUID, handler)
+    try:
+        await asyncio.sleep(1)
+        await asyncio.sleep(capture_time_sec)
+        await client.stop_notify(UART_UUID)
+    finally:
+        reporter.cancel()
+    logger.info(telemetry.summary())
+
+async def dump_packets(client, capture_time_sec=60.0, sample_rate=50):
     captured_data = {'raw_x': [], 'raw_y': [], 'raw_z': []}
 
-    await client.start_notify(UART_UUID, lambda sender, data: notification_handler(sender, data, captured_data))
-    await asyncio.sleep(1)
-    await asyncio.sleep(capture_time_sec)
-    await client.stop_notify(UART_UUID)
+    decoder = FrameDecoder()
+    telemetry = LinkTelemetry(fs=sample_rate, mtu=client.mtu_size)
+    await stream_for(client, lambda sender, data: notification_handler(sender, data, captured_data, decoder, telemetry),
+                     capture_time_sec, telemetry)
 
     return captured_data
 
+async def log_packets(client, capture_log, capture_time_sec=60.0, sample_rate=50):
+    decoder = FrameDecoder()
+    telemetry = LinkTelemetry(fs=sample_rate, mtu=client.mtu_size)
+    await stream_for(client, lambda sender, data: log_notification_handler(sender, data, capture_log, decoder, telemetry),
+                     capture_time_sec, telemetry)
+    capture_log.flush()
+
 def convert_values(raw_values, resolution=14):
     min_val = 2**(resolution-1)
     max_val = 2**resolution-1
@@ -371,6 +149,10 @@ def convert_values(raw_values, resolution=14):
 
     return [val * scale_factor for val in raw_values]
 
+async def read_serial_pulse(port='COM3', baudrate=9600, pulse_data=None, duration=60):
+    # Runs on the capture's event loop; the whole serial buffer is parsed at once
+    return await read_into(pulse_data, port, baudrate, PULSE_RAW, duration=duration)
+
 def plot_accel(accel_values, fs=50.0):
     x_vals = sp.signal.detrend(accel_values['accel_x'])
     y_vals = sp.signal.detrend(accel_values['accel_y'])
@@ -392,53 +174,91 @@ def plot_accel(accel_values, fs=50.0):
     plt.grid(True)
     plt.show()
 
-def plot_motion_results(accel_data, fs=50.0):
-   ''' Run motion detection model on sliding window of accelerometer data'''
-   pass
+def plot_accel_n_pulse(accel_values, pulse_data=None, fs=50.0):
+    # Both streams on the host clock, resampled onto one grid (see stream_align.py)
+    accel = np.column_stack([accel_values['accel_x'], accel_values['accel_y'], accel_values['accel_z']])
+    host_time = accel_values.get('HostTime')
+    if host_time is None:
+        host_time = np.arange(len(accel)) / fs
+    pulse_t, pulse_y = pulse_data.all() if pulse_data else (None, None)
+    aligned = align(host_time, accel, pulse_t, pulse_y, rate=fs)
+
+    # Normalize time axis relative to the start of the joint grid
+    time_vals = aligned.time - aligned.time[0] if len(aligned.time) else aligned.time
+    x_vals, y_vals, z_vals = aligned.accel.T
+
+    plt.figure(figsize=(12, 8))
+
+    plt.subplot(4, 1, 1)
+    plt.plot(time_vals, x_vals, 'r', label='X-axis')
+    plt.ylabel('Accel X (g)')
+    plt.grid()
+    plt.legend()
+
+    plt.subplot(4, 1, 2)
+    plt.plot(time_vals, y_vals, 'g', label='Y-axis')
+    plt.ylabel('Accel Y (g)')
+    plt.grid()
+    plt.legend()
+
+    plt.subplot(4, 1, 3)
+    plt.plot(time_vals, z_vals, 'b', label='Z-axis')
+    plt.ylabel('Accel Z (g)')
+    plt.grid()
+    plt.legend()
+
+    if aligned.pulse is not None:
+        plt.subplot(4, 1, 4)
+        plt.plot(time_vals, aligned.pulse, color='purple', label='PulseSensor')
+        plt.xlabel('Time (s)')
+        plt.ylabel('Pulse (a.u.)')
+        plt.grid()
+        plt.legend()
+
+    plt.tight_layout()
+    plt.show()
 
 async def eventCap(capture_time_sec=60.0, prefix='dataCapture', sample_rate=50,
                    timestamp_tick=20000, returnDict=None):
 
-    # Set up data collection
-    data = {}
-    data['timeinfo'] = {}
-    data['timeinfo']['tickHz'] = 20000
-    data['timeinfo']['timezone'] = datetime.now().astimezone().tzname()
-    data['Fs'] = sample_rate
+    pulse_data = PulseStore()
+    pulse_task = asyncio.create_task(read_serial_pulse('COM3', 9600, pulse_data, capture_time_sec))
 
     # Discover and connect to target device
     device = await discover_device()
     client = await connect_device(device)
 
-    print(f"Starting data capture...")
+    # Samples go to disk while the capture runs (see capture_log.py for the format)
     start_time = datetime.now().astimezone()
-    captured = await dump_packets(client, capture_time_sec=60.0)
+    log_prefix = prefix + start_time.strftime('-%Y-%m-%dT%H-%M-%S')
+    print(f"Starting data capture, logging to \"{log_prefix}\"...")
+    with CaptureLogWriter(log_prefix, fs=sample_rate, tick_hz=timestamp_tick,
+                          timezone=start_time.tzname(), address=device.address,
+                          start_time=start_time) as capture_log:
+        flusher = asyncio.create_task(capture_log.flush_periodically())
+        try:
+            await log_packets(client, capture_log, capture_time_sec=capture_time_sec, sample_rate=sample_rate)
+        finally:
+            flusher.cancel()
+        sample_count = capture_log.sample_count
     print(f"Data capture complete!")
 
-    #print(f"Captured data: {captured}")
-
-    data['sData'] = {}
-    data['sData']['Time'] = np.arange(len(captured['raw_x'])) * data['timeinfo']['tickHz'] / sample_rate
-    data['sData']['accel_x'] = convert_values(captured['raw_x'])
-    data['sData']['accel_y'] = convert_values(captured['raw_y'])
-    data['sData']['accel_z'] = convert_values(captured['raw_z'])
-
-
-    # Save data
-    filename = prefix + start_time.strftime('-%Y-%m-%dT%H-%M-%S') + '.mat'
-
+    # The same .mat layout as before, built from the log once the capture is closed
+    data = to_mat_dict(log_prefix)
+    filename = log_prefix + '.mat'
     print(f"Saving to file \"{filename}\"")
-    #h5.writes(data, filename, options=STORAGE_OPTIONS)
+    h5.writes(data, filename=filename, options=STORAGE_OPTIONS)
+
+    await pulse_task  # Wait for the pulse reader to finish
 
     # Plot accelerometer data
-    plot_accel(data['sData'])
-    plot_motion_results(data['sData'])
+    plot_accel_n_pulse(data['sData'], pulse_data=pulse_data)
 
     if returnDict is not None:
         returnDict['filename'] = filename
-        returnDict['sampleCount'] = len(captured['raw_x'])
+        returnDict['logPrefix'] = log_prefix
+        returnDict['sampleCount'] = sample_count
         returnDict['startTime'] = start_time
 
 if __name__ == "__main__":
     asyncio.run(eventCap(60.0))
->>>>>>> f079735 (segmenting ble packets based on MTU size)
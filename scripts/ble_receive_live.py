@@ -5,57 +5,60 @@ import threading
 import numpy as np
 from bleak import BleakClient, BleakScanner
 from matplotlib import pyplot as plt
-from matplotlib.animation import FuncAnimation
-from datetime import datetime
-import time as time_module
 import time
-import serial
+from frame_decoder import FrameDecoder
+from ring_buffer import SampleRingBuffer
+from pulse_store import PulseStore
+from serial_reader import read_into, PULSE_RAW
+from pipeline import Pipeline, Stage, DROP_OLDEST
+from live_view import LiveView, ring_source, pulse_source
+from link_telemetry import LinkTelemetry
 
 # BLE configuration
 EARWORM_MAC = "EF:90:1:F7:43:EA"
 EARWORM_NAME = "earworm_ble"
 UART_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
 
-# Frame decoding
-FRAME_SIZE = 6
-XYZ_SIZE = 2
-X_OFFSET = 0
-Y_OFFSET = 2
-Z_OFFSET = 4
-
 GRAVITY = 9.8
+CAPTURE_CAPACITY = 4096  # samples kept for plotting
+PULSE_RETENTION_SEC = 60  # pulse readings older than this are dropped
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Shared data dictionary
-captured_data = {'raw_x': [], 'raw_y': [], 'raw_z': []}
-pulse_data = {'timestamps': [], 'values': []}
+captured_data = SampleRingBuffer(CAPTURE_CAPACITY)
+pulse_data = PulseStore(max_age=PULSE_RETENTION_SEC)
 
 # Convert raw values to acceleration (g)
 def convert_values(raw_values, resolution=14):
     min_val = 2 ** (resolution - 1)
     max_val = 2 ** resolution - 1
     scale_factor = (2 * GRAVITY) / (max_val - min_val)
-    return [val * scale_factor for val in raw_values]
-
-# Notification handler
-def notification_handler(sender, data, captured_data):
-    try:
-        for i in range(0, len(data), FRAME_SIZE):
-            frame = data[i:i + FRAME_SIZE]
-            raw_x = int.from_bytes(frame[X_OFFSET:X_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_y = int.from_bytes(frame[Y_OFFSET:Y_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_z = int.from_bytes(frame[Z_OFFSET:Z_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            captured_data['raw_x'].append(raw_x)
-            captured_data['raw_y'].append(raw_y)
-            captured_data['raw_z'].append(raw_z)
-            # print(f"X: {raw_x}  Y: {raw_y}  Z: {raw_z}")
-        
-        print(f"data_len = {len(data)} time = {time.time()}")
-    except Exception as e:
-        logger.error(f"Error in notification handler: {e}")
+    return np.asarray(raw_values) * scale_factor
+
+# BLE notification (decoded in the callback) -> ring buffer (read by the plot)
+def build_pipeline(captured_data, telemetry=None):
+    """
+    The pipeline and the handler to pass to start_notify. FrameDecoder carries
+    partial frames between notifications, so the handler decodes every one as it
+    arrives and only decoded frames are queued: a drop loses samples, not alignment.
+    """
+    decoder = FrameDecoder()
+
+    def on_notification(sender, data):
+        arrival = time.time()
+        frames = decoder.feed(data)
+        if telemetry is not None:
+            telemetry.record(len(data), len(frames), arrival)
+        if len(frames):
+            pipeline.submit(frames)
+
+    pipeline = Pipeline([Stage("store", captured_data.extend, maxsize=256, policy=DROP_OLDEST)])
+    if telemetry is not None:
+        telemetry.host_dropped = lambda: pipeline.stages[0].dropped
+    return pipeline, on_notification
 
 # Plotting function
 def plot_accel_live(captured_data, pulse_data, fs=50.0, buffer_sec=3):
@@ -66,10 +69,11 @@ def plot_accel_live(captured_data, pulse_data, fs=50.0, buffer_sec=3):
 
     fig.suptitle('Real-time Acceleration Data')
 
-    line_x, = ax_x.plot([], [], color='r', label='X-axis')
-    line_y, = ax_y.plot([], [], color='g', label='Y-axis')
-    line_z, = ax_z.plot([], [], color='b', label='Z-axis')
-    line_pulse, = ax_pulse.plot([], [], color='purple', label='PulseSensor')
+    view = LiveView(fig, buffer_sec)
+    view.add_lines([ax_x, ax_y, ax_z], ring_source(captured_data, buffer_size, fs, convert_values),
+                   color=['r', 'g', 'b'], label=['X-axis', 'Y-axis', 'Z-axis'])
+    view.add_lines([ax_pulse], pulse_source(pulse_data, buffer_sec), autoscale=True,
+                   color='purple', label='PulseSensor')
     ax_pulse.set_ylabel('Pulse (a.u.)')
     ax_pulse.set_xlabel('Time (s)')
     ax_pulse.grid(True)
@@ -84,62 +88,13 @@ def plot_accel_live(captured_data, pulse_data, fs=50.0, buffer_sec=3):
 
     ax_z.set_xlabel('Time (s)')
 
-    def update(frame):
-        raw_x = captured_data['raw_x'][-buffer_size:]
-        raw_y = captured_data['raw_y'][-buffer_size:]
-        raw_z = captured_data['raw_z'][-buffer_size:]
-        n = len(raw_x)
-
-        if n == 0:
-            return line_x, line_y, line_z
-
-        x_vals = convert_values(raw_x)
-        y_vals = convert_values(raw_y)
-        z_vals = convert_values(raw_z)
-
-        now = time_module.time()
-        t_vals = np.linspace(now - n / fs, now, n)
-
-        line_x.set_data(t_vals, x_vals)
-        line_y.set_data(t_vals, y_vals)
-        line_z.set_data(t_vals, z_vals)
-
-        ax_x.set_xlim(t_vals[0], t_vals[-1])
-        ax_y.set_xlim(t_vals[0], t_vals[-1])
-        ax_z.set_xlim(t_vals[0], t_vals[-1])
-
-        # PulseSensor update
-        pulse_t = pulse_data['timestamps']
-        pulse_v = pulse_data['values']
-        recent_idx = [i for i, t in enumerate(pulse_t) if t >= now - buffer_sec]
-        if recent_idx:
-            pulse_t_vals = [pulse_t[i] for i in recent_idx]
-            pulse_y_vals = [pulse_v[i] for i in recent_idx]
-            line_pulse.set_data(pulse_t_vals, pulse_y_vals)
-            ax_pulse.set_xlim(pulse_t_vals[0], pulse_t_vals[-1])
-            ax_pulse.set_ylim(min(pulse_y_vals) - 10, max(pulse_y_vals) + 10)
-
-        return line_x, line_y, line_z, line_pulse
-
-    ani = FuncAnimation(fig, update, interval=5000, cache_frame_data=False)
     plt.tight_layout()
+    view.start()
     plt.show()
 
-def read_serial_pulse(port='COM3', baudrate=9600, pulse_data=None):
-    try:
-        ser = serial.Serial(port, baudrate, timeout=1)
-        time.sleep(2)  # Give time to connect
-        print(f"Serial port {port} opened.")
-
-        while True:
-            line = ser.readline().decode('utf-8').strip()
-            if line.isdigit():
-                value = int(line)
-                timestamp = time_module.time()
-                pulse_data['timestamps'].append(timestamp)
-                pulse_data['values'].append(value)
-    except Exception as e:
-        print(f"Error reading from serial: {e}")
+async def read_serial_pulse(port='COM3', baudrate=9600, pulse_data=None):
+    # Runs next to the BLE client on its event loop; the whole serial buffer is parsed at once
+    return await read_into(pulse_data, port, baudrate, PULSE_RAW)
 
 # Discover device
 async def discover_device():
@@ -165,8 +120,16 @@ async def connect_device(device):
         return None
 
 # BLE capture loop
-def run_event_loop(captured_data):
+def run_event_loop(captured_data, pulse_data=None, pulse_port='COM3'):
     async def _run():
+        telemetry = LinkTelemetry()
+        pipeline, on_notification = build_pipeline(captured_data, telemetry)
+        await pipeline.start()
+        reporter = asyncio.create_task(pipeline.report())
+        link_reporter = asyncio.create_task(telemetry.report())
+        if pulse_data is not None:
+            pulse_task = asyncio.create_task(read_serial_pulse(pulse_port, 9600, pulse_data))
+
         device = await discover_device()
         if device is None:
             logger.error("Target BLE device not found.")
@@ -176,7 +139,9 @@ def run_event_loop(captured_data):
             logger.error("Client connection failed.")
             return
 
-        await client.start_notify(UART_UUID, lambda s, d: notification_handler(s, d, captured_data))
+        telemetry.mtu = client.mtu_size
+        # The callback stamps, decodes and enqueues; storing happens in the pipeline
+        await client.start_notify(UART_UUID, on_notification)
         logger.info("Started notifications.")
         try:
             while True:
@@ -186,17 +151,21 @@ def run_event_loop(captured_data):
         finally:
             await client.stop_notify(UART_UUID)
             await client.disconnect()
+            reporter.cancel()
+            link_reporter.cancel()
+            if pulse_data is not None:
+                pulse_task.cancel()
+            await pipeline.stop(drain=False)
             logger.info("Disconnected from BLE device.")
 
     asyncio.run(_run())
 
 # Start threads
 def total(fs=50.0, buffer_sec=3):
-    capture_thread = threading.Thread(target=run_event_loop, args=(captured_data,), daemon=True)
-    pulse_thread = threading.Thread(target=read_serial_pulse, args=('COM3', 9600, pulse_data), daemon=True)
+    # BLE and the pulse sensor share one event loop on this thread
+    capture_thread = threading.Thread(target=run_event_loop, args=(captured_data, pulse_data), daemon=True)
 
     capture_thread.start()
-    pulse_thread.start()
 
     # Run plot in main thread
     plot_accel_live(captured_data, pulse_data, fs=fs, buffer_sec=buffer_sec)
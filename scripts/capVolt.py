@@ -1,52 +1,72 @@
-import serial
+import argparse
+import math
+import time
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from collections import deque
-import time
+from serial_reader import SerialReader, open_port, VOLTAGE, FakeSerial
 
 # === CONFIG ===
-PORT = 'COM3'            # Update to your port
+PORT = 'COM3'            # Update to your port ("fake" for a simulated discharge)
 BAUD_RATE = 9600         # Match Serial.begin() on Arduino
 MAX_POINTS = 2000         # Number of data points shown
 
-# === INIT SERIAL AND DATA BUFFER ===
-ser = serial.Serial(PORT, BAUD_RATE)
-voltages = deque([0.0]*MAX_POINTS, maxlen=MAX_POINTS)
-timestamps = deque([0.0]*MAX_POINTS, maxlen=MAX_POINTS)
-start_time = time.time()
-
-# === SETUP PLOT ===
-fig, ax = plt.subplots()
-line, = ax.plot([], [], lw=2)
-
-def init():
-    ax.set_ylim(0, 6.5)  # Expected voltage range
-    ax.set_title("Capacitor Voltage vs Time")
-    ax.set_xlabel("Time (s)")
-    ax.set_ylabel("Voltage (V)")
-    return line,
-
-def update(frame):
-    global start_time
-
-    while ser.in_waiting:
-        try:
-            line_data = ser.readline().decode('utf-8').strip()
-            voltage = float(line_data)
-            current_time = time.time() - start_time
-            voltages.append(voltage)
-            timestamps.append(current_time)
-        except:
-            continue
-
-    ax.set_xlim(timestamps[0], timestamps[-1])  # Auto-scroll
-    line.set_data(timestamps, voltages)
-    return line,
-
-ani = animation.FuncAnimation(
-    fig, update, init_func=init, interval=50, blit=True,
-    cache_frame_data=False
-)
-
-plt.tight_layout()
-plt.show()
+
+def fake_discharge(volts=6.0, tau=20.0, rate=50):
+    """Lines of an RC discharge sampled at `rate` Hz"""
+    i = 0
+    while True:
+        yield f"{volts * math.exp(-i / rate / tau):.3f}"
+        i += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live capacitor voltage plot (one reading per line)")
+    parser.add_argument("--port", default=PORT)
+    parser.add_argument("--baudrate", type=int, default=BAUD_RATE)
+    args = parser.parse_args(argv)
+
+    # === INIT SERIAL AND DATA BUFFER ===
+    if args.port == "fake":
+        ser = FakeSerial(fake_discharge(), args.baudrate, rate=50)
+    else:
+        ser = open_port(args.port, args.baudrate)
+    reader = SerialReader(ser, columns=VOLTAGE)
+    voltages = deque([0.0]*MAX_POINTS, maxlen=MAX_POINTS)
+    timestamps = deque([0.0]*MAX_POINTS, maxlen=MAX_POINTS)
+    start_time = time.time()
+
+    # === SETUP PLOT ===
+    fig, ax = plt.subplots()
+    line, = ax.plot([], [], lw=2)
+
+    def init():
+        ax.set_ylim(0, 6.5)  # Expected voltage range
+        ax.set_title("Capacitor Voltage vs Time")
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel("Voltage (V)")
+        return line,
+
+    def update(frame):
+        # Everything waiting on the port, parsed in one go; malformed lines are skipped
+        t, values = reader.read_available()
+        if len(values):
+            timestamps.extend(t[-MAX_POINTS:] - start_time)
+            voltages.extend(values[-MAX_POINTS:, 0])
+
+        ax.set_xlim(timestamps[0], timestamps[-1])  # Auto-scroll
+        line.set_data(timestamps, voltages)
+        return line,
+
+    ani = animation.FuncAnimation(
+        fig, update, init_func=init, interval=50, blit=True,
+        cache_frame_data=False
+    )
+
+    plt.tight_layout()
+    plt.show()
+    ser.close()
+
+
+if __name__ == "__main__":
+    main()
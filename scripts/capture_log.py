@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+import numpy as np
+
+from stream_align import sample_times
+
+# Segment file layout:
+#   HEADER_SIZE bytes: MAGIC, uint32 length of the JSON header, JSON header, zero padding
+#   followed by RECORD_DTYPE records (one per sample) appended in blocks
+MAGIC = b"EARWCAP1"
+HEADER_SIZE = 512
+RECORD_DTYPE = np.dtype([('t', '<f8'), ('xyz', '<i2', (3,))])
+SEGMENT_SUFFIX = ".ewc"
+
+GRAVITY = 9.8
+FLUSH_SEC = 2.0  # buffered samples are written out at least this often
+
+
+def segment_path(prefix, index):
+    return f"{prefix}.{index:03d}{SEGMENT_SUFFIX}"
+
+
+class CaptureLogWriter:
+    """
+    Append-only capture log of raw int16 x, y, z samples and their arrival times.
+
+    Samples are collected in a preallocated block and written out when it fills
+    or `flush_sec` after the last write, whichever comes first, so the log on
+    disk is never more than a couple of seconds behind. append() checks the time
+    itself; run flush_periodically() alongside so samples still get written
+    when notifications stop. The log is split into segment files of at most
+    `segment_samples` samples, each with its own header, so a crash can only
+    damage the segment being written. The first segment is created up front,
+    so even a capture with no samples can be opened.
+    """
+
+    def __init__(self, prefix, fs=50, tick_hz=20000, timezone=None, address=None,
+                 start_time=None, block_samples=4096, segment_samples=1 << 20, flush_sec=FLUSH_SEC):
+        self.prefix = prefix
+        self.header = {
+            'version': 1,
+            'Fs': fs,
+            'tickHz': tick_hz,
+            'timezone': timezone,
+            'address': address,
+            'start_time': start_time.isoformat() if start_time is not None else None,
+        }
+        self.segment_samples = segment_samples
+        self.flush_sec = flush_sec
+        self._block = np.zeros(block_samples, dtype=RECORD_DTYPE)
+        self._fill = 0
+        self._segment = -1
+        self._segment_count = 0
+        self._file = None
+        self._last_flush = time.monotonic()
+        self.sample_count = 0
+        self._open_segment(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open_segment(self, first_sample):
+        if self._file is not None:
+            self._file.close()
+        self._segment += 1
+        self._segment_count = 0
+
+        header = dict(self.header, segment=self._segment, first_sample=first_sample)
+        payload = json.dumps(header).encode('utf-8')
+        if len(MAGIC) + 4 + len(payload) > HEADER_SIZE:
+            raise ValueError("Capture header does not fit in HEADER_SIZE")
+
+        self._file = open(segment_path(self.prefix, self._segment), 'wb')
+        raw = MAGIC + np.uint32(len(payload)).tobytes() + payload
+        self._file.write(raw.ljust(HEADER_SIZE, b'\0'))
+        self._file.flush()  # readable (if empty) as soon as it exists
+
+    def append(self, frames, timestamp):
+        """Add (N, 3) samples that arrived together at `timestamp`"""
+        frames = np.asarray(frames, dtype=np.int16).reshape(-1, 3)
+        while len(frames):
+            n = min(len(frames), len(self._block) - self._fill)
+            chunk = self._block[self._fill:self._fill + n]
+            chunk['t'] = timestamp
+            chunk['xyz'] = frames[:n]
+            self._fill += n
+            self.sample_count += n
+            frames = frames[n:]
+            if self._fill == len(self._block):
+                self.flush()
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        if self._fill and time.monotonic() - self._last_flush >= self.flush_sec:
+            self.flush()
+
+    async def flush_periodically(self):
+        """Write out buffered samples every flush_sec until cancelled (same event loop as append)"""
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            self.flush_if_due()
+
+    def flush(self):
+        block = self._block[:self._fill]
+        first_sample = self.sample_count - self._fill
+        while len(block):
+            if self._file is None or self._segment_count == self.segment_samples:
+                self._open_segment(first_sample)
+            n = min(len(block), self.segment_samples - self._segment_count)
+            self._file.write(block[:n].tobytes())
+            self._segment_count += n
+            first_sample += n
+            block = block[n:]
+        if self._file is not None:
+            self._file.flush()
+        self._fill = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an earworm capture segment")
+    length = int(np.frombuffer(raw, dtype='<u4', count=1, offset=len(MAGIC))[0])
+    start = len(MAGIC) + 4
+    return json.loads(raw[start:start + length].decode('utf-8'))
+
+
+def open_segment(path):
+    """Memory-map the complete records of one segment (safe while it is being written)"""
+    num_records = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if num_records <= 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(num_records,))
+
+
+def segment_paths(prefix):
+    return sorted(glob.glob(glob.escape(prefix) + ".[0-9][0-9][0-9]" + SEGMENT_SUFFIX))
+
+
+def open_capture(prefix):
+    """Header of the first segment and a memmap per segment"""
+    paths = segment_paths(prefix)
+    if not paths:
+        raise FileNotFoundError(f"No capture segments for {prefix}")
+    return read_header(paths[0]), [open_segment(path) for path in paths]
+
+
+def load_capture(prefix):
+    """Header, (N, 3) int16 samples and (N,) arrival timestamps of a whole capture"""
+    header, segments = open_capture(prefix)
+    records = np.concatenate(segments) if len(segments) > 1 else segments[0]
+    return header, np.asarray(records['xyz']), np.asarray(records['t'])
+
+
+def convert_values(raw_values, resolution=14):
+    min_val = 2**(resolution-1)
+    max_val = 2**resolution-1
+    scale_factor = (2 * GRAVITY) / (max_val - min_val)
+
+    return np.asarray(raw_values) * scale_factor
+
+
+def to_mat_dict(prefix):
+    """The data['sData'] layout eventCap has always produced, built from the log"""
+    header, raw, timestamps = load_capture(prefix)
+
+    data = {}
+    data['timeinfo'] = {}
+    data['timeinfo']['tickHz'] = header['tickHz']
+    data['timeinfo']['timezone'] = header['timezone']
+    data['Fs'] = header['Fs']
+    data['address'] = header['address']
+
+    data['sData'] = {}
+    # Time counts sensor ticks (tickHz / Fs per sample); HostTime is seconds on the
+    # host clock, the one pulse readings are stamped with
+    data['sData']['Time'] = np.arange(len(raw)) * data['timeinfo']['tickHz'] / data['Fs']
+    data['sData']['HostTime'] = sample_times(timestamps, data['Fs'])
+    data['sData']['ArrivalTime'] = timestamps
+    data['sData']['accel_x'] = convert_values(raw[:, 0])
+    data['sData']['accel_y'] = convert_values(raw[:, 1])
+    data['sData']['accel_z'] = convert_values(raw[:, 2])
+    return data
+
+
+def write_mat(prefix, filename=None):
+    import hdf5storage as h5
+
+    # Same options as STORAGE_OPTIONS in ble_receive.py
+    options = h5.Options(
+        store_python_metadata=True,
+        matlab_compatible=True,
+        structured_numpy_ndarray_as_struct=True,
+        convert_numpy_str_to_utf16=True,
+        structs_as_dicts=True,
+    )
+    filename = filename or prefix + '.mat'
+    h5.writes(to_mat_dict(prefix), filename=filename, options=options)
+    return filename
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert an earworm capture log to a MATLAB file")
+    parser.add_argument("prefix", help="capture prefix (without the .NNN.ewc segment suffix)")
+    parser.add_argument("--output", help="output .mat file (default: <prefix>.mat)")
+    args = parser.parse_args()
+    print(f"Saved \"{write_mat(args.prefix, args.output)}\"")
@@ -0,0 +1,29 @@
+import os
+
+# Default file locations, independent of the working directory. They are found
+# relative to this file (scripts/ in a checkout, or an editable install of it);
+# set EARWORM_ROOT to the repository root when running an installed copy, or
+# pass `earworm --root`.
+ROOT_ENV = "EARWORM_ROOT"
+
+
+def root():
+    return os.path.abspath(os.environ.get(ROOT_ENV) or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def dataset_path(name):
+    return os.path.join(root(), "dataset", name)
+
+
+def model_path(name):
+    """Trained models live next to the scripts that write them"""
+    return os.path.join(root(), "scripts", name)
+
+
+def require(path, what="file"):
+    """path unchanged if it exists, otherwise exit with a message saying where defaults are looked for"""
+    if path is not None and not os.path.exists(path):
+        raise SystemExit(f"{what} not found: {path}\n"
+                         f"Pass a path explicitly, or set {ROOT_ENV} (or `earworm --root`) to the repository "
+                         f"root that contains dataset/ and scripts/ (currently {root()}).")
+    return path
@@ -0,0 +1,64 @@
+import argparse
+import importlib
+import os
+import sys
+
+from data_paths import ROOT_ENV, dataset_path
+
+# Subcommand -> (module, description). Modules are imported only when their command
+# runs, so `earworm capture` never loads torch or matplotlib.
+COMMANDS = {
+    'capture': ('multi_capture', "stream one or more sensors to capture logs"),
+    'live': ('live_ML', "live plot with motion classification"),
+    'train': ('motion_training', "train MotionDetection on the dataset recordings"),
+    'evaluate': ('motion_run', "classify a recording in sliding windows"),
+    'cv': ('motion_cv', "k-fold cross-validation split by time block or recording"),
+    'features': ('motion_features', "train the NumPy feature classifier and compare it with the CNN"),
+    'sweep': ('motion_sweep', "sweep window size, hop, width and learning rate in parallel"),
+    'replay': (None, "run another command against a replayed recording instead of a sensor"),
+}
+
+
+def run_command(command, argv):
+    module = importlib.import_module(COMMANDS[command][0])
+    return module.main(argv)
+
+
+def replay(argv):
+    parser = argparse.ArgumentParser(prog="earworm replay",
+                                     description=COMMANDS['replay'][1])
+    parser.add_argument("--source", default=dataset_path("test_mix2.csv"), help="dataset CSV or capture log prefix")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed (0 = as fast as possible)")
+    parser.add_argument("--loop", action="store_true", help="start over at the end of the recording")
+    parser.add_argument("command", choices=['capture', 'live'])
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    # Must happen before the command's module does `from bleak import ...`
+    import replay_transport
+    replay_transport.check_source(args.source)
+    replay_transport.install(args.source, speed=args.speed, loop=args.loop)
+    return run_command(args.command, args.args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="earworm", description="earworm sensor host tools")
+    subcommands = "\n".join(f"  {name:10s} {description}" for name, (_, description) in COMMANDS.items())
+    parser.epilog = f"commands:\n{subcommands}\n\nRun `earworm <command> -h` for the options of a command."
+    parser.formatter_class = argparse.RawDescriptionHelpFormatter
+    parser.add_argument("--root", help=f"repository root with dataset/ and scripts/ for the default paths "
+                                       f"(default: ${ROOT_ENV}, or where this file is)")
+    parser.add_argument("command", choices=COMMANDS, metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    if args.root:
+        # Read by data_paths when the command's module is imported below
+        os.environ[ROOT_ENV] = os.path.abspath(args.root)
+
+    if args.command == 'replay':
+        return replay(args.args)
+    return run_command(args.command, args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import argparse
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+BLOCK_SIZE = 32  # samples per arm_fir_f32 call on the sensor
+NUM_TAPS = 64
+
+# firCoeffs32 from src/accel/filter.c. They are symmetric (linear phase, 31.5 samples of
+# delay), so the time-reversed order CMSIS stores them in is the same array. Despite the
+# "band-pass" comment there, DC passes at 0.38; the passband is roughly 1-4 Hz at 50 Hz.
+FIR_COEFFS = np.array([
+    -0.000088, -0.000541, -0.001218, -0.001998, -0.002665, -0.002941, -0.002606, -0.001679,
+    -0.000552, 0.000044, -0.000716, -0.003331, -0.007571, -0.012313, -0.015789, -0.016249,
+    -0.012836, -0.006293, 0.000890, 0.005108, 0.002974, -0.007077, -0.023543, -0.041579,
+    -0.054003, -0.053428, -0.034876, 0.002022, 0.052123, 0.105627, 0.150571, 0.176209,
+    0.176209, 0.150571, 0.105627, 0.052123, 0.002022, -0.034876, -0.053428, -0.054003,
+    -0.041579, -0.023543, -0.007077, 0.002974, 0.005108, 0.000890, -0.006293, -0.012836,
+    -0.016249, -0.015789, -0.012313, -0.007571, -0.003331, -0.000716, 0.000044, -0.000552,
+    -0.001679, -0.002606, -0.002941, -0.002665, -0.001998, -0.001218, -0.000541, -0.000088,
+])
+
+OVERLAP_SAVE_MIN = 8192  # fir_filter uses the FFT path from this many samples on
+
+
+class StreamingFIR:
+    """
+    FIR filter over (T, channels) blocks of any length, all channels at once.
+
+    The last NUM_TAPS - 1 inputs are carried from block to block, like the
+    firmware's firStateF32, so filtering a stream block by block gives the same
+    output as filtering it in one piece: no transient at block edges, only the
+    usual one at the very start (zero initial state, as lfilter).
+    """
+
+    def __init__(self, coeffs=FIR_COEFFS, channels=3, dtype=np.float64):
+        self.coeffs = np.asarray(coeffs, dtype=dtype)
+        self.channels = channels
+        self.dtype = dtype
+        # Reversed so each output is a plain dot product with a window of inputs
+        self._kernel = np.ascontiguousarray(self.coeffs[::-1])
+        self._state = np.zeros((len(self.coeffs) - 1, channels), dtype=dtype)
+
+    def reset(self):
+        self._state[:] = 0
+
+    def process(self, block):
+        """(T, channels) filtered outputs for the next T inputs"""
+        block = np.asarray(block, dtype=self.dtype).reshape(-1, self.channels)
+        if not len(block):
+            return block.copy()
+        history = np.concatenate([self._state, block])
+        # (T, channels, taps) view of the inputs each output sees, one matmul for every axis
+        out = sliding_window_view(history, len(self.coeffs), axis=0) @ self._kernel
+        self._state = history[len(block):].copy()
+        return out
+
+    __call__ = process
+
+
+def overlap_save(samples, coeffs=FIR_COEFFS, fft_size=None):
+    """
+    The same output as StreamingFIR over a whole (T, channels) array, by FFT
+    overlap-save: every fft_size segment (each overlapping the last by
+    taps - 1 samples) is transformed at once, multiplied by the filter's
+    spectrum and the valid tail of each kept. O(T log fft_size) rather than
+    O(T * taps); for long offline files.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if not len(samples):
+        return samples.copy()  # reshape(0, -1) is ambiguous; nothing to filter anyway
+    flat = samples.ndim == 1
+    samples = samples.reshape(len(samples), -1)
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    taps = len(coeffs)
+    if fft_size is None:
+        fft_size = 1 << int(np.ceil(np.log2(16 * taps)))
+    step = fft_size - taps + 1
+    if step <= 0:
+        raise ValueError("fft_size must be at least the number of taps")
+
+    n = len(samples)
+    segments = -(-n // step)
+    padded = np.zeros((taps - 1 + segments * step, samples.shape[1]))
+    padded[taps - 1:taps - 1 + n] = samples
+    # (segments, channels, fft_size) strided view, no copy until the FFT
+    blocks = sliding_window_view(padded, fft_size, axis=0)[::step]
+
+    spectrum = np.fft.rfft(coeffs, fft_size)
+    out = np.fft.irfft(np.fft.rfft(blocks, axis=2) * spectrum, fft_size, axis=2)[:, :, taps - 1:]
+    out = out.transpose(0, 2, 1).reshape(-1, samples.shape[1])[:n]
+    return out[:, 0] if flat else out
+
+
+def fir_filter(samples, coeffs=FIR_COEFFS, method="auto"):
+    """Whole (T, channels) array filtered from a zero state: "direct", "fft" (overlap-save) or "auto" by length"""
+    samples = np.asarray(samples)
+    if method == "auto":
+        method = "fft" if len(samples) >= OVERLAP_SAVE_MIN else "direct"
+    if method == "fft":
+        return overlap_save(samples, coeffs)
+    if method == "direct":
+        channels = samples.shape[1] if samples.ndim > 1 else 1
+        out = StreamingFIR(coeffs, channels).process(samples)
+        return out[:, 0] if samples.ndim == 1 else out
+    raise ValueError(f"Unknown method: {method}")
+
+
+def verify(samples, coeffs=FIR_COEFFS, block_size=BLOCK_SIZE, seed=0):
+    """
+    Largest absolute difference from scipy's lfilter over the whole array for
+    the streaming filter fed in block_size blocks, fed in random sized blocks
+    (as BLE notifications arrive), and for overlap-save.
+    """
+    from scipy.signal import lfilter
+
+    samples = np.asarray(samples, dtype=np.float64)
+    reference = lfilter(coeffs, [1.0], samples, axis=0)
+
+    def streamed(sizes):
+        fir = StreamingFIR(coeffs, samples.shape[1])
+        edges = np.append(np.cumsum(sizes), len(samples))
+        return np.concatenate([fir.process(samples[a:b]) for a, b in zip(np.append(0, edges[:-1]), edges)])
+
+    rng = np.random.default_rng(seed)
+    random_sizes = rng.integers(1, 4 * block_size, len(samples))
+    random_sizes = random_sizes[np.cumsum(random_sizes) < len(samples)]
+    return {
+        'blocks': float(np.abs(streamed(np.full(len(samples) // block_size, block_size)) - reference).max()),
+        'random_blocks': float(np.abs(streamed(random_sizes) - reference).max()),
+        'overlap_save': float(np.abs(overlap_save(samples, coeffs) - reference).max()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the streaming and overlap-save FIR against lfilter")
+    parser.add_argument("csv_path", nargs="?", help="recording to filter (default: seeded random samples)")
+    parser.add_argument("--samples", type=int, default=100_000, help="length of the random signal")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.csv_path:
+        from recording_cache import load_recording
+        samples = np.asarray(load_recording(args.csv_path).xyz, dtype=np.float64)
+    else:
+        samples = np.random.default_rng(0).standard_normal((args.samples, 3))
+
+    for name, diff in verify(samples, block_size=args.block_size).items():
+        print(f"{name:14s} max |diff| from lfilter {diff:.3g}")
+
+    fir = StreamingFIR()
+    blocks = [samples[i:i + args.block_size] for i in range(0, len(samples), args.block_size)]
+    for method, run in [("streaming", lambda: [fir.process(b) for b in blocks]),
+                        ("direct", lambda: fir_filter(samples, method="direct")),
+                        ("overlap_save", lambda: fir_filter(samples, method="fft"))]:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{method:14s} {len(samples) / elapsed / 1e6:8.2f} M samples/s")
+
+
+if __name__ == "__main__":
+    main()
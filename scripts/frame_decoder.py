@@ -0,0 +1,89 @@
+import numpy as np
+
+# Frame layout shared by every receiver script
+FRAME_SIZE = 6
+XYZ_SIZE = 2
+X_OFFSET = 0
+Y_OFFSET = 2
+Z_OFFSET = 4
+
+# Payload formats
+# RAW16:    6-byte frames of little-endian int16 x, y, z (what the handlers assumed so far)
+# CHID14:   ADXL367_14B_CHID FIFO read mode, one big-endian 16-bit word per axis with
+#           the channel ID in bits [15:14] (0 = x, 1 = y, 2 = z, 3 = temp/adc) and
+#           two's complement 14-bit data in bits [13:0]
+FORMAT_RAW16 = "raw16"
+FORMAT_CHID14 = "chid14"
+
+CHID_MASK = 0xC000
+CHID_SHIFT = 14
+DATA_MASK = 0x3FFF
+CHANNEL_X = 0
+CHANNEL_Y = 1
+CHANNEL_Z = 2
+
+
+class FrameDecoder:
+    """
+    Turns BLE notification payloads into (N, 3) int16 arrays of x, y, z samples.
+
+    ble_send_thread sends 20-byte notifications, which do not line up with the
+    6-byte frames, so the trailing partial frame of each payload is carried over
+    and completed by the next one. Create one decoder per connection.
+    """
+
+    def __init__(self, fmt=FORMAT_RAW16):
+        if fmt not in (FORMAT_RAW16, FORMAT_CHID14):
+            raise ValueError(f"Unknown frame format: {fmt}")
+        self.fmt = fmt
+        self._carry = b""
+        self.frames_decoded = 0
+        self.words_dropped = 0
+
+    def reset(self):
+        self._carry = b""
+
+    @property
+    def pending(self):
+        """Number of bytes waiting for the rest of their frame"""
+        return len(self._carry)
+
+    def feed(self, data):
+        buf = self._carry + bytes(data) if self._carry else bytes(data)
+
+        if self.fmt == FORMAT_RAW16:
+            frames = self._decode_raw16(buf)
+        else:
+            frames = self._decode_chid14(buf)
+
+        self.frames_decoded += len(frames)
+        return frames
+
+    def _decode_raw16(self, buf):
+        num_frames = len(buf) // FRAME_SIZE
+        used = num_frames * FRAME_SIZE
+        self._carry = buf[used:]
+        return np.frombuffer(buf, dtype='<i2', count=num_frames * 3).astype(np.int16, copy=False).reshape(num_frames, 3)
+
+    def _decode_chid14(self, buf):
+        num_words = len(buf) // XYZ_SIZE
+        words = np.frombuffer(buf, dtype='>u2', count=num_words)
+        chid = words >> CHID_SHIFT
+
+        # A frame starts wherever the channel IDs read x, y, z in order. Anything else
+        # (temperature/ADC words or a desynchronised stream) is skipped.
+        starts = np.flatnonzero((chid[:-2] == CHANNEL_X) &
+                                (chid[1:-1] == CHANNEL_Y) &
+                                (chid[2:] == CHANNEL_Z))
+        idx = starts[:, np.newaxis] + np.arange(3)
+
+        # Sign-extend the 14-bit field
+        values = (words[idx] & DATA_MASK).astype(np.int16)
+        values = (values << 2) >> 2
+
+        # Keep up to two trailing words that may begin the next frame
+        end = int(starts[-1]) + 3 if len(starts) else 0
+        keep_from = max(end, num_words - 2)
+        self.words_dropped += keep_from - 3 * len(starts)
+        self._carry = buf[keep_from * XYZ_SIZE:]
+        return values
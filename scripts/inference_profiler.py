@@ -0,0 +1,173 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+from data_paths import model_path, require
+
+BATCH_SIZES = [1, 8, 32, 128, 512]
+WINDOW_SIZE = 128
+MODEL_PATH = model_path("motion_model.pth")
+WARMUP = 20
+ITERATIONS = 200
+
+# Run in a fresh interpreter so the import cost is not hidden by modules already loaded
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter_ns()
+import torch
+from motionDetection import MotionDetection
+imported = time.perf_counter_ns()
+model = MotionDetection.load({model_path!r}, {window_size})
+loaded = time.perf_counter_ns()
+with torch.no_grad():
+    model(torch.zeros(1, 3, {window_size}))
+first = time.perf_counter_ns()
+json.dump({{'import_ns': imported - start, 'load_ns': loaded - imported, 'first_inference_ns': first - loaded}}, sys.stdout)
+"""
+
+
+def summarize(timings_ns, batch_size=1):
+    """p50/p95/p99 and mean in milliseconds, plus windows/s at the median"""
+    timings_ms = np.asarray(timings_ns, dtype=np.float64) / 1e6
+    p50, p95, p99 = np.percentile(timings_ms, [50, 95, 99])
+    return {
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'mean_ms': float(timings_ms.mean()),
+        'max_ms': float(timings_ms.max()),
+        'throughput': batch_size / (p50 / 1e3),
+        'iterations': len(timings_ms),
+    }
+
+
+def time_calls_ns(fn, warmup=WARMUP, iterations=ITERATIONS):
+    for _ in range(warmup):
+        fn()
+    timings = np.empty(iterations, dtype=np.int64)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        timings[i] = time.perf_counter_ns() - start
+    return timings
+
+
+def make_batch(batch_size, window_size=WINDOW_SIZE, sample=None, seed=0):
+    """
+    Batch of windows. With `sample` (windows, 3, window_size) real windows are
+    tiled to the batch size, otherwise seeded random data is used.
+    """
+    if sample is not None:
+        sample = torch.as_tensor(sample, dtype=torch.float32)
+        repeats = -(-batch_size // len(sample))
+        return sample.repeat(repeats, 1, 1)[:batch_size].contiguous()
+    return torch.randn(batch_size, 3, window_size, generator=torch.Generator().manual_seed(seed))
+
+
+def profile_latency(model, batch_sizes=BATCH_SIZES, thread_counts=(None,), window_size=WINDOW_SIZE,
+                    sample=None, warmup=WARMUP, iterations=ITERATIONS):
+    """
+    Latency percentiles for every (thread count, batch size) pair. None as a
+    thread count means torch's current setting. The model should be on the CPU
+    and in eval mode.
+    """
+    default_threads = torch.get_num_threads()
+    rows = []
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads or default_threads)
+            for batch_size in batch_sizes:
+                x = make_batch(batch_size, window_size, sample)
+                with torch.no_grad():
+                    timings = time_calls_ns(lambda: model(x), warmup, iterations)
+                rows.append(dict(threads=torch.get_num_threads(), batch_size=batch_size,
+                                 **summarize(timings, batch_size)))
+    finally:
+        torch.set_num_threads(default_threads)
+    return rows
+
+
+def layer_breakdown(model, batch_size=1, window_size=WINDOW_SIZE, sample=None,
+                    warmup=WARMUP, iterations=ITERATIONS):
+    """
+    Median time spent in each layer of model.model (the nn.Sequential), measured
+    by running the layers one at a time on that layer's real input.
+    """
+    layers = list(model.model)
+    x = make_batch(batch_size, window_size, sample)
+
+    rows = []
+    with torch.no_grad():
+        for index, layer in enumerate(layers):
+            layer_input = x
+            timings = time_calls_ns(lambda: layer(layer_input), warmup, iterations)
+            x = layer(layer_input)
+            rows.append(dict(index=index, layer=repr(layer), output_shape=list(x.shape),
+                             **summarize(timings, batch_size)))
+
+    total = sum(row['p50_ms'] for row in rows)
+    for row in rows:
+        row['share'] = row['p50_ms'] / total if total else 0.0
+    return rows
+
+
+def cold_start(model_path=MODEL_PATH, window_size=WINDOW_SIZE, repeats=3):
+    """Import, load_state_dict and first inference times of a fresh process, best of `repeats`"""
+    script = COLD_START_SCRIPT.format(model_path=model_path, window_size=window_size)
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        runs.append(json.loads(output.stdout))
+    return {key.replace('_ns', '_ms'): min(run[key] for run in runs) / 1e6 for key in runs[0]}
+
+
+def print_report(latency=None, layers=None, startup=None):
+    if startup:
+        print("Cold start: " + ", ".join(f"{key} {value:.1f}" for key, value in startup.items()))
+    if latency:
+        print(f"{'threads':>7} {'batch':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'windows/s':>11}")
+        for row in latency:
+            print(f"{row['threads']:>7} {row['batch_size']:>6} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} "
+                  f"{row['p99_ms']:>9.3f} {row['throughput']:>11.0f}")
+    if layers:
+        print(f"{'layer':<44} {'output':>14} {'p50 ms':>9} {'share':>7}")
+        for row in layers:
+            print(f"{row['layer'][:44]:<44} {str(tuple(row['output_shape'])):>14} "
+                  f"{row['p50_ms']:>9.4f} {row['share']:>7.1%}")
+
+
+def load_model(model_path=MODEL_PATH, window_size=WINDOW_SIZE):
+    from motionDetection import MotionDetection
+
+    return MotionDetection.load(model_path, window_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile MotionDetection inference latency on the CPU")
+    parser.add_argument("--model", default=MODEL_PATH, help="trained model state dict")
+    parser.add_argument("--window", type=int, default=WINDOW_SIZE, help="samples per window")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--threads", type=int, nargs="+", default=[None], help="torch.set_num_threads values")
+    parser.add_argument("--warmup", type=int, default=WARMUP)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--no-cold-start", action="store_true", help="skip the fresh-process startup timing")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+    require(args.model, "model")
+
+    startup = None if args.no_cold_start else cold_start(args.model, args.window)
+    model = load_model(args.model, args.window)
+    latency = profile_latency(model, args.batch_size, args.threads, args.window,
+                              warmup=args.warmup, iterations=args.iterations)
+    layers = layer_breakdown(model, 1, args.window, warmup=args.warmup, iterations=args.iterations)
+    print_report(latency, layers, startup)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cold_start': startup, 'latency': latency, 'layers': layers}, f, indent=2)
+        print(f"Saved to \"{args.output}\"")
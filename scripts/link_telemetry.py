@@ -0,0 +1,202 @@
+import asyncio
+import bisect
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+NOMINAL_FS = 50.0     # sensor output data rate the firmware is configured for
+WINDOW_SEC = 30.0     # rates are over the last this many seconds (several FIFO bursts)
+BUCKET_SEC = 1.0      # resolution of the rolling window
+BURST_SEC = 0.015     # notifications closer together than this belong to one burst
+GAP_SEC = 0.25        # a pause longer than this...
+GAP_FACTOR = 4.0      # ...and this many times the typical pause between bursts counts as a gap
+JITTER_SMOOTHING = 1 / 16  # gain of the running interval mean and jitter (as in RFC 3550)
+ATT_HEADER = 3        # bytes of the negotiated MTU taken by the ATT header
+
+# Upper edges of the inter-arrival histogram bins in ms; the last bin is open ended
+INTERVAL_BINS_MS = (5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+
+class LinkTelemetry:
+    """
+    Rolling statistics of one BLE notification stream in constant memory.
+
+    record() is called once per notification and only touches a few counters:
+    a ring of per-second buckets (notifications, bytes, samples) for the windowed
+    rates, a fixed-bin histogram of inter-arrival times, a running mean and
+    jitter of the interval between bursts, and gap counters. snapshot() turns
+    them into a dict and summary() into one log line.
+
+    The firmware sends a whole FIFO watermark (ADXL367_SAMPLE_SET samples) as
+    back-to-back notifications, so intervals shorter than `burst_sec` are
+    inside a burst: they go into the histogram but not into the burst cadence
+    that gaps are judged against. Lost data shows up as a growing sample
+    deficit against the nominal rate.
+
+    record() belongs in the notification callback, ahead of any queue that may
+    drop, so the counts are what the link delivered. Set `host_dropped` to a
+    callable returning how many items the host threw away afterwards (e.g. the
+    head Stage's dropped count) to report those separately from link losses.
+    """
+
+    def __init__(self, fs=NOMINAL_FS, mtu=None, window=WINDOW_SEC, bucket=BUCKET_SEC,
+                 burst_sec=BURST_SEC, gap_sec=GAP_SEC, bins_ms=INTERVAL_BINS_MS):
+        self.fs = fs
+        self.mtu = mtu
+        self.bucket = bucket
+        self.burst_sec = burst_sec
+        self.gap_sec = gap_sec
+        self.bins = [edge / 1000.0 for edge in bins_ms]
+        self.host_dropped = None
+        num_buckets = max(1, math.ceil(window / bucket))
+        self._bucket_ids = [-1] * num_buckets
+        self._buckets = [[0, 0, 0] for _ in range(num_buckets)]
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self._buckets)):
+            self._bucket_ids[i] = -1
+            self._buckets[i] = [0, 0, 0]
+        self.histogram = [0] * (len(self.bins) + 1)
+        self.notifications = 0
+        self.bytes = 0
+        self.samples = 0
+        self.first_arrival = None
+        self.first_samples = 0
+        self.last_arrival = None
+        self.mean_interval = None
+        self.jitter = 0.0
+        self.gaps = 0
+        self.gap_time = 0.0
+        self.longest_gap = 0.0
+        self.last_gap_at = None
+
+    def record(self, num_bytes, num_samples, arrival=None):
+        if arrival is None:
+            arrival = time.time()
+
+        bucket_id = int(arrival // self.bucket)
+        slot = bucket_id % len(self._buckets)
+        if self._bucket_ids[slot] != bucket_id:
+            self._bucket_ids[slot] = bucket_id
+            self._buckets[slot] = [0, 0, 0]
+        counts = self._buckets[slot]
+        counts[0] += 1
+        counts[1] += num_bytes
+        counts[2] += num_samples
+
+        if self.last_arrival is None:
+            # The first notification's samples were taken before it arrived
+            self.first_arrival = arrival
+            self.first_samples = num_samples
+        else:
+            interval = arrival - self.last_arrival
+            self.histogram[bisect.bisect_right(self.bins, interval)] += 1
+            if interval >= self.burst_sec:
+                self._pause(interval, arrival)
+        self.last_arrival = arrival
+        self.notifications += 1
+        self.bytes += num_bytes
+        self.samples += num_samples
+
+    def _pause(self, interval, arrival):
+        """Interval between two bursts: updates the cadence, or counts a gap"""
+        if self.mean_interval is None:
+            self.mean_interval = interval
+        elif interval > max(self.gap_sec, GAP_FACTOR * self.mean_interval):
+            # Judged against the cadence before it and kept out of the averages
+            self.gaps += 1
+            self.gap_time += interval
+            self.longest_gap = max(self.longest_gap, interval)
+            self.last_gap_at = arrival
+        else:
+            self.jitter += JITTER_SMOOTHING * (abs(interval - self.mean_interval) - self.jitter)
+            self.mean_interval += JITTER_SMOOTHING * (interval - self.mean_interval)
+
+    def _window(self, now):
+        """(notifications, bytes, samples, seconds) over the rolling window ending at now"""
+        newest = int(now // self.bucket)
+        oldest = newest - len(self._buckets) + 1
+        totals = [0, 0, 0]
+        for bucket_id, counts in zip(self._bucket_ids, self._buckets):
+            if oldest <= bucket_id <= newest:
+                for i in range(3):
+                    totals[i] += counts[i]
+        start = max(oldest * self.bucket, self.first_arrival)
+        return (*totals, max(now - start, 1e-9))
+
+    def interval_percentile(self, q):
+        """Upper bin edge (seconds) below which a fraction q of the intervals fall; inf if in the open bin"""
+        count = sum(self.histogram)
+        if count == 0:
+            return None
+        running = 0
+        for edge, n in zip(self.bins + [math.inf], self.histogram):
+            running += n
+            if running >= q * count:
+                return edge
+        return math.inf
+
+    def snapshot(self, now=None):
+        if self.first_arrival is None:
+            return {'notifications': 0, 'bytes': 0, 'samples': 0}
+        if now is None:
+            now = time.time()
+        notifications, num_bytes, samples, seconds = self._window(now)
+        sample_rate = samples / seconds
+        elapsed = self.last_arrival - self.first_arrival
+        snapshot = {
+            'notifications': self.notifications,
+            'bytes': self.bytes,
+            'samples': self.samples,
+            'notifications_per_sec': notifications / seconds,
+            'samples_per_sec': sample_rate,
+            'bytes_per_sec': num_bytes / seconds,
+            'bytes_per_notification': num_bytes / notifications if notifications else 0.0,
+            'nominal_fs': self.fs,
+            'rate_ratio': sample_rate / self.fs,
+            # Samples the nominal rate would have delivered since the first notification, minus those received
+            'sample_deficit': max(0, round(elapsed * self.fs) - (self.samples - self.first_samples)),
+            'mean_interval': self.mean_interval,
+            'jitter': self.jitter,
+            'interval_p50': self.interval_percentile(0.5),
+            'interval_p95': self.interval_percentile(0.95),
+            'interval_histogram': dict(zip([*(f"<{edge * 1000:g}ms" for edge in self.bins),
+                                            f">={self.bins[-1] * 1000:g}ms"], self.histogram)),
+            'gaps': self.gaps,
+            'gap_time': self.gap_time,
+            'longest_gap': self.longest_gap,
+            'last_gap_at': self.last_gap_at,
+            'mtu': self.mtu,
+            'host_dropped': self.host_dropped() if self.host_dropped is not None else None,
+        }
+        if self.mtu:
+            payload = self.mtu - ATT_HEADER
+            snapshot['mtu_payload'] = payload
+            snapshot['mtu_utilization'] = snapshot['bytes_per_notification'] / payload
+        return snapshot
+
+    def summary(self, now=None):
+        s = self.snapshot(now)
+        if not s['notifications']:
+            return "Link: no notifications"
+        line = (f"Link: {s['notifications_per_sec']:.1f} notif/s, {s['samples_per_sec']:.1f} samples/s "
+                f"({100 * s['rate_ratio']:.1f}% of {s['nominal_fs']:g} Hz), {s['bytes_per_sec']:.0f} B/s")
+        if 'mtu_utilization' in s:
+            line += f", {s['bytes_per_notification']:.1f} B/notif ({100 * s['mtu_utilization']:.0f}% of MTU {s['mtu']})"
+        if s['mean_interval'] is not None:
+            p95 = s['interval_p95']
+            line += f", burst every {1000 * s['mean_interval']:.1f} +/- {1000 * s['jitter']:.1f} ms"
+            line += f" (inter-arrival p95 < {1000 * p95:g} ms)" if math.isfinite(p95) else " (inter-arrival p95 over the last bin)"
+        line += f", gaps {s['gaps']} (longest {s['longest_gap']:.2f} s), deficit {s['sample_deficit']} samples"
+        if s['host_dropped'] is not None:
+            line += f", dropped on the host {s['host_dropped']} blocks"
+        return line
+
+    async def report(self, interval=5.0, log=logger.info):
+        """Log summary() every `interval` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            log(self.summary())
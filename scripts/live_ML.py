@@ -1,71 +1,180 @@
+import argparse
 import asyncio
 import logging
 import sys
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from bleak import BleakClient, BleakScanner
 from matplotlib import pyplot as plt
-from matplotlib.animation import FuncAnimation
 import time
-import serial
-import torch
-from motionDetection import MotionDetection
+from frame_decoder import FrameDecoder
+from ring_buffer import SampleRingBuffer
+from pulse_store import PulseStore
+from serial_reader import read_into, PULSE_RAW
+from pipeline import Pipeline, Stage, DROP_OLDEST
+from live_view import LiveView, ring_source, pulse_source, clock_source
+from stream_align import StreamAligner
+from link_telemetry import LinkTelemetry
+from fir_filter import StreamingFIR
+from data_paths import model_path, require
 
 # BLE config
 EARWORM_MAC = "EF:90:1:F7:43:EA"
 EARWORM_NAME = "earworm_ble"
 UART_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
-FRAME_SIZE = 6
-XYZ_SIZE = 2
-X_OFFSET = 0
-Y_OFFSET = 2
-Z_OFFSET = 4
 GRAVITY = 9.8
+CAPTURE_CAPACITY = 4096  # samples kept for plotting and inference
+PULSE_RETENTION_SEC = 60  # pulse readings older than this are dropped
+BUFFER_SIZE_MODEL = 128  # must match training
+MODEL_PATH = model_path("motion_model.pth")
 
 # Shared data
-captured_data = {'raw_x': [], 'raw_y': [], 'raw_z': []}
-pulse_data = {'timestamps': [], 'values': []}
+captured_data = SampleRingBuffer(CAPTURE_CAPACITY)
+pulse_data = PulseStore(max_age=PULSE_RETENTION_SEC)
+prediction = {'label': "N/A"}
 
 # Convert raw int values to g
 def convert_values(raw_values, resolution=14):
     min_val = 2 ** (resolution - 1)
     max_val = 2 ** resolution - 1
     scale_factor = (2 * GRAVITY) / (max_val - min_val)
-    return [val * scale_factor for val in raw_values]
+    return np.asarray(raw_values) * scale_factor
 
-# BLE frame handler
-def notification_handler(sender, data, captured_data):
-    try:
-        for i in range(0, len(data), FRAME_SIZE):
-            frame = data[i:i + FRAME_SIZE]
-            raw_x = int.from_bytes(frame[X_OFFSET:X_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_y = int.from_bytes(frame[Y_OFFSET:Y_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            raw_z = int.from_bytes(frame[Z_OFFSET:Z_OFFSET + XYZ_SIZE], byteorder='little', signed=True)
-            captured_data['raw_x'].append(raw_x)
-            captured_data['raw_y'].append(raw_y)
-            captured_data['raw_z'].append(raw_z)
-    except Exception as e:
-        logging.error(f"Error in notification handler: {e}")
+def load_model(model_path=MODEL_PATH):
+    """
+    Eager MotionDetection for a .pth state dict, or the FeatureClassifier for a
+    motion_features .npz. An exported artifact path, or "auto" for the fastest
+    export on this host, gives a model_export.Artifact instead.
 
-# Live plotting and model inference
-def plot_accel_live(captured_data, pulse_data, fs=50.0, buffer_sec=3):
-    buffer_size = int(fs * buffer_sec)
-    BUFFER_SIZE_MODEL = 128  # must match training
-    last_label = "N/A"
+    torch is only imported for the torch models, so serving the .npz
+    classifier needs NumPy alone.
+    """
+    if model_path.endswith(".npz"):
+        from motion_features import FeatureClassifier
+        return FeatureClassifier.load(model_path, BUFFER_SIZE_MODEL)
+
+    if model_path.endswith(".pth"):
+        from motionDetection import MotionDetection
+        return MotionDetection.load(model_path, BUFFER_SIZE_MODEL)
+
+    from model_export import resolve_model, EAGER
+    artifact = resolve_model(model_path, BUFFER_SIZE_MODEL)
+    return artifact.model if artifact.kind == EAGER else artifact
+
+def _is_motion_detection(model):
+    """isinstance(model, MotionDetection), without importing torch to find out"""
+    module = sys.modules.get("motionDetection")
+    return module is not None and isinstance(model, module.MotionDetection)
+
+class WindowedInference:
+    """Same update() interface as StreamingMotionDetection for any callable model"""
+
+    def __init__(self, model, window_size=BUFFER_SIZE_MODEL):
+        self.model = model
+        self.window_size = window_size
+        self.samples = SampleRingBuffer(window_size, dtype=np.float32)
+
+    def reset(self):
+        self.samples.clear()
+
+    def update(self, samples):
+        self.samples.extend(np.asarray(samples, dtype=np.float32).reshape(-1, 3))
+        if len(self.samples) < self.window_size:
+            return None
+        return self.model(self.samples.latest().T[np.newaxis])
+
+# BLE notification (decoded in the callback) -> filter -> inference -> prediction sink
+def build_pipeline(captured_data, prediction, model, executor=None, aligner=None, telemetry=None, fir=None):
+    """
+    The pipeline and the handler to pass to start_notify.
+
+    FrameDecoder carries partial frames from one notification to the next, so it
+    has to see every notification: the handler decodes as they arrive (cheap) and
+    stores the samples for the plot, and only decoded frames are queued. A drop at
+    the head then costs samples, never frame alignment. The filter stage notices
+    the gap from the sample counts and resets the FIR and the inference window,
+    so neither runs across the missing samples.
+    """
+    decoder = FrameDecoder()
+    if _is_motion_detection(model):
+        from motion_streaming import StreamingMotionDetection
+        # Streaming inference only processes the samples that arrived since the last notification
+        streamer = StreamingMotionDetection(model, window_size=BUFFER_SIZE_MODEL)
+    else:
+        # Exported artifacts are opaque graphs, and the feature classifier needs whole windows,
+        # so they run on the whole newest window
+        streamer = WindowedInference(model, window_size=BUFFER_SIZE_MODEL)
+
+    def on_notification(sender, data):
+        arrival = time.time()
+        frames = decoder.feed(data)
+        captured_data.extend(frames)  # plot reads from here
+        if aligner is not None:
+            aligner.mark(captured_data.total, arrival)
+        if telemetry is not None:
+            telemetry.record(len(data), len(frames), arrival)
+        if len(frames):
+            pipeline.submit((captured_data.total, frames))
+
+    last_end = None  # sample count at the end of the last block the filter stage saw
+
+    def to_g(item):
+        nonlocal last_end
+        end, frames = item
+        gap = last_end is not None and end - len(frames) != last_end
+        last_end = end
+        values = convert_values(frames)
+        if fir is None:
+            return gap, values
+        # The FIR carries its state across notifications, so filtering adds no edge artifacts,
+        # except across dropped samples: start over from a zero state there, as in training
+        if gap:
+            fir.reset()
+        return gap, fir.process(values)
 
-    # Load model
-    model = MotionDetection(input_channels=3, seq_len=BUFFER_SIZE_MODEL)
-    model.load_state_dict(torch.load("motion_model.pth", map_location=torch.device("cpu")))
-    model.eval()
+    def infer(item):
+        gap, vals = item
+        if gap:
+            streamer.reset()
+        output = streamer.update(vals)
+        if output is None:
+            return None
+        # NumPy logits from the feature classifier, CPU tensors from the torch models
+        return int(np.argmax(np.asarray(output), axis=1)[0])
+
+    def publish(label):
+        prediction['label'] = "GOOD" if label == 1 else "BAD"
+
+    # Only the head drops (oldest blocks first); later stages apply backpressure
+    pipeline = Pipeline([
+        Stage("filter", to_g, maxsize=256, policy=DROP_OLDEST),
+        Stage("inference", infer, maxsize=64, in_executor=True),
+    ], sinks=[publish], executor=executor)
+    if telemetry is not None:
+        telemetry.host_dropped = lambda: pipeline.stages[0].dropped
+    return pipeline, on_notification
+
+# Live plotting
+def make_live_plot(captured_data, pulse_data, prediction, fs=50.0, buffer_sec=3, aligner=None):
+    """
+    Figure and its LiveView (separate from plot_accel_live so it can be benchmarked).
+    With an aligner the accelerometer is placed on the host clock next to the pulse.
+    """
+    buffer_size = int(fs * buffer_sec)
 
     # Set up plot
     fig, (ax_x, ax_y, ax_z, ax_pulse) = plt.subplots(4, 1, figsize=(10, 10), sharex=True)
-    fig.suptitle('Real-time Acceleration Data')
+    view = LiveView(fig, buffer_sec)
 
-    line_x, = ax_x.plot([], [], color='r', label='X-axis')
-    line_y, = ax_y.plot([], [], color='g', label='Y-axis')
-    line_z, = ax_z.plot([], [], color='b', label='Z-axis')
-    line_pulse, = ax_pulse.plot([], [], color='purple', label='PulseSensor')
+    if aligner is not None:
+        accel_source = clock_source(aligner, buffer_sec)
+    else:
+        accel_source = ring_source(captured_data, buffer_size, fs, convert_values)
+    view.add_lines([ax_x, ax_y, ax_z], accel_source,
+                   color=['r', 'g', 'b'], label=['X-axis', 'Y-axis', 'Z-axis'])
+    view.add_lines([ax_pulse], pulse_source(pulse_data, buffer_sec), autoscale=True,
+                   color='purple', label='PulseSensor')
 
     for ax, label in zip([ax_x, ax_y, ax_z], ['X', 'Y', 'Z']):
         ax.set_ylabel(f'{label} (g)')
@@ -78,75 +187,25 @@ def plot_accel_live(captured_data, pulse_data, fs=50.0, buffer_sec=3):
     ax_pulse.grid(True)
     ax_pulse.legend(loc='upper right')
     ax_z.set_xlabel('Time (s)')
-    plt.tight_layout()
-
-    def update(frame):
-        nonlocal last_label
-        raw_x = captured_data['raw_x'][-buffer_size:]
-        raw_y = captured_data['raw_y'][-buffer_size:]
-        raw_z = captured_data['raw_z'][-buffer_size:]
-        n = len(raw_x)
-        if n == 0:
-            return line_x, line_y, line_z, line_pulse
-
-        x_vals = convert_values(raw_x)
-        y_vals = convert_values(raw_y)
-        z_vals = convert_values(raw_z)
-
-        # Run model inference on latest BUFFER_SIZE_MODEL
-        if len(x_vals) >= BUFFER_SIZE_MODEL:
-            chunk = np.array([x_vals[-BUFFER_SIZE_MODEL:],
-                              y_vals[-BUFFER_SIZE_MODEL:],
-                              z_vals[-BUFFER_SIZE_MODEL:]])
-            chunk_tensor = torch.tensor(chunk[np.newaxis, ...], dtype=torch.float32)
-            with torch.no_grad():
-                output = model(chunk_tensor)
-                prediction = torch.argmax(output, dim=1).item()
-                last_label = "GOOD" if prediction == 1 else "BAD"
-
-        now = time.time()
-        t_vals = np.linspace(now - n / fs, now, n)
-        line_x.set_data(t_vals, x_vals)
-        line_y.set_data(t_vals, y_vals)
-        line_z.set_data(t_vals, z_vals)
-        ax_x.set_xlim(t_vals[0], t_vals[-1])
-        ax_y.set_xlim(t_vals[0], t_vals[-1])
-        ax_z.set_xlim(t_vals[0], t_vals[-1])
-
-        # PulseSensor update
-        pulse_t = pulse_data['timestamps']
-        pulse_v = pulse_data['values']
-        recent_idx = [i for i, t in enumerate(pulse_t) if t >= now - buffer_sec]
-        if recent_idx:
-            pulse_t_vals = [pulse_t[i] for i in recent_idx]
-            pulse_y_vals = [pulse_v[i] for i in recent_idx]
-            line_pulse.set_data(pulse_t_vals, pulse_y_vals)
-            ax_pulse.set_xlim(pulse_t_vals[0], pulse_t_vals[-1])
-            ax_pulse.set_ylim(min(pulse_y_vals) - 10, max(pulse_y_vals) + 10)
-
-        # Display model prediction on top
-        fig.suptitle(f"Live Prediction: {last_label}",
-                     fontsize=16,
-                     color='green' if last_label == "GOOD" else 'red')
-        return line_x, line_y, line_z, line_pulse
-
-    ani = FuncAnimation(fig, update, interval=500, cache_frame_data=False)
+
+    # Model prediction on top
+    def label():
+        last_label = prediction['label']
+        return f"Live Prediction: {last_label}", 'green' if last_label == "GOOD" else 'red'
+    view.add_text(label, fontsize=16, ha='center', va='top')
+
+    plt.tight_layout(rect=(0, 0, 1, 0.96))
+    return fig, view
+
+def plot_accel_live(captured_data, pulse_data, prediction, fs=50.0, buffer_sec=3, aligner=None):
+    fig, view = make_live_plot(captured_data, pulse_data, prediction, fs=fs, buffer_sec=buffer_sec,
+                               aligner=aligner)
+    view.start()
     plt.show()
 
-def read_serial_pulse(port='COM3', baudrate=9600, pulse_data=None):
-    try:
-        ser = serial.Serial(port, baudrate, timeout=1)
-        time.sleep(2)
-        print(f"Serial port {port} opened.")
-        while True:
-            line = ser.readline().decode('utf-8').strip()
-            if line.isdigit():
-                value = int(line)
-                timestamp = time.time()
-                pulse_data['timestamps'].append(timestamp)
-                pulse_data['values'].append(value)
-    except Exception as e:
-        print(f"Error reading from serial: {e}")
+async def read_serial_pulse(port='COM3', baudrate=9600, pulse_data=None):
+    # Runs next to the BLE client on its event loop; the whole serial buffer is parsed at once
+    return await read_into(pulse_data, port, baudrate, PULSE_RAW)
 
 async def discover_device():
     logging.info("Scanning for BLE devices...")
@@ -166,8 +225,18 @@ async def connect_device(device):
         logging.error(f"Connection failed: {e}")
         return None
 
-def run_event_loop(captured_data):
+def run_event_loop(captured_data, prediction, executor=None, model_path=MODEL_PATH,
+                   pulse_data=None, pulse_port='COM3', aligner=None, fir=None):
     async def _run():
+        telemetry = LinkTelemetry(fs=aligner.fs if aligner is not None else 50.0)
+        pipeline, on_notification = build_pipeline(captured_data, prediction, load_model(model_path), executor,
+                                                   aligner, telemetry, fir)
+        await pipeline.start()
+        reporter = asyncio.create_task(pipeline.report())
+        link_reporter = asyncio.create_task(telemetry.report())
+        if pulse_data is not None:
+            pulse_task = asyncio.create_task(read_serial_pulse(pulse_port, 9600, pulse_data))
+
         device = await discover_device()
         if device is None:
             print("BLE device not found.")
@@ -176,7 +245,9 @@ def run_event_loop(captured_data):
         if client is None:
             print("BLE client failed.")
             return
-        await client.start_notify(UART_UUID, lambda s, d: notification_handler(s, d, captured_data))
+        telemetry.mtu = client.mtu_size
+        # The callback stamps, decodes and enqueues; filtering and inference happen in the pipeline stages
+        await client.start_notify(UART_UUID, on_notification)
         try:
             while True:
                 await asyncio.sleep(0.1)
@@ -185,20 +256,47 @@ def run_event_loop(captured_data):
         finally:
             await client.stop_notify(UART_UUID)
             await client.disconnect()
+            reporter.cancel()
+            link_reporter.cancel()
+            if pulse_data is not None:
+                pulse_task.cancel()
+            await pipeline.stop(drain=False)
 
     asyncio.run(_run())
 
-def total(fs=50.0, buffer_sec=3):
-    capture_thread = threading.Thread(target=run_event_loop, args=(captured_data,), daemon=True)
-    pulse_thread = threading.Thread(target=read_serial_pulse, args=('COM3', 9600, pulse_data), daemon=True)
+def total(fs=50.0, buffer_sec=3, executor_workers=1, model_path=MODEL_PATH, pulse_port='COM3', fir=False):
+    executor = ThreadPoolExecutor(max_workers=executor_workers)
+    # Puts the accelerometer on the host clock the pulse readings are stamped with
+    aligner = StreamAligner(captured_data, pulse_data, fs=fs, convert=convert_values)
+    # BLE and the pulse sensor share one event loop on this thread; the plot keeps the main thread
+    capture_thread = threading.Thread(target=run_event_loop,
+                                      args=(captured_data, prediction, executor, model_path, pulse_data, pulse_port,
+                                            aligner, StreamingFIR() if fir else None),
+                                      daemon=True)
 
     capture_thread.start()
-    pulse_thread.start()
-    plot_accel_live(captured_data, pulse_data, fs=fs, buffer_sec=buffer_sec)
+    plot_accel_live(captured_data, pulse_data, prediction, fs=fs, buffer_sec=buffer_sec, aligner=aligner)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live accelerometer plot with motion classification")
+    parser.add_argument("--model", default=MODEL_PATH,
+                        help="state dict, exported artifact, motion_features .npz classifier or \"auto\" for the "
+                             "fastest exported one")
+    parser.add_argument("--fs", type=float, default=50.0, help="sensor sample rate")
+    parser.add_argument("--buffer-sec", type=float, default=3, help="seconds of data on screen")
+    parser.add_argument("--workers", type=int, default=1, help="inference executor threads")
+    parser.add_argument("--fir", action="store_true",
+                        help="run samples through the sensor's FIR filter before inference (for models trained with --fir)")
+    parser.add_argument("--pulse-port", default='COM3', help="pulse sensor serial port (\"fake\" for a simulated one)")
+    args = parser.parse_args(argv)
+    if args.model != "auto":
+        require(args.model, "model")
 
-if __name__ == "__main__":
     try:
-        total(50, 3)
+        total(args.fs, args.buffer_sec, args.workers, args.model, args.pulse_port, args.fir)
     except KeyboardInterrupt:
         print("Interrupted by user.")
         sys.exit(0)
+
+if __name__ == "__main__":
+    main()
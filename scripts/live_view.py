@@ -0,0 +1,238 @@
+import time
+
+import numpy as np
+
+MIN_INTERVAL = 0.03   # fastest refresh, seconds
+MAX_INTERVAL = 1.0    # slowest refresh, seconds
+RENDER_BUDGET = 0.2   # fraction of wall time the plot may spend rendering
+COST_SMOOTHING = 0.2  # weight of the newest frame in the render cost average
+
+
+def minmax_decimate(x, y, width, x_out=None, y_out=None):
+    """
+    Reduce a trace to at most 2 * width points: the min and max of each of
+    `width` buckets, both placed at the bucket's first x. Every peak survives, so
+    at one bucket per pixel the line looks the same as the full trace.
+
+    x_out and y_out are optional preallocated buffers of at least 2 * width
+    points; returns (x, y) views of them (or of new arrays), or x, y unchanged
+    when there is nothing to reduce.
+    """
+    n = len(y)
+    if n <= 2 * width:
+        if x_out is None:
+            return x, y
+        x_out[:n] = x
+        y_out[:n] = y
+        return x_out[:n], y_out[:n]
+
+    if x_out is None:
+        x_out = np.empty(2 * width)
+        y_out = np.empty(2 * width)
+    starts = (np.arange(width) * n) // width
+    np.minimum.reduceat(y, starts, out=y_out[0:2 * width:2])
+    np.maximum.reduceat(y, starts, out=y_out[1:2 * width:2])
+    x_out[0:2 * width:2] = x[starts]
+    x_out[1:2 * width:2] = x[starts]
+    return x_out[:2 * width], y_out[:2 * width]
+
+
+class Trace:
+    """Lines fed by one source: source() returns x (N,) and y (N,) or (N, lines)"""
+
+    def __init__(self, source, lines, autoscale=False):
+        self.source = source
+        self.lines = lines
+        self.autoscale = autoscale
+        self.width = 0
+        self.x_buf = None
+        self.y_buf = None
+
+    def allocate(self):
+        """One (x, y) buffer pair per line, sized to the axes' width in pixels"""
+        self.width = max(1, int(max(line.axes.bbox.width for line in self.lines)))
+        self.x_buf = np.empty((len(self.lines), 2 * self.width))
+        self.y_buf = np.empty((len(self.lines), 2 * self.width))
+
+    def refresh(self):
+        """Push the newest data into the lines. True if an axis needs its y limits changed."""
+        x, y = self.source()
+        y = np.asarray(y).reshape(len(x), -1)
+        rescale = False
+        for i, line in enumerate(self.lines):
+            xd, yd = minmax_decimate(x, y[:, i], self.width, self.x_buf[i], self.y_buf[i])
+            line.set_data(xd, yd)
+            if self.autoscale and len(yd):
+                rescale |= self._fit(line.axes, yd.min(), yd.max())
+        return rescale
+
+    @staticmethod
+    def _fit(ax, low, high):
+        # Only grow, or shrink once the data uses less than half the range, so
+        # y limits (and so full redraws) change rarely
+        bottom, top = ax.get_ylim()
+        span = max(high - low, 1e-9)
+        if low >= bottom and high <= top and span > (top - bottom) / 2:
+            return False
+        ax.set_ylim(low - 0.1 * span, high + 0.1 * span)
+        return True
+
+
+class LiveView:
+    """
+    Live plot that redraws only its lines, driven by a canvas timer.
+
+    The x axes are fixed (seconds relative to now, [-span, 0]) so the background
+    can be cached once and every frame is a blit: restore the background, draw the
+    lines and labels, copy to the screen. Each line is min/max decimated to the
+    width of its axes in pixels into preallocated buffers.
+
+    The timer interval follows the measured render cost: rendering may use at most
+    `budget` of the wall time, so a slow display lowers the frame rate instead of
+    starving the BLE thread.
+    """
+
+    def __init__(self, fig, span, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 budget=RENDER_BUDGET):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.span = span
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        self.traces = []
+        self.texts = []
+        self.interval = min_interval
+        self.render_cost = None
+        self.frames = 0
+        self.full_draws = 0
+        self._background = None
+        self._timer = None
+        self._ids = [self.canvas.mpl_connect('draw_event', self._on_draw),
+                     self.canvas.mpl_connect('resize_event', self._on_resize)]
+
+    def _artists(self):
+        return [line for trace in self.traces for line in trace.lines] + [text for text, _ in self.texts]
+
+    def add_lines(self, axes, source, autoscale=False, **line_kwargs):
+        """
+        One line per axes, all fed by source() -> (x, y) with x in seconds
+        relative to now and y (N, len(axes)). Per-line styles can be given as lists.
+        """
+        lines = []
+        for i, ax in enumerate(axes):
+            kwargs = {k: v[i] if isinstance(v, (list, tuple)) else v for k, v in line_kwargs.items()}
+            line, = ax.plot([], [], animated=True, **kwargs)
+            ax.set_xlim(-self.span, 0)
+            lines.append(line)
+        trace = Trace(source, lines, autoscale)
+        trace.allocate()
+        self.traces.append(trace)
+        return lines
+
+    def add_text(self, source, x=0.5, y=0.98, **text_kwargs):
+        """Text in figure coordinates; source() -> (string, color)"""
+        text = self.fig.text(x, y, "", animated=True, **text_kwargs)
+        self.texts.append((text, source))
+        return text
+
+    def _on_resize(self, event):
+        for trace in self.traces:
+            trace.allocate()
+
+    def _on_draw(self, event):
+        # A full draw happened (first show, resize, y limits changed): re-cache the background
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self._artists():
+            self.fig.draw_artist(artist)
+
+    def update(self):
+        """Refresh every line and label. True if the background has to be redrawn."""
+        rescale = False
+        for trace in self.traces:
+            rescale |= trace.refresh()
+        for text, source in self.texts:
+            string, color = source()
+            text.set_text(string)
+            text.set_color(color)
+        return rescale
+
+    def frame(self):
+        start = time.perf_counter()
+        if self.update() or self._background is None or not self.canvas.supports_blit:
+            self.full_draws += 1
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+        cost = time.perf_counter() - start
+        if self.render_cost is None:
+            self.render_cost = cost
+        else:
+            self.render_cost += COST_SMOOTHING * (cost - self.render_cost)
+        self.frames += 1
+        self._adapt()
+
+    def _adapt(self):
+        self.interval = min(max(self.render_cost / self.budget, self.min_interval), self.max_interval)
+        if self._timer is not None:
+            self._timer.interval = int(self.interval * 1000)
+
+    def start(self):
+        self._timer = self.canvas.new_timer(interval=int(self.interval * 1000))
+        self._timer.add_callback(self.frame)
+        self._timer.start()
+        return self._timer
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    def stats(self):
+        return {'frames': self.frames,
+                'full_draws': self.full_draws,
+                'render_ms': (self.render_cost or 0.0) * 1e3,
+                'fps': 1.0 / self.interval}
+
+
+def ring_source(buffer, num_samples, fs, convert=None):
+    """
+    Source for the newest num_samples of a SampleRingBuffer, timed back from
+    now at fs (newest sample at 0).
+    """
+    offsets = (np.arange(num_samples) - (num_samples - 1)) / fs
+
+    def source():
+        values = buffer.latest(num_samples)
+        if convert is not None:
+            values = convert(values)
+        return offsets[num_samples - len(values):], values
+    return source
+
+
+def pulse_source(pulse_data, span):
+    """Source for the last `span` seconds of a PulseStore"""
+    def source():
+        now = time.time()
+        timestamps, values = pulse_data.latest(span, now)
+        return timestamps - now, values
+    return source
+
+
+def clock_source(aligner, span):
+    """
+    Source for the last `span` seconds of a StreamAligner's accelerometer samples,
+    placed by its sample clock, so they share a time axis with pulse_source
+    """
+    def source():
+        now = time.time()
+        times, values = aligner.accel_range(now - span)
+        return times - now, values
+    return source
@@ -0,0 +1,290 @@
+import argparse
+import copy
+import json
+import os
+import warnings
+
+import numpy as np
+import torch
+
+from motionDetection import MotionDetection
+from inference_profiler import time_calls_ns
+from recording_cache import load_manifest
+from windowing import sliding_windows
+from data_paths import dataset_path, model_path, require
+
+MODEL_PATH = model_path("motion_model.pth")
+MANIFEST = dataset_path("manifest.csv")
+WINDOW_SIZE = 128
+CALIBRATION_WINDOWS = 512
+MIN_AGREEMENT = 0.98  # fraction of windows where an artifact must predict what the float model does
+
+EAGER = "eager"
+TORCHSCRIPT = "torchscript"
+TORCHSCRIPT_INT8 = "torchscript_int8"
+ONNX = "onnx"
+FEATURES = "features"  # motion_features.FeatureClassifier, a different model rather than an export
+
+
+def artifact_paths(model_path=MODEL_PATH):
+    stem = os.path.splitext(model_path)[0]
+    return {
+        TORCHSCRIPT: stem + ".ts.pt",
+        TORCHSCRIPT_INT8: stem + ".int8.pt",
+        ONNX: stem + ".onnx",
+        'index': stem + ".artifacts.json",
+    }
+
+
+def load_float_model(model_path=MODEL_PATH, window_size=WINDOW_SIZE):
+    return MotionDetection.load(model_path, window_size)
+
+
+def labelled_windows(manifest=MANIFEST, window_size=WINDOW_SIZE, hop=None):
+    """(windows, 3, window_size) float32 windows and their labels from every manifest recording"""
+    windows, labels = [], []
+    for recording, label in load_manifest(manifest):
+        w = sliding_windows(recording.xyz, window_size, hop)
+        windows.append(np.ascontiguousarray(w))
+        labels.append(np.full(len(w), label, dtype=np.int64))
+    return np.concatenate(windows), np.concatenate(labels)
+
+
+# ------------------------
+# Export
+# ------------------------
+def freeze(model, window_size=WINDOW_SIZE):
+    example = torch.zeros(1, 3, window_size)
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter("ignore")
+        return torch.jit.freeze(torch.jit.trace(model, example).eval())
+
+
+def export_torchscript(model, path, window_size=WINDOW_SIZE):
+    """Traced, frozen TorchScript: weights folded in as constants, no Python dispatch"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.jit.save(freeze(model, window_size), path)
+    return path
+
+
+def quantize_static(model, calibration, window_size=WINDOW_SIZE, batch_size=64):
+    """
+    int8 MotionDetection with activation ranges observed on `calibration` windows.
+    Both convolutions and the linear layer are quantized; dynamic quantization
+    would only cover the linear layer, which is the cheapest part of the model.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    example = (torch.zeros(1, 3, window_size),)
+    with warnings.catch_warnings(), torch.no_grad():
+        warnings.simplefilter("ignore")
+        prepared = prepare_fx(copy.deepcopy(model).eval(),
+                              get_default_qconfig_mapping(torch.backends.quantized.engine), example)
+        for i in range(0, len(calibration), batch_size):
+            prepared(torch.from_numpy(calibration[i:i + batch_size]))
+        return convert_fx(prepared)
+
+
+def export_int8(model, path, calibration, window_size=WINDOW_SIZE):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.jit.save(freeze(quantize_static(model, calibration, window_size), window_size), path)
+    return path
+
+
+def export_onnx(model, path, window_size=WINDOW_SIZE):
+    """ONNX graph with a dynamic batch axis. Needs the onnx package."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        torch.onnx.export(model, (torch.zeros(1, 3, window_size),), path,
+                          input_names=['windows'], output_names=['logits'],
+                          dynamic_axes={'windows': {0: 'batch'}, 'logits': {0: 'batch'}},
+                          dynamo=False)
+    return path
+
+
+# ------------------------
+# Loading
+# ------------------------
+class Artifact:
+    """
+    One runnable form of the model. Calling it with (batch, 3, window) float32
+    windows (NumPy or tensor) returns (batch, 2) logits: a tensor, or a NumPy
+    array for the FEATURES classifier, which never touches torch.
+    """
+
+    def __init__(self, kind, path, run):
+        self.kind = kind
+        self.path = path
+        self._run = run
+
+    def __call__(self, windows):
+        return self._run(windows)
+
+    def __repr__(self):
+        return f"Artifact({self.kind!r}, {self.path!r})"
+
+
+def _as_tensor(windows):
+    return torch.as_tensor(np.ascontiguousarray(windows, dtype=np.float32))
+
+
+def load_artifact(path, window_size=WINDOW_SIZE):
+    """Artifact for a .pth state dict, a TorchScript .pt file, an .onnx graph or a feature classifier .npz"""
+    if path.endswith(".npz"):
+        from motion_features import FeatureClassifier
+
+        classifier = FeatureClassifier.load(path, window_size)
+        artifact = Artifact(FEATURES, path, classifier)
+        artifact.model = classifier
+        return artifact
+
+    if path.endswith(".onnx"):
+        import onnxruntime as ort
+
+        session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+        def run(windows):
+            windows = np.ascontiguousarray(windows, dtype=np.float32)
+            return torch.from_numpy(session.run(None, {'windows': windows})[0])
+        return Artifact(ONNX, path, run)
+
+    if path.endswith(".pth"):
+        model = load_float_model(path, window_size)
+        kind = EAGER
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = torch.jit.load(path, map_location=torch.device("cpu"))
+        kind = TORCHSCRIPT_INT8 if path.endswith(".int8.pt") else TORCHSCRIPT
+
+    def run(windows):
+        with torch.no_grad():
+            return model(_as_tensor(windows))
+    artifact = Artifact(kind, path, run)
+    artifact.model = model
+    return artifact
+
+
+# ------------------------
+# Parity and selection
+# ------------------------
+def parity(artifact, reference_logits, windows, labels, batch_size=1024):
+    """How closely an artifact matches the float model's logits on labelled windows"""
+    logits = torch.cat([artifact(windows[i:i + batch_size]) for i in range(0, len(windows), batch_size)])
+    predictions = logits.argmax(dim=1).numpy()
+    return {
+        'agreement': float((predictions == reference_logits.argmax(dim=1).numpy()).mean()),
+        'accuracy': float((predictions == labels).mean()),
+        'max_abs_diff': float((logits - reference_logits).abs().max()),
+    }
+
+
+def export_all(model_path=MODEL_PATH, manifest=MANIFEST, window_size=WINDOW_SIZE,
+               min_agreement=MIN_AGREEMENT, calibration_windows=CALIBRATION_WINDOWS, seed=0):
+    """
+    Write every artifact next to the model, check each against the float model on
+    the manifest recordings and record the results in <model>.artifacts.json.
+    An artifact that fails to export (e.g. onnx not installed) is skipped.
+    """
+    paths = artifact_paths(model_path)
+    model = load_float_model(model_path, window_size)
+    windows, labels = labelled_windows(manifest, window_size, hop=window_size // 4)
+
+    rng = np.random.default_rng(seed)
+    calibration = windows[rng.permutation(len(windows))[:calibration_windows]]
+
+    float_artifact = load_artifact(model_path, window_size)
+    reference = torch.cat([float_artifact(windows[i:i + 1024]) for i in range(0, len(windows), 1024)])
+
+    exporters = {
+        TORCHSCRIPT: lambda path: export_torchscript(model, path, window_size),
+        TORCHSCRIPT_INT8: lambda path: export_int8(model, path, calibration, window_size),
+        ONNX: lambda path: export_onnx(model, path, window_size),
+    }
+
+    entries = [dict(kind=EAGER, path=model_path, passed=True,
+                    **parity(float_artifact, reference, windows, labels))]
+    for kind, export in exporters.items():
+        path = paths[kind]
+        try:
+            export(path)
+            result = parity(load_artifact(path, window_size), reference, windows, labels)
+        except Exception as e:
+            print(f"Skipping {kind}: {e}")
+            continue
+        entries.append(dict(kind=kind, path=path, passed=result['agreement'] >= min_agreement, **result))
+
+    index = {'model': model_path, 'window_size': window_size, 'windows': len(windows),
+             'min_agreement': min_agreement, 'artifacts': entries}
+    with open(paths['index'], 'w') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def choose_fastest(model_path=MODEL_PATH, window_size=WINDOW_SIZE, batch_size=1,
+                   warmup=20, iterations=200, verbose=True):
+    """
+    Time every artifact that passed its parity check on this host and return the
+    fastest at `batch_size`. Falls back to the eager model when nothing was exported.
+    """
+    index_path = artifact_paths(model_path)['index']
+    candidates = [model_path]
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index['window_size'] == window_size:
+            candidates += [entry['path'] for entry in index['artifacts']
+                           if entry['passed'] and entry['kind'] != EAGER]
+
+    x = torch.randn(batch_size, 3, window_size, generator=torch.Generator().manual_seed(0))
+    best, best_time = None, None
+    for path in candidates:
+        try:
+            artifact = load_artifact(path, window_size)
+        except Exception as e:
+            # e.g. an .onnx artifact on a host without onnxruntime
+            if verbose:
+                print(f"Skipping {path}: {e}")
+            continue
+        p50 = np.median(time_calls_ns(lambda: artifact(x), warmup, iterations)) / 1e6
+        if verbose:
+            print(f"{artifact.kind:18s} {p50:8.3f} ms per batch of {batch_size}")
+        if best_time is None or p50 < best_time:
+            best, best_time = artifact, p50
+
+    if verbose:
+        print(f"Using {best.kind} ({best.path})")
+    return best
+
+
+def resolve_model(model, window_size=WINDOW_SIZE, batch_size=1, model_path=MODEL_PATH):
+    """Artifact for a --model argument: a file path, or "auto" for the fastest on this host"""
+    if model == "auto":
+        return choose_fastest(model_path, window_size, batch_size)
+    return load_artifact(model, window_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export TorchScript, int8 and ONNX versions of MotionDetection")
+    parser.add_argument("--model", default=MODEL_PATH, help="trained model state dict")
+    parser.add_argument("--manifest", default=MANIFEST, help="recordings for calibration and the parity check")
+    parser.add_argument("--window", type=int, default=WINDOW_SIZE, help="samples per window")
+    parser.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT)
+    parser.add_argument("--choose", action="store_true", help="also time the exported artifacts on this host")
+    parser.add_argument("--batch-size", type=int, default=1, help="batch size for --choose")
+    args = parser.parse_args()
+
+    require(args.model, "model")
+    require(args.manifest, "manifest")
+    index = export_all(args.model, args.manifest, args.window, args.min_agreement)
+    print(f"Parity on {index['windows']} windows:")
+    for entry in index['artifacts']:
+        print(f"{entry['kind']:18s} agreement {entry['agreement']:.4f}  accuracy {entry['accuracy']:.4f}  "
+              f"max |diff| {entry['max_abs_diff']:.4g}  {'ok' if entry['passed'] else 'FAILED'}  {entry['path']}")
+    print(f"Saved to \"{artifact_paths(args.model)['index']}\"")
+
+    if args.choose:
+        choose_fastest(args.model, args.window, args.batch_size)
@@ -1,12 +1,13 @@
 import torch
-import torchaudio
-from torchvision.transforms import Resize
 import numpy as np
-import pandas as pd
 import os
+import hashlib
 from scipy.io.wavfile import read
 from scipy.signal import butter, filtfilt, spectrogram
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset
+from windowing import sliding_windows
+from recording_cache import load_recording
+from fir_filter import fir_filter
 
 # Custom PyTorch Dataset
 class HeartbeatDataset(Dataset):
@@ -125,26 +126,87 @@ class HeartbeatDataset(Dataset):
 
 
 class AccelDataset(Dataset):
-    def __init__(self, good_csv, bad_csv, buffer_size=128):
-        self.buffer_size = buffer_size
-        self.data = []
-        self.labels = []
-
-        for file_path, label in [(good_csv, 1), (bad_csv, 0)]:
-            df = pd.read_csv(file_path)[['x', 'y', 'z']].to_numpy()
-            num_chunks = len(df) // buffer_size
+    """
+    Fixed-length (3, buffer_size) windows from a GOOD and a BAD recording.
 
-            for i in range(num_chunks):
-                chunk = df[i * buffer_size: (i + 1) * buffer_size]
-                chunk = chunk.T  # shape (3, buffer_size)
-                self.data.append(chunk)
-                self.labels.append(label)
+    hop sets the distance between window starts; a hop smaller than buffer_size gives
+    overlapping windows. The windowed tensor is cached as a .npy file in cache_dir,
+    keyed by the content hash of both CSVs, buffer_size and hop, and memory-mapped
+    on later runs so the CSVs are not parsed again.
 
-        # self.data = torch.tensor(self.data, dtype=torch.float32)
-        # self.labels = torch.tensor(self.labels, dtype=torch.long)
-        self.data = torch.tensor(np.array(self.data), dtype=torch.float32)
-        self.labels = torch.tensor(self.labels, dtype=torch.long).view(-1)  # ensures 1D labels
+    With fir=True each recording is run through the sensor's FIR filter
+    (fir_filter.FIR_COEFFS) before windowing, as live_ML --fir filters the live
+    stream, so a model trained on it sees the same signal when served.
+    """
 
+    def __init__(self, good_csv, bad_csv, buffer_size=128, hop=None, cache_dir=None, use_cache=True, fir=False):
+        self.buffer_size = buffer_size
+        self.hop = buffer_size if hop is None else hop
+        self.fir = fir
+        sources = [(good_csv, 1), (bad_csv, 0)]
+
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(good_csv)), ".cache")
+
+        if use_cache:
+            data, labels = self.load_cached(sources, cache_dir)
+        else:
+            data, labels = self.build_windows(sources)
+
+        self.data = torch.from_numpy(data)
+        self.labels = torch.from_numpy(labels).view(-1)  # ensures 1D labels
+
+    @staticmethod
+    def file_hash(file_path):
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def cache_key(self, sources):
+        hashes = '_'.join(self.file_hash(file_path)[:16] for file_path, _ in sources)
+        return f"accel_{hashes}_w{self.buffer_size}_h{self.hop}{'_fir' if self.fir else ''}"
+
+    def build_windows(self, sources):
+        """Window every recording as a strided view and copy it once into one array"""
+        windows = []
+        for file_path, label in sources:
+            samples = load_recording(file_path).xyz
+            if self.fir:
+                samples = fir_filter(samples)
+            windows.append((sliding_windows(samples, self.buffer_size, self.hop), label))
+
+        num_windows = sum(len(w) for w, _ in windows)
+        out = np.empty((num_windows, 3, self.buffer_size), dtype=np.float32)
+        labels = np.empty(num_windows, dtype=np.int64)
+
+        offset = 0
+        for w, label in windows:
+            out[offset:offset + len(w)] = w
+            labels[offset:offset + len(w)] = label
+            offset += len(w)
+
+        return out, labels
+
+    def load_cached(self, sources, cache_dir):
+        key = self.cache_key(sources)
+        data_path = os.path.join(cache_dir, key + "_data.npy")
+        labels_path = os.path.join(cache_dir, key + "_labels.npy")
+
+        if not (os.path.exists(data_path) and os.path.exists(labels_path)):
+            os.makedirs(cache_dir, exist_ok=True)
+            data, labels = self.build_windows(sources)
+
+            # Write under a temporary name so an interrupted run never leaves a partial cache
+            for path, array in [(data_path, data), (labels_path, labels)]:
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp_path, path)
+
+        # Copy-on-write mapping: pages are read lazily and stay writable for torch
+        return np.load(data_path, mmap_mode='c'), np.load(labels_path)
 
     def __len__(self):
         return len(self.data)
@@ -1,14 +1,6 @@
 import torch
 import torch.nn as nn
-import torch.optim as optim
-from torch.utils.data import DataLoader, random_split
 # from dopplerSpectrogramDataset import DopplerSpectrogramDataset
-import matplotlib.pyplot as plt
-from sklearn.metrics import confusion_matrix
-import seaborn as sns
-import os
-import time
-import numpy as np
 
 
 # Define a CNN model for 1024x133 spectrogram classification
@@ -32,17 +24,33 @@ class MotionDetection(nn.Module):
     #     x = self.classifier(x)
     #     return x    # Model outputs confidence in each possible label, not the predicted label directly
 
-    def __init__(self, input_channels=3, seq_len=128):
+    # width is the first convolution's channel count; the second has twice as many
+    def __init__(self, input_channels=3, seq_len=128, width=16):
         super(MotionDetection, self).__init__()
         self.model = nn.Sequential(
-            nn.Conv1d(input_channels, 16, kernel_size=3, padding=1),
+            nn.Conv1d(input_channels, width, kernel_size=3, padding=1),
             nn.ReLU(),
-            nn.Conv1d(16, 32, kernel_size=3, padding=1),
+            nn.Conv1d(width, 2 * width, kernel_size=3, padding=1),
             nn.ReLU(),
-            nn.AdaptiveAvgPool1d(1),  # output shape: (batch, 32, 1)
-            nn.Flatten(),             # (batch, 32)
-            nn.Linear(32, 2)          # Binary classification (logits)
+            nn.AdaptiveAvgPool1d(1),  # output shape: (batch, 2 * width, 1)
+            nn.Flatten(),             # (batch, 2 * width)
+            nn.Linear(2 * width, 2)   # Binary classification (logits)
         )
 
     def forward(self, x):
         return self.model(x)
+
+    @classmethod
+    def from_state_dict(cls, state_dict, seq_len=128):
+        """Model shaped like the saved one: input channels and width come from the first convolution"""
+        out_channels, in_channels, _ = state_dict['model.0.weight'].shape
+        model = cls(input_channels=in_channels, seq_len=seq_len, width=out_channels)
+        model.load_state_dict(state_dict)
+        return model
+
+    @classmethod
+    def load(cls, path, seq_len=128, map_location="cpu"):
+        """Eval-mode model from a state dict saved by motion_training, whatever its --width"""
+        model = cls.from_state_dict(torch.load(path, map_location=map_location), seq_len)
+        model.eval()
+        return model
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from recording_cache import load_manifest
+from windowing import sliding_windows, window_starts
+from data_paths import dataset_path, require
+
+MANIFEST = dataset_path("manifest.csv")
+FOLDS = 5
+WINDOW_SIZE = 128
+HOP = 32
+WIDTH = 16
+LEARNING_RATE = 1e-3
+BATCH_SIZE = 64
+EPOCHS = 15
+SEED = 0
+
+# How windows are assigned to folds
+SPLIT_BLOCK = "block"          # k contiguous time blocks of every recording
+SPLIT_RECORDING = "recording"  # whole recordings
+SPLIT_RANDOM = "random"        # individual windows, like random_split (leaks; for comparison only)
+SPLITS = [SPLIT_BLOCK, SPLIT_RECORDING, SPLIT_RANDOM]
+
+
+def fold_windows(recordings, folds=FOLDS, split=SPLIT_BLOCK, window_size=WINDOW_SIZE, hop=HOP, seed=SEED):
+    """
+    (windows, labels, fold) for every window of every (Recording, label).
+
+    With SPLIT_BLOCK each recording is cut into `folds` contiguous blocks and a
+    window belongs to the block it lies entirely inside; windows that straddle
+    a block boundary are dropped, so no sample is in both a training and a test
+    window. With SPLIT_RECORDING whole recordings are dealt to folds, round robin
+    within each label so every fold gets both classes where possible.
+    """
+    rng = np.random.default_rng(seed)
+    windows, labels, fold_ids = [], [], []
+    by_label = {}
+    for i, (recording, label) in enumerate(recordings):
+        by_label.setdefault(label, []).append(i)
+    recording_fold = {}
+    offset = 0
+    for label in sorted(by_label):
+        for j, i in enumerate(by_label[label]):
+            recording_fold[i] = (offset + j) % folds
+        offset += len(by_label[label])
+
+    for i, (recording, label) in enumerate(recordings):
+        n = len(recording.xyz)
+        w = sliding_windows(recording.xyz, window_size, hop)
+        starts = window_starts(n, window_size, hop)
+        if split == SPLIT_BLOCK:
+            first = starts * folds // n
+            last = (starts + window_size - 1) * folds // n
+            keep = first == last
+            w, fold = w[keep], first[keep]
+        elif split == SPLIT_RECORDING:
+            fold = np.full(len(w), recording_fold[i])
+        elif split == SPLIT_RANDOM:
+            fold = rng.integers(0, folds, len(w))
+        else:
+            raise ValueError(f"Unknown split: {split}")
+        windows.append(np.ascontiguousarray(w, dtype=np.float32))
+        labels.append(np.full(len(w), label, dtype=np.int64))
+        fold_ids.append(fold)
+
+    return np.concatenate(windows), np.concatenate(labels), np.concatenate(fold_ids)
+
+
+def _init_worker():
+    # One single-threaded torch per fold, on the CPU; the folds run side by side
+    import torch
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(1)
+
+
+def run_fold(fold, train, test, window_size=WINDOW_SIZE, width=WIDTH, lr=LEARNING_RATE, batch_size=BATCH_SIZE,
+             epochs=EPOCHS, seed=SEED):
+    """Train on `train` (windows, labels), score on `test`; returns the confusion matrix and timings"""
+    import torch
+    import torch.nn as nn
+    from motionDetection import MotionDetection
+    from motion_training import TensorLoader, train_model, seed_everything
+
+    start = time.perf_counter()
+    seed_everything(seed + fold)
+    generator = torch.Generator().manual_seed(seed + fold)
+    train_dl = TensorLoader(torch.from_numpy(train[0]), torch.from_numpy(train[1]), batch_size,
+                            shuffle=True, generator=generator)
+    model = MotionDetection(input_channels=3, seq_len=window_size, width=width)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    # On the CPU, not motion_training.DEVICE: the model was built there and the test windows stay there
+    train_model(model, train_dl, None, nn.CrossEntropyLoss(), optimizer, epochs, verbose=False,
+                device=torch.device("cpu"))
+    trained = time.perf_counter()
+
+    model.eval()
+    with torch.no_grad():
+        predictions = model(torch.from_numpy(test[0])).argmax(dim=1).numpy()
+    evaluated = time.perf_counter()
+
+    # confusion[true, predicted]
+    confusion = np.bincount(test[1] * 2 + predictions, minlength=4).reshape(2, 2)
+    return {
+        'fold': fold,
+        'train_windows': len(train[1]),
+        'test_windows': len(test[1]),
+        'confusion': confusion.tolist(),
+        'accuracy': float(np.trace(confusion) / max(confusion.sum(), 1)),
+        'train_sec': trained - start,
+        'eval_sec': evaluated - trained,
+    }
+
+
+def cross_validate(manifest=MANIFEST, folds=FOLDS, split=SPLIT_BLOCK, window_size=WINDOW_SIZE, hop=HOP,
+                   width=WIDTH, lr=LEARNING_RATE, batch_size=BATCH_SIZE, epochs=EPOCHS, seed=SEED,
+                   max_workers=None):
+    """Every fold trained concurrently in its own worker process"""
+    windows, labels, fold_ids = fold_windows(load_manifest(manifest), folds, split, window_size, hop, seed)
+
+    jobs = []
+    for fold in range(folds):
+        test = fold_ids == fold
+        if not test.any() or test.all():
+            print(f"Skipping fold {fold}: {'no' if not test.any() else 'only'} test windows")
+            continue
+        if len(np.unique(labels[~test])) < 2:
+            print(f"Skipping fold {fold}: its training windows are all one class")
+            continue
+        jobs.append((fold, (windows[~test], labels[~test]), (windows[test], labels[test])))
+    if not jobs:
+        raise ValueError(f"No usable folds for a {split} split into {folds}")
+
+    start = time.perf_counter()
+    max_workers = max_workers or min(len(jobs), os.cpu_count())
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(run_fold, fold, train, test, window_size, width, lr, batch_size, epochs, seed)
+                   for fold, train, test in jobs]
+        results = [future.result() for future in futures]
+    wall_sec = time.perf_counter() - start
+
+    confusion = np.sum([r['confusion'] for r in results], axis=0)
+    accuracies = np.array([r['accuracy'] for r in results])
+    return {
+        'split': split,
+        'folds': results,
+        'confusion': confusion.tolist(),
+        'accuracy': float(np.trace(confusion) / max(confusion.sum(), 1)),
+        'fold_accuracy_mean': float(accuracies.mean()),
+        'fold_accuracy_std': float(accuracies.std()),
+        'wall_sec': wall_sec,
+        'fold_sec_total': float(sum(r['train_sec'] + r['eval_sec'] for r in results)),
+        'workers': max_workers,
+    }
+
+
+def print_report(report):
+    print(f"{'fold':>4} {'train':>6} {'test':>5} {'acc %':>6} {'train s':>7} {'eval ms':>7}  confusion [[TN FP] [FN TP]]")
+    for r in report['folds']:
+        print(f"{r['fold']:4d} {r['train_windows']:6d} {r['test_windows']:5d} {100 * r['accuracy']:6.1f} "
+              f"{r['train_sec']:7.2f} {1000 * r['eval_sec']:7.2f}  {r['confusion']}")
+    print(f"{report['split']} split: pooled accuracy {100 * report['accuracy']:.1f}%, per fold "
+          f"{100 * report['fold_accuracy_mean']:.1f} +/- {100 * report['fold_accuracy_std']:.1f}%, "
+          f"confusion {report['confusion']}")
+    print(f"Wall time {report['wall_sec']:.1f} s for {report['fold_sec_total']:.1f} s of fold work "
+          f"on {report['workers']} workers")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="k-fold cross-validation of MotionDetection with folds "
+                                                 "split by time block or recording")
+    parser.add_argument("--manifest", default=MANIFEST)
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--split", choices=SPLITS, default=SPLIT_BLOCK)
+    parser.add_argument("--window", type=int, default=WINDOW_SIZE)
+    parser.add_argument("--hop", type=int, default=HOP)
+    parser.add_argument("--width", type=int, default=WIDTH)
+    parser.add_argument("--lr", type=float, default=LEARNING_RATE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per fold, up to the core count)")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    require(args.manifest, "manifest")
+    report = cross_validate(args.manifest, args.folds, args.split, args.window, args.hop, args.width, args.lr,
+                            args.batch_size, args.epochs, args.seed, args.workers)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved to \"{args.output}\"")
+
+
+if __name__ == "__main__":
+    main()
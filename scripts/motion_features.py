@@ -0,0 +1,241 @@
+import argparse
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from data_paths import dataset_path, model_path, require
+
+GOOD_CSV = dataset_path("good_data.csv")
+BAD_CSV = dataset_path("bad_data.csv")
+MODEL_PATH = model_path("motion_features.npz")
+CNN_MODEL_PATH = model_path("motion_model.pth")
+WINDOW_SIZE = 128
+FS = 50.0
+BAND_EDGES_HZ = (0.5, 2.0, 5.0, 10.0, 25.0)  # band powers over [0.5, 2), [2, 5), [5, 10), [10, 25]
+L2 = 1.0
+ITERATIONS = 50
+SEED = 0
+EPS = 1e-12  # floor under powers before taking logs; still windows have near-zero variance
+AXES = "xyz"
+PAIRS = [(0, 1), (0, 2), (1, 2)]
+_ROWS, _COLS = zip(*PAIRS)
+
+
+# ------------------------
+# Features
+# ------------------------
+@lru_cache(maxsize=8)
+def band_matrix(window_size, fs=FS, band_edges=BAND_EDGES_HZ):
+    """(rfft bins, bands) 0/1 matrix; the last band includes its upper edge. Cached per window size"""
+    freqs = np.fft.rfftfreq(window_size, 1.0 / fs)
+    lo, hi = np.asarray(band_edges[:-1]), np.asarray(band_edges[1:])
+    inside = (freqs[:, None] >= lo) & (freqs[:, None] < hi)
+    inside[:, -1] |= freqs == hi[-1]
+    return inside.astype(np.float64)
+
+
+def feature_names(band_edges=BAND_EDGES_HZ):
+    names = [f"mean_{a}" for a in AXES] + [f"log_var_{a}" for a in AXES] + [f"log_jerk_{a}" for a in AXES]
+    names += [f"log_band_{a}_{lo:g}-{hi:g}Hz" for a in AXES for lo, hi in zip(band_edges[:-1], band_edges[1:])]
+    names += [f"corr_{AXES[i]}{AXES[j]}" for i, j in PAIRS]
+    return names
+
+
+def features(windows, fs=FS, band_edges=BAND_EDGES_HZ):
+    """
+    (N, F) features of (N, 3, T) windows, all windows at once: per-axis mean,
+    log variance, log jerk energy (mean squared first difference, in units/s),
+    log band powers of the rFFT of the de-meaned window, and the x-y, x-z, y-z
+    correlations. Variances and powers are logged because still and moving
+    windows differ by orders of magnitude.
+    """
+    w = np.asarray(windows, dtype=np.float64)
+    n, channels, length = w.shape
+    mean = w.mean(axis=2)
+    centred = w - mean[:, :, np.newaxis]
+
+    # cov[n, i, j]; its diagonal is the per-axis variance
+    cov = centred @ centred.transpose(0, 2, 1) / length
+    var = cov.reshape(n, -1)[:, ::channels + 1]
+    jerk = w[:, :, 1:] - w[:, :, :-1]
+    jerk_energy = np.square(jerk).sum(axis=2) * (fs * fs / max(length - 1, 1))
+
+    spectrum = np.fft.rfft(centred, axis=2)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    bands = power @ band_matrix(length, float(fs), tuple(band_edges)) / length  # (N, 3, bands)
+
+    std = np.sqrt(var + EPS)
+    corr = cov[:, _ROWS, _COLS] / (std[:, _ROWS] * std[:, _COLS])
+
+    logs = np.log(np.concatenate([var, jerk_energy, bands.reshape(n, -1)], axis=1) + EPS)
+    return np.concatenate([mean, logs, corr], axis=1)
+
+
+# ------------------------
+# Model
+# ------------------------
+def _sigmoid(z):
+    return 0.5 * (1 + np.tanh(0.5 * z))
+
+
+class FeatureClassifier:
+    """
+    L2-regularised logistic regression on standardised features(), in NumPy only.
+
+    Called with (batch, 3, window) windows (NumPy or CPU tensor) it returns
+    (batch, 2) float32 logits [-z/2, z/2], so softmax and argmax give the same
+    BAD/GOOD probabilities and label as MotionDetection's output.
+    """
+
+    def __init__(self, mean, scale, weights, bias, window_size=WINDOW_SIZE, fs=FS, band_edges=BAND_EDGES_HZ):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.window_size = int(window_size)
+        self.fs = float(fs)
+        self.band_edges = tuple(float(edge) for edge in band_edges)
+        # Standardisation folded into the weights: one dot product per window at inference
+        self._weights = self.weights / self.scale
+        self._bias = self.bias - self.mean @ self._weights
+
+    @classmethod
+    def fit(cls, windows, labels, fs=FS, band_edges=BAND_EDGES_HZ, l2=L2, iterations=ITERATIONS, tol=1e-8):
+        """Newton's method (IRLS); with a couple of dozen features each step is one small solve"""
+        x = features(windows, fs, band_edges)
+        y = np.asarray(labels, dtype=np.float64)
+        mean = x.mean(axis=0)
+        scale = x.std(axis=0)
+        scale[scale == 0] = 1.0
+
+        design = np.hstack([(x - mean) / scale, np.ones((len(x), 1))])
+        penalty = np.full(design.shape[1], l2)
+        penalty[-1] = 0.0  # the bias is not shrunk
+        beta = np.zeros(design.shape[1])
+        for _ in range(iterations):
+            p = _sigmoid(design @ beta)
+            gradient = design.T @ (p - y) + penalty * beta
+            hessian = (design.T * (p * (1 - p))) @ design + np.diag(penalty)
+            step = np.linalg.solve(hessian + 1e-9 * np.eye(len(beta)), gradient)
+            beta -= step
+            if np.abs(step).max() < tol:
+                break
+
+        return cls(mean, scale, beta[:-1], beta[-1], np.asarray(windows).shape[-1], fs, band_edges)
+
+    def decision(self, windows):
+        """Log-odds of GOOD for each window"""
+        return features(windows, self.fs, self.band_edges) @ self._weights + self._bias
+
+    def __call__(self, windows):
+        half = 0.5 * self.decision(windows)
+        return np.stack([-half, half], axis=1).astype(np.float32)
+
+    def predict(self, windows):
+        return (self.decision(windows) > 0).astype(np.int64)
+
+    def num_params(self):
+        return self.mean.size + self.scale.size + self.weights.size + 1
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, mean=self.mean, scale=self.scale, weights=self.weights, bias=self.bias,
+                     window_size=self.window_size, fs=self.fs, band_edges=np.asarray(self.band_edges))
+        return path
+
+    @classmethod
+    def load(cls, path, window_size=None):
+        """Saved classifier; with window_size, also check it was trained on windows that long"""
+        with np.load(path, allow_pickle=False) as params:
+            classifier = cls(params['mean'], params['scale'], params['weights'], params['bias'],
+                             params['window_size'], params['fs'], params['band_edges'])
+        if window_size is not None and classifier.window_size != window_size:
+            raise ValueError(f"{path} was trained on {classifier.window_size}-sample windows, not {window_size}")
+        return classifier
+
+    def __repr__(self):
+        return f"FeatureClassifier({self.weights.size} features, window {self.window_size})"
+
+
+# ------------------------
+# Training and comparison
+# ------------------------
+def split_windows(good=GOOD_CSV, bad=BAD_CSV, window_size=WINDOW_SIZE, hop=None, seed=SEED, fir=False):
+    """(windows, labels) train/val/test NumPy arrays, the same split motion_training makes with this seed"""
+    from motionDataset import AccelDataset
+    from motion_training import make_tensor_loaders
+
+    dataset = AccelDataset(good, bad, window_size, hop=hop, fir=fir)
+    return [(loader.data.cpu().numpy(), loader.labels.cpu().numpy())
+            for loader in make_tensor_loaders(dataset, seed=seed)]
+
+
+def latency_us(model, window_size, batch_size=1, iterations=200):
+    """Median latency per window in microseconds at `batch_size`"""
+    from inference_profiler import time_calls_ns
+
+    x = np.random.default_rng(0).standard_normal((batch_size, 3, window_size)).astype(np.float32)
+    return float(np.median(time_calls_ns(lambda: model(x), 10, iterations))) / 1e3 / batch_size
+
+
+def compare(classifier, cnn, test, window_size=WINDOW_SIZE):
+    """Test accuracy and per-window latency (batch 1 and batch 1024) of the classifier and a model_export Artifact"""
+    rows = []
+    for name, model in [("features", classifier), (f"cnn ({cnn.kind})", cnn)]:
+        logits = np.asarray(model(test[0]))
+        rows.append((name, float((logits.argmax(axis=1) == test[1]).mean()),
+                     latency_us(model, window_size), latency_us(model, window_size, 1024, 20)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the NumPy feature classifier and compare it with the CNN")
+    parser.add_argument("--good", default=GOOD_CSV, help="recording of good motion")
+    parser.add_argument("--bad", default=BAD_CSV, help="recording of bad motion")
+    parser.add_argument("--window", type=int, default=WINDOW_SIZE, help="samples per window")
+    parser.add_argument("--hop", type=int, help="samples between window starts (default: --window)")
+    parser.add_argument("--fs", type=float, default=FS, help="sensor sample rate, for the band edges")
+    parser.add_argument("--fir", action="store_true",
+                        help="train on recordings run through the sensor's FIR filter (serve with --fir too)")
+    parser.add_argument("--l2", type=float, default=L2, help="weight penalty")
+    parser.add_argument("--seed", type=int, default=SEED, help="train/val/test split, as in motion_training")
+    parser.add_argument("--output", default=MODEL_PATH, help="where to save the parameters")
+    parser.add_argument("--compare", nargs="?", const=CNN_MODEL_PATH,
+                        help=f"also score a CNN state dict or exported artifact (default {CNN_MODEL_PATH}) "
+                             "on the same test windows")
+    args = parser.parse_args(argv)
+
+    require(args.good, "GOOD recording")
+    require(args.bad, "BAD recording")
+    require(args.compare, "CNN model")
+    train, val, test = split_windows(args.good, args.bad, args.window, args.hop, args.seed, args.fir)
+    start = time.perf_counter()
+    classifier = FeatureClassifier.fit(*train, fs=args.fs, l2=args.l2)
+    print(f"Fit {classifier.weights.size} features on {len(train[1])} windows in "
+          f"{1000 * (time.perf_counter() - start):.1f} ms")
+    for name, (windows, labels) in [("train", train), ("val", val), ("test", test)]:
+        print(f"{name:5s} accuracy {100 * (classifier.predict(windows) == labels).mean():.1f}% "
+              f"on {len(labels)} windows")
+
+    order = np.argsort(-np.abs(classifier.weights))
+    names = feature_names(classifier.band_edges)
+    print("Largest weights: " + ", ".join(f"{names[i]} {classifier.weights[i]:+.2f}" for i in order[:5]))
+
+    classifier.save(args.output)
+    print(f"Saved {classifier.num_params()} parameters ({os.path.getsize(args.output)} bytes) "
+          f"to \"{args.output}\"")
+
+    if args.compare:
+        from model_export import load_artifact
+
+        cnn = load_artifact(args.compare, args.window)
+        print(f"{'model':24s} {'test %':>6} {'us/win (batch 1)':>16} {'us/win (batch 1024)':>19}")
+        for name, accuracy, single, batched in compare(classifier, cnn, test, args.window):
+            print(f"{name:24s} {100 * accuracy:6.1f} {single:16.1f} {batched:19.2f}")
+        print("The CNN's accuracy is only a fair comparison if it was trained with the same --hop and --seed")
+
+
+if __name__ == "__main__":
+    main()
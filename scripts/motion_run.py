@@ -42,73 +42,169 @@
 
 #-----------------------------------------------------------------------------
 
-import torch
+import argparse
+import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from motionDetection import MotionDetection
+from windowing import sliding_windows, window_starts
+from recording_cache import load_recording
+from fir_filter import fir_filter
+from motion_features import FeatureClassifier
+from data_paths import dataset_path, model_path, require
 
 # ------------------------
 # Config
 # ------------------------
-csv_path = "../dataset/test_mix2.csv"
-MODEL_PATH = "motion_model.pth"
+csv_path = dataset_path("test_mix2.csv")
+MODEL_PATH = model_path("motion_model.pth")
 BUFFER_SIZE = 128
-DEVICE = torch.device("cuda:0") if torch.cuda.is_available() else torch.device("cpu")
+HOP = BUFFER_SIZE
+BATCH_SIZE = 1024
+LABELS = ["BAD", "GOOD"]
 
 # ------------------------
 # Load Model
 # ------------------------
-model = MotionDetection(input_channels=3, seq_len=BUFFER_SIZE)
-model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
-model.to(DEVICE)
-model.eval()
+def load_model(model_path=MODEL_PATH, window_size=BUFFER_SIZE, batch_size=BATCH_SIZE):
+    """
+    MotionDetection on the GPU if there is one for a .pth state dict, the
+    FeatureClassifier for a motion_features .npz, otherwise a model_export
+    Artifact. torch is only imported for the torch models.
+    """
+    if model_path.endswith(".npz"):
+        return FeatureClassifier.load(model_path, window_size)
+
+    if model_path.endswith(".pth"):
+        import torch
+        from motionDetection import MotionDetection
+        device = torch.device("cuda:0") if torch.cuda.is_available() else torch.device("cpu")
+        return MotionDetection.load(model_path, window_size, map_location=device).to(device)
+
+    from model_export import resolve_model
+    return resolve_model(model_path, window_size, batch_size)
 
 # ------------------------
 # Load CSV Data
 # ------------------------
-df = pd.read_csv(csv_path)[['x', 'y', 'z']].to_numpy()
-num_chunks = len(df) // BUFFER_SIZE
+def load_samples(csv_path):
+    return load_recording(csv_path).xyz
 
 # ------------------------
-# Setup Plot
+# Batched Inference
 # ------------------------
-plt.ion()
-fig, axs = plt.subplots(3, 1, figsize=(10, 6), sharex=True)
-axes_titles = ['X-axis', 'Y-axis', 'Z-axis']
-lines = []
-
-for ax, title in zip(axs, axes_titles):
-    # ax.set_title(title)
-    ax.set_ylim(-1.5, 1.5)  # Adjust based on sensor range
-    line, = ax.plot([], [], lw=2)
-    lines.append(line)
-
-axs[-1].set_xlabel("Sample")
-plt.tight_layout()
+def softmax(logits):
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def classify_windows(model, samples, window_size=BUFFER_SIZE, hop=HOP, batch_size=BATCH_SIZE):
+    """Run every window of the recording through the model, batch_size windows at a time"""
+    windows = sliding_windows(samples, window_size, hop)
+    starts = window_starts(len(samples), window_size, hop)
+    probs = np.empty((len(windows), len(LABELS)), dtype=np.float32)
+
+    if isinstance(model, FeatureClassifier):
+        # NumPy in, NumPy logits out: no torch at all
+        for i in range(0, len(windows), batch_size):
+            probs[i:i + batch_size] = softmax(model(windows[i:i + batch_size]))
+        return starts, probs
+
+    import torch
+    device = next(model.parameters()).device if isinstance(model, torch.nn.Module) else None
+    with torch.no_grad():
+        for i in range(0, len(windows), batch_size):
+            batch = torch.from_numpy(np.ascontiguousarray(windows[i:i + batch_size]))
+            if device is not None:
+                batch = batch.to(device)  # exported artifacts run on the CPU
+            probs[i:i + batch_size] = torch.softmax(model(batch), dim=1).cpu().numpy()
+
+    return starts, probs
+
+def save_results(path, starts, probs, window_size=BUFFER_SIZE):
+    predictions = probs.argmax(axis=1)
+    results = pd.DataFrame({
+        'window': np.arange(len(starts)),
+        'start_sample': starts,
+        'end_sample': starts + window_size,
+        'prediction': predictions,
+        'label': np.array(LABELS)[predictions],
+    })
+    for i, label in enumerate(LABELS):
+        results[f'prob_{label.lower()}'] = probs[:, i]
+    results.to_csv(path, index=False)
+    return results
+
+def load_results(path):
+    return pd.read_csv(path)
 
 # ------------------------
-# Inference + Plot Loop
+# Replay Plot
 # ------------------------
-for i in range(num_chunks):
-    chunk = df[i * BUFFER_SIZE:(i + 1) * BUFFER_SIZE]
-    chunk_tensor = torch.tensor(chunk.T[np.newaxis, ...], dtype=torch.float32).to(DEVICE)
-
-    # Predict
-    with torch.no_grad():
-        output = model(chunk_tensor)
-        prediction = torch.argmax(output, dim=1).item()
-        label_str = "GOOD" if prediction == 1 else "BAD"
-
-    # Update Plot
-    for j in range(3):  # x, y, z
-        lines[j].set_data(np.arange(BUFFER_SIZE), chunk[:, j])
-        axs[j].set_xlim(0, BUFFER_SIZE)
-
-    # Set live prediction in the figure title
-    fig.suptitle(f"Frame {i + 1} Prediction: {label_str}", fontsize=16, color='green' if label_str == "GOOD" else 'red')
-
-    plt.pause(0.5)
-
-plt.ioff()
-plt.show()
+def replay(samples, results, interval=0.5):
+    """Animate precomputed predictions over the recording, no inference in the loop"""
+    plt.ion()
+    fig, axs = plt.subplots(3, 1, figsize=(10, 6), sharex=True)
+    lines = []
+
+    for ax in axs:
+        ax.set_ylim(-1.5, 1.5)  # Adjust based on sensor range
+        line, = ax.plot([], [], lw=2)
+        lines.append(line)
+
+    axs[-1].set_xlabel("Sample")
+    plt.tight_layout()
+
+    for row in results.itertuples(index=False):
+        chunk = samples[row.start_sample:row.end_sample]
+        window_size = row.end_sample - row.start_sample
+
+        # Update Plot
+        for j in range(3):  # x, y, z
+            lines[j].set_data(np.arange(window_size), chunk[:, j])
+            axs[j].set_xlim(0, window_size)
+
+        # Set live prediction in the figure title
+        fig.suptitle(f"Frame {row.window + 1} Prediction: {row.label}", fontsize=16,
+                     color='green' if row.label == "GOOD" else 'red')
+
+        plt.pause(interval)
+
+    plt.ioff()
+    plt.show()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify a recording with MotionDetection in sliding windows")
+    parser.add_argument("csv_path", nargs="?", default=csv_path)
+    parser.add_argument("--model", default=MODEL_PATH,
+                        help="state dict, exported artifact (.pt/.onnx), motion_features classifier (.npz) "
+                             "or \"auto\" for the fastest exported one")
+    parser.add_argument("--window", type=int, default=BUFFER_SIZE, help="samples per window")
+    parser.add_argument("--hop", type=int, default=HOP, help="samples between window starts")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--fir", action="store_true",
+                        help="run the recording through the sensor's FIR filter first (for models trained with --fir)")
+    parser.add_argument("--output", help="predictions CSV (default: <recording>_predictions.csv)")
+    parser.add_argument("--results", help="replay an existing predictions CSV instead of running the model")
+    parser.add_argument("--replay", action="store_true", help="animate the predictions after scoring")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds per frame in the replay")
+    args = parser.parse_args(argv)
+
+    samples = load_samples(require(args.csv_path, "recording"))
+
+    if args.results:
+        results = load_results(args.results)
+    else:
+        if args.model != "auto":
+            require(args.model, "model")
+        model = load_model(args.model, args.window, args.batch_size)
+        scored = fir_filter(samples).astype(np.float32) if args.fir else samples
+        starts, probs = classify_windows(model, scored, args.window, args.hop, args.batch_size)
+        output = args.output or os.path.splitext(args.csv_path)[0] + "_predictions.csv"
+        results = save_results(output, starts, probs, args.window)
+        print(f"Scored {len(results)} windows, {int((results['prediction'] == 1).sum())} GOOD. Saved to \"{output}\"")
+
+    if args.replay or args.results:
+        replay(samples, results, args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from ring_buffer import SampleRingBuffer
+
+EDGE = 2  # conv2 outputs at each end of a window that see the zero padding
+
+
+class StreamingMotionDetection:
+    """
+    Incremental inference for MotionDetection over a sliding window.
+
+    Both convolutions are stride 1, kernel 3, padding 1, so the conv2 activation at
+    time t depends only on inputs t-2..t+2. Inside a window those activations are
+    the same for every window that contains them and are computed once, as samples
+    arrive. Only the two positions at each end of the window see the zero padding,
+    so those are recomputed per hop from 4 input samples. The average pool becomes
+    a running sum over the cached activations.
+
+    update() returns the same logits as model(window) for the newest `window_size`
+    samples (up to float rounding) at O(new samples) cost.
+    """
+
+    def __init__(self, model, window_size=128, resync_every=None):
+        self.model = model
+        self.window_size = window_size
+
+        conv1, relu1, conv2, relu2, pool, flatten, linear = model.model
+        for conv in (conv1, conv2):
+            if conv.kernel_size != (3,) or conv.stride != (1,) or conv.padding != (1,):
+                raise ValueError("StreamingMotionDetection needs kernel 3, stride 1, padding 1 convolutions")
+        if window_size < 2 * EDGE + 1:
+            raise ValueError(f"window_size must be at least {2 * EDGE + 1}")
+
+        self.conv1 = conv1
+        self.conv2 = conv2
+        self.linear = linear
+        self.padded_stack = nn.Sequential(conv1, relu1, conv2, relu2)
+        self.channels = conv2.out_channels
+
+        # Interior conv2 positions of the newest window
+        self.interior = window_size - 2 * EDGE
+        self.resync_every = resync_every or self.interior
+
+        self.raw = SampleRingBuffer(window_size, channels=conv1.in_channels, dtype=np.float32)
+        self.activations = SampleRingBuffer(self.interior, channels=self.channels, dtype=np.float32)
+        self._sum = np.zeros(self.channels, dtype=np.float64)
+        self._since_resync = 0
+
+    def reset(self):
+        self.raw.clear()
+        self.activations.clear()
+        self._sum[:] = 0
+        self._since_resync = 0
+
+    def _interior_activations(self, x):
+        """conv2 activations without padding for a (T, C) block of inputs"""
+        x = torch.from_numpy(np.ascontiguousarray(x.T))[np.newaxis]
+        h = F.relu(F.conv1d(x, self.conv1.weight, self.conv1.bias))
+        h = F.relu(F.conv1d(h, self.conv2.weight, self.conv2.bias))
+        return h[0].T.numpy()
+
+    def _add_activations(self, new):
+        k = len(new)
+        if k == 0:
+            return
+
+        cap = self.activations.capacity
+        if k >= cap:
+            self._sum = new[-cap:].sum(axis=0, dtype=np.float64)
+        else:
+            overflow = len(self.activations) + k - cap
+            if overflow > 0:
+                first = self.activations.first_index
+                self._sum -= self.activations.window(first, first + overflow).sum(axis=0, dtype=np.float64)
+            self._sum += new.sum(axis=0, dtype=np.float64)
+        self.activations.extend(new)
+
+        # Re-sum from the cache now and then so rounding errors cannot build up
+        self._since_resync += k
+        if self._since_resync >= self.resync_every:
+            self._sum = self.activations.latest().sum(axis=0, dtype=np.float64)
+            self._since_resync = 0
+
+    @torch.no_grad()
+    def update(self, samples):
+        """
+        Feed new (N, 3) samples (already converted to g). Returns (1, num_classes)
+        logits for the newest window, or None until a full window has arrived.
+        """
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1, self.raw.channels)
+        if len(samples):
+            # The 4 previous samples are needed to finish activations that straddle the hop
+            tail = self.raw.latest(2 * EDGE)
+            block = np.concatenate([tail, samples])
+            if len(block) > 2 * EDGE:
+                self._add_activations(self._interior_activations(block))
+            self.raw.extend(samples)
+
+        total = self.raw.total
+        if total < self.window_size:
+            return None
+
+        # Window edges, recomputed with the model's own zero padding
+        start = total - self.window_size
+        head = torch.from_numpy(np.array(self.raw.window(start, start + 2 * EDGE)).T)[np.newaxis]
+        tail = torch.from_numpy(np.array(self.raw.latest(2 * EDGE)).T)[np.newaxis]
+        edges = (self.padded_stack(head)[0, :, :EDGE].sum(dim=1, dtype=torch.float64) +
+                 self.padded_stack(tail)[0, :, -EDGE:].sum(dim=1, dtype=torch.float64))
+
+        pooled = (torch.from_numpy(self._sum) + edges) / self.window_size
+        return self.linear(pooled.to(torch.float32)[np.newaxis])
@@ -0,0 +1,178 @@
+import argparse
+import csv
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from data_paths import dataset_path, require
+
+GOOD_CSV = dataset_path("good_data.csv")
+BAD_CSV = dataset_path("bad_data.csv")
+WINDOW_SIZES = [64, 96, 128, 192]
+HOPS = [16, 32]
+WIDTHS = [8, 16, 32]
+LEARNING_RATES = [1e-3, 3e-3]
+BATCH_SIZE = 64
+EPOCHS = 15
+SEED = 0
+LATENCY_ITERATIONS = 200
+# Every recording is cut into this many contiguous time blocks: the last is the
+# test set, the one before it the validation set and the rest train
+BLOCKS = 5
+
+COLUMNS = ['window', 'hop', 'width', 'lr', 'val_accuracy', 'test_accuracy', 'latency_us', 'params',
+           'windows', 'train_sec']
+
+
+def grid(windows=WINDOW_SIZES, hops=HOPS, widths=WIDTHS, learning_rates=LEARNING_RATES):
+    return [dict(window=w, hop=h, width=c, lr=lr)
+            for w, h, c, lr in itertools.product(windows, hops, widths, learning_rates)]
+
+
+def _init_worker():
+    # One single-threaded torch per worker process; the pool provides the parallelism
+    import torch
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(1)
+
+
+def block_split(good=GOOD_CSV, bad=BAD_CSV, window_size=128, hop=32, blocks=BLOCKS):
+    """
+    (windows, labels) train/val/test arrays from a time-block holdout: windows
+    that straddle a block boundary are dropped, so no sample is in two splits
+    however much neighbouring windows overlap. A random per-window split would
+    leak more of the test samples into training the smaller the hop.
+    """
+    from recording_cache import load_recording
+    from motion_cv import fold_windows, SPLIT_BLOCK
+
+    recordings = [(load_recording(good), 1), (load_recording(bad), 0)]
+    windows, labels, block = fold_windows(recordings, blocks, SPLIT_BLOCK, window_size, hop)
+    return [(windows[keep], labels[keep])
+            for keep in (block < blocks - 2, block == blocks - 2, block == blocks - 1)]
+
+
+def run_config(config, good=GOOD_CSV, bad=BAD_CSV, batch_size=BATCH_SIZE, epochs=EPOCHS, seed=SEED):
+    """Train one MotionDetection variant and measure its held-out accuracy and batch-1 latency"""
+    import torch
+    import torch.nn as nn
+    from motionDetection import MotionDetection
+    from motion_training import TensorLoader, train_model, validate_model, seed_everything
+    from inference_profiler import time_calls_ns
+
+    seed_everything(seed)
+    train, val, test = block_split(good, bad, config['window'], config['hop'])
+    train_dl, val_dl, test_dl = [
+        TensorLoader(torch.from_numpy(windows), torch.from_numpy(labels), batch_size, shuffle=shuffle,
+                     generator=torch.Generator().manual_seed(seed))
+        for (windows, labels), shuffle in [(train, True), (val, False), (test, False)]]
+
+    model = MotionDetection(input_channels=3, seq_len=config['window'], width=config['width'])
+    loss_function = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=config['lr'])
+    cpu = torch.device("cpu")  # where the model was built, whatever motion_training.DEVICE is
+    start = time.perf_counter()
+    train_model(model, train_dl, val_dl, loss_function, optimizer, epochs, verbose=False, device=cpu)
+    train_sec = time.perf_counter() - start
+
+    model.eval()
+    _, val_accuracy = validate_model(model, val_dl, loss_function, verbose=False, device=cpu)
+    _, test_accuracy = validate_model(model, test_dl, loss_function, verbose=False, device=cpu)
+
+    x = torch.randn(1, 3, config['window'])
+    with torch.no_grad():
+        latency_ns = np.median(time_calls_ns(lambda: model(x), 20, LATENCY_ITERATIONS))
+
+    return dict(config, val_accuracy=val_accuracy, test_accuracy=test_accuracy,
+                latency_us=latency_ns / 1e3, params=sum(p.numel() for p in model.parameters()),
+                windows=len(train[1]) + len(val[1]) + len(test[1]), train_sec=train_sec)
+
+
+def prepare_caches(good=GOOD_CSV, bad=BAD_CSV):
+    """Build the recording caches once up front, so workers never write the same cache file"""
+    from recording_cache import load_manifest
+    load_manifest([(good, 1), (bad, 0)])
+
+
+def sweep(configs, good=GOOD_CSV, bad=BAD_CSV, batch_size=BATCH_SIZE, epochs=EPOCHS, seed=SEED,
+          max_workers=None):
+    """Every config trained in its own single-threaded worker process; results in completion order"""
+    prepare_caches(good, bad)
+    max_workers = max_workers or os.cpu_count()
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(run_config, config, good, bad, batch_size, epochs, seed) for config in configs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(configs)}] window {result['window']} hop {result['hop']} "
+                  f"width {result['width']} lr {result['lr']:g}: {result['val_accuracy']:.1f}% "
+                  f"in {result['latency_us']:.0f} us")
+    return results
+
+
+def pareto_front(results, accuracy='val_accuracy', cost='latency_us'):
+    """Results no other result beats on both accuracy and cost, cheapest first"""
+    front = []
+    for result in sorted(results, key=lambda r: (r[cost], -r[accuracy])):
+        if not front or result[accuracy] > front[-1][accuracy]:
+            front.append(result)
+    return front
+
+
+def print_table(results, front=()):
+    front_ids = {id(r) for r in front}
+    print(f"{'window':>6} {'hop':>4} {'width':>5} {'lr':>7} {'val %':>6} {'test %':>6} {'us/win':>7} "
+          f"{'params':>7} {'train s':>7}")
+    for r in sorted(results, key=lambda r: (-r['val_accuracy'], r['latency_us'])):
+        print(f"{r['window']:6d} {r['hop']:4d} {r['width']:5d} {r['lr']:7.0e} {r['val_accuracy']:6.1f} "
+              f"{r['test_accuracy']:6.1f} {r['latency_us']:7.0f} {r['params']:7d} {r['train_sec']:7.1f}"
+              f"{'  *' if id(r) in front_ids else ''}")
+
+
+def save_csv(results, path, front=()):
+    front_ids = {id(r) for r in front}
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS + ['pareto'])
+        writer.writeheader()
+        for r in results:
+            writer.writerow(dict({k: r[k] for k in COLUMNS}, pareto=int(id(r) in front_ids)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep MotionDetection window size, hop, width and learning rate "
+                                                 "for validation accuracy against inference cost")
+    parser.add_argument("--good", default=GOOD_CSV)
+    parser.add_argument("--bad", default=BAD_CSV)
+    parser.add_argument("--windows", type=int, nargs='+', default=WINDOW_SIZES)
+    parser.add_argument("--hops", type=int, nargs='+', default=HOPS)
+    parser.add_argument("--widths", type=int, nargs='+', default=WIDTHS)
+    parser.add_argument("--lrs", type=float, nargs='+', default=LEARNING_RATES)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--output", help="write the results to this CSV")
+    args = parser.parse_args(argv)
+
+    require(args.good, "GOOD recording")
+    require(args.bad, "BAD recording")
+    configs = grid(args.windows, args.hops, args.widths, args.lrs)
+    print(f"Training {len(configs)} configurations on {args.workers or os.cpu_count()} workers")
+    start = time.perf_counter()
+    results = sweep(configs, args.good, args.bad, args.batch_size, args.epochs, args.seed, args.workers)
+    print(f"Sweep took {time.perf_counter() - start:.1f} s")
+
+    front = pareto_front(results)
+    print_table(results, front)
+    print("* Pareto front: no other configuration is both more accurate and cheaper per window")
+    if args.output:
+        save_csv(results, args.output, front)
+        print(f"Saved to \"{args.output}\"")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import numpy as np
-import time
 import torch
 import matplotlib.pyplot as plt
 from sklearn.metrics import confusion_matrix
 import seaborn as sns
 
+from inference_profiler import BATCH_SIZES, profile_latency, layer_breakdown, print_report
+
 DEVICE = torch.device("cuda:0") if torch.cuda.is_available() else torch.device("cpu")
 
 # Test function with confusion matrix (percentage) & model saving
@@ -16,7 +17,6 @@ def test_model(model, test_loader):
     num_correct = 0
     inputs = None
     true_labels = None
-    batch_size = 8
 
     with torch.no_grad():
         for inputs, true_labels in test_loader:
@@ -26,7 +26,7 @@ def test_model(model, test_loader):
             _, predicted_labels = torch.max(outputs, 1)
             labels += true_labels.cpu()
             predictions += predicted_labels.cpu()
-            num_total += batch_size
+            num_total += true_labels.size(0)
             num_correct += (predicted_labels == true_labels).sum().item()
 
     matrix = confusion_matrix(labels, predictions)
@@ -41,21 +41,18 @@ def test_model(model, test_loader):
 
     print(f"Test data accuracy: {(num_correct / num_total) * 100}%")
 
-# Function to evaluate single sample inference time on test dataset
-def test_single_sample_inference(model, test_loader):
+# Inference latency on the CPU with real test windows: percentiles per batch size
+# and thread count, plus where the time goes layer by layer
+def profile_inference(model, test_loader, batch_sizes=BATCH_SIZES, thread_counts=(1, None)):
     signal, _ = next(iter(test_loader))
-    signal_cpu = signal.to(torch.device("cpu"))
-    model_cpu = model.to(torch.device("cpu"))
-    start_time = time.time()
-    with torch.no_grad():
-        _ = model_cpu(signal_cpu)
-    end_time = time.time()
-
-    elapsed_time = end_time - start_time
-    #print(f"Elapsed time for a single inference: {elapsed_time}")
-    print(f"Time Elapsed: {elapsed_time // 60} min {elapsed_time % 60} sec")
-
+    signal = signal.cpu()  # the tensor loader keeps batches on DEVICE
+    model_cpu = model.to(torch.device("cpu")).eval()
+    window_size = signal.shape[-1]
+    latency = profile_latency(model_cpu, batch_sizes, thread_counts, window_size, sample=signal)
+    layers = layer_breakdown(model_cpu, 1, window_size, sample=signal)
+    print_report(latency, layers)
+    return latency, layers
 
 # Test the model
 #test_model()
-#test_single_sample_inference()
+#profile_inference()
@@ -1,57 +1,129 @@
+import argparse
 import torch
-import torchaudio
 import numpy as np
-import os
-from scipy.signal import butter, filtfilt
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader, random_split
+from torch.utils.data import DataLoader, random_split
 
 # from motionDataset import MotionDataset
 from motionDataset import AccelDataset
 
 from motionDetection import MotionDetection
+from augment import BatchAugment
 
 from time import time
 
-from motion_test import test_model, test_single_sample_inference
+from motion_test import test_model, profile_inference
+from data_paths import dataset_path, model_path, require
 
 # Ensure GPU/CPU compatibility
 DTYPE = torch.float
 DEVICE = torch.device("cuda:0") if torch.cuda.is_available() else torch.device("cpu")
-print(DEVICE)
 
-# Load dataset
-# motionDataset = motionDataset()
-buffer_size = 120
-dopplerDataset = AccelDataset("../dataset/good_data.csv", "../dataset/bad_data.csv", buffer_size)
+GOOD_CSV = dataset_path("good_data.csv")
+BAD_CSV = dataset_path("bad_data.csv")
+MODEL_PATH = model_path("motion_model.pth")
+# Must match the windows motion_run.py (BUFFER_SIZE) and live_ML.py (BUFFER_SIZE_MODEL) infer on
+BUFFER_SIZE = 128
+BATCH_SIZE = 8  # --loader dataloader default
+FAST_BATCH_SIZE = 256  # --loader tensor default; large batches are where it beats DataLoader
+LEARNING_RATE = 1e-3
+EPOCHS = 15
+SEED = 0
 
 # Split dataset: 70% train, 15% val, 15% test
-train_size = int(0.7 * len(dopplerDataset))
-val_size = int(0.15 * len(dopplerDataset))
-test_size = len(dopplerDataset) - train_size - val_size
-train_set, val_set, test_set = random_split(
-    dopplerDataset, [train_size, val_size, test_size]
-)
-
-# Create DataLoaders
-batch_size = 8
-train_dl = DataLoader(train_set, batch_size=batch_size, shuffle=True, drop_last=True)
-val_dl = DataLoader(val_set, batch_size=batch_size, shuffle=True, drop_last=True)
-test_dl = DataLoader(test_set, batch_size=batch_size, shuffle=True, drop_last=True)
-
-# Initialize model, loss function, and optimizer
-learning_rate = 1e-3
-model = MotionDetection().to(DEVICE)
-# loss_function = nn.BCELoss()
-loss_function = nn.CrossEntropyLoss()
-optimizer = optim.Adam(params=model.parameters(), lr=learning_rate)
+def make_loaders(dataset, batch_size=BATCH_SIZE):
+    train_size = int(0.7 * len(dataset))
+    val_size = int(0.15 * len(dataset))
+    test_size = len(dataset) - train_size - val_size
+    train_set, val_set, test_set = random_split(
+        dataset, [train_size, val_size, test_size]
+    )
+
+    train_dl = DataLoader(train_set, batch_size=batch_size, shuffle=True, drop_last=True)
+    val_dl = DataLoader(val_set, batch_size=batch_size, shuffle=True, drop_last=True)
+    test_dl = DataLoader(test_set, batch_size=batch_size, shuffle=True, drop_last=True)
+    return train_dl, val_dl, test_dl
+
+
+class TensorLoader:
+    """
+    Batches straight from in-memory tensors, for datasets that fit in memory.
+
+    Stands in for a DataLoader: one randperm per epoch and one indexed gather per
+    batch instead of fetching and collating items one by one. Pass a seeded
+    generator to shuffle reproducibly.
+    """
+
+    def __init__(self, data, labels, batch_size=FAST_BATCH_SIZE, shuffle=False, generator=None, drop_last=False):
+        self.data = data
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.generator = generator
+        self.drop_last = drop_last
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.data) // self.batch_size
+        return -(-len(self.data) // self.batch_size)
+
+    def __iter__(self):
+        n = len(self.data)
+        if self.shuffle:
+            order = torch.randperm(n, generator=self.generator).to(self.data.device)
+        else:
+            order = None
+        for i in range(len(self)):
+            start = i * self.batch_size
+            if order is None:
+                yield self.data[start:start + self.batch_size], self.labels[start:start + self.batch_size]
+            else:
+                index = order[start:start + self.batch_size]
+                yield self.data[index], self.labels[index]
+
+
+# Same 70/15/15 split as make_loaders, gathered once into contiguous tensors on DEVICE
+def make_tensor_loaders(dataset, batch_size=FAST_BATCH_SIZE, seed=SEED):
+    generator = torch.Generator().manual_seed(seed)
+    order = torch.randperm(len(dataset), generator=generator)
+    train_size = int(0.7 * len(dataset))
+    val_size = int(0.15 * len(dataset))
+    splits = [order[:train_size], order[train_size:train_size + val_size], order[train_size + val_size:]]
+
+    data = torch.as_tensor(dataset.data, dtype=DTYPE)
+    train, val, test = [(data[index].contiguous().to(DEVICE), dataset.labels[index].to(DEVICE)) for index in splits]
+
+    train_dl = TensorLoader(*train, batch_size=batch_size, shuffle=True, generator=generator)
+    val_dl = TensorLoader(*val, batch_size=batch_size)
+    test_dl = TensorLoader(*test, batch_size=batch_size)
+    return train_dl, val_dl, test_dl
+
+
+def seed_everything(seed=SEED):
+    """Same weights, split and batch order on every run with the same seed (on one device type)"""
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    if DEVICE.type == "cuda":
+        torch.backends.cudnn.deterministic = True
+        torch.backends.cudnn.benchmark = False
+
+
+def compile_model(model):
+    """torch.compile'd model sharing model's parameters, or model itself if compiling is not available"""
+    try:
+        return torch.compile(model)
+    except Exception as e:
+        print(f"torch.compile unavailable, training eagerly: {e}")
+        return model
 
 # Training function
-def train_model():
+def train_model(model, train_dl, val_dl, loss_function, optimizer, epochs=EPOCHS, verbose=True, augment=None,
+                device=DEVICE):
+    """Batches are moved to `device`, which must be where the model is"""
     train_loss_history = []
     train_accuracy_history = []
-    for epoch in range(15):
+    for epoch in range(epochs):
         start_time = time()
 
         # =====================================================================
@@ -64,7 +136,9 @@ def train_model():
         num_total = 0
 
         for inputs, true_labels in train_dl:
-            inputs, true_labels = inputs.to(DEVICE), true_labels.to(DEVICE)
+            inputs, true_labels = inputs.to(device), true_labels.to(device)
+            if augment is not None:
+                inputs = augment(inputs)  # whole batch at once, see augment.py
             # true_labels = true_labels.squeeze(1)
             optimizer.zero_grad()
             outputs = model(inputs)
@@ -78,17 +152,22 @@ def train_model():
 
         train_loss_history.append(sum(epoch_loss_history) / len(epoch_loss_history))
         train_accuracy_history.append(100 * num_correct / num_total)
+        elapsed = time() - start_time
 
-        torch.cuda.empty_cache()
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
 
-        print(f"Epoch: {epoch}")
-        print(f"Training loss: {train_loss_history[-1]}")
-        print(f"Training accuracy: {train_accuracy_history[-1]}")
-        validate_model(model)
+        if verbose:
+            print(f"Epoch: {epoch}")
+            print(f"Training loss: {train_loss_history[-1]}")
+            print(f"Training accuracy: {train_accuracy_history[-1]}")
+            print(f"Training throughput: {num_total / elapsed:.0f} samples/s ({elapsed:.3f} s)")
+            validate_model(model, val_dl, loss_function, device=device)
+    return train_loss_history, train_accuracy_history
 
 
 # Validation function
-def validate_model(model):
+def validate_model(model, val_dl, loss_function, verbose=True, device=DEVICE):
 
     # Variables to assess performance
     epoch_loss_history = []
@@ -99,7 +178,7 @@ def validate_model(model):
 
     with torch.no_grad():
         for inputs, true_labels in val_dl:
-            inputs, true_labels = inputs.to(DEVICE), true_labels.to(DEVICE)
+            inputs, true_labels = inputs.to(device), true_labels.to(device)
             # true_labels = true_labels.squeeze(1)
             outputs = model(inputs)
             loss = loss_function(outputs, true_labels)
@@ -110,17 +189,68 @@ def validate_model(model):
 
     validation_loss_history.append(sum(epoch_loss_history) / len(epoch_loss_history))
     validation_accuracy_history.append(100 * num_correct / num_total)
-    print(f"Validation loss: {validation_loss_history[-1]}")
-    print(f"Validation accuracy: {validation_accuracy_history[-1]} %")
+    if verbose:
+        print(f"Validation loss: {validation_loss_history[-1]}")
+        print(f"Validation accuracy: {validation_accuracy_history[-1]} %")
+    return validation_loss_history[-1], validation_accuracy_history[-1]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train MotionDetection on the good/bad motion recordings")
+    parser.add_argument("--good", default=GOOD_CSV, help="recording of good motion")
+    parser.add_argument("--bad", default=BAD_CSV, help="recording of bad motion")
+    parser.add_argument("--window", type=int, default=BUFFER_SIZE, help="samples per window")
+    parser.add_argument("--hop", type=int, help="samples between window starts (default: --window)")
+    parser.add_argument("--width", type=int, default=16, help="channels of the first convolution")
+    parser.add_argument("--loader", choices=["tensor", "dataloader"], default="tensor",
+                        help="batch in-memory tensors directly, or go through torch's DataLoader")
+    parser.add_argument("--batch-size", type=int,
+                        help=f"default {FAST_BATCH_SIZE} with the tensor loader, which is fastest with large "
+                             f"batches, or {BATCH_SIZE} with DataLoader; raise --lr or --epochs to match")
+    parser.add_argument("--lr", type=float, default=LEARNING_RATE)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--fir", action="store_true",
+                        help="train on recordings run through the sensor's FIR filter (serve with --fir too)")
+    parser.add_argument("--augment", action="store_true",
+                        help="randomly rotate, scale, warp, shift and add noise to training batches")
+    parser.add_argument("--compile", action="store_true",
+                        help="train a torch.compile'd model (pays off for long runs on multi-core/GPU hosts)")
+    parser.add_argument("--output", default=MODEL_PATH, help="where to save the trained state dict")
+    args = parser.parse_args(argv)
+    if args.batch_size is None:
+        args.batch_size = FAST_BATCH_SIZE if args.loader == "tensor" else BATCH_SIZE
+
+    require(args.good, "GOOD recording")
+    require(args.bad, "BAD recording")
+    print(DEVICE)
+    seed_everything(args.seed)
+
+    # Load dataset
+    dataset = AccelDataset(args.good, args.bad, args.window, hop=args.hop, fir=args.fir)
+    if args.loader == "tensor":
+        train_dl, val_dl, test_dl = make_tensor_loaders(dataset, args.batch_size, args.seed)
+    else:
+        train_dl, val_dl, test_dl = make_loaders(dataset, args.batch_size)
+
+    # Initialize model, loss function, and optimizer
+    model = MotionDetection(input_channels=3, seq_len=args.window, width=args.width).to(DEVICE)
+    # loss_function = nn.BCELoss()
+    loss_function = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(params=model.parameters(), lr=args.lr)
+
+    # Train and validate the model
+    print("Start Model Training")
+    augment = BatchAugment(generator=torch.Generator().manual_seed(args.seed)) if args.augment else None
+    train_model(compile_model(model) if args.compile else model, train_dl, val_dl, loss_function, optimizer,
+                args.epochs, augment=augment)
 
-# Train and validate the model
-print("Start Model Training")
-train_model()
+    # Test model
+    print("Start Model Testing")
+    test_model(model, test_dl)
 
-# Test model
-print("Start Model Testing")
-test_model(model, test_dl)
+    # Profile inference latency on CPU
+    profile_inference(model, test_dl)
+    torch.save(model.state_dict(), args.output)
 
-# Test single inference time on CPU
-test_single_sample_inference(model, test_dl)
-torch.save(model.state_dict(), "motion_model.pth")
+if __name__ == "__main__":
+    main()
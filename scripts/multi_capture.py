@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from bleak import BleakClient, BleakScanner
+
+from frame_decoder import FrameDecoder
+from ring_buffer import SampleRingBuffer
+from capture_log import CaptureLogWriter
+from link_telemetry import LinkTelemetry
+
+EARWORM_NAME = "earworm_ble"
+UART_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+CAPTURE_CAPACITY = 4096  # samples kept in memory per device
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class DeviceSession:
+    """Everything that belongs to one connected sensor: decoder state, samples and stats"""
+
+    def __init__(self, device, capacity=CAPTURE_CAPACITY, capture_log=None, sample_rate=50):
+        self.device = device
+        self.address = device.address
+        self.name = device.name
+        self.decoder = FrameDecoder()
+        self.samples = SampleRingBuffer(capacity)
+        self.stats = LinkTelemetry(fs=sample_rate)
+        self.capture_log = capture_log
+        self.client = None
+
+    def notification_handler(self, sender, data):
+        # Runs on the event loop for every notification of every device, so keep it to
+        # one vectorized decode and one buffer write
+        try:
+            arrival = time.time()
+            frames = self.decoder.feed(data)
+            self.samples.extend(frames)
+            if self.capture_log is not None:
+                self.capture_log.append(frames, arrival)
+            self.stats.record(len(data), len(frames), arrival)
+        except Exception as e:
+            logger.error(f"Error in notification handler for {self.address}: {e}")
+
+
+async def discover_devices(names=(EARWORM_NAME,), addresses=(), timeout=5.0):
+    """Every advertising device whose name or address is in the given lists"""
+    logger.info("Scanning for BLE devices...")
+    devices = await BleakScanner.discover(timeout=timeout)
+    addresses = {address.upper() for address in addresses}
+    matched = [device for device in devices
+               if device.name in names or device.address.upper() in addresses]
+    for device in matched:
+        logger.info(f"Found target device: {device.name} ({device.address})")
+    return matched
+
+
+async def start_session(session, connect_lock):
+    client = BleakClient(session.address)
+    # Connection setup is serialised (BlueZ only handles one at a time); streaming is not
+    async with connect_lock:
+        await client.connect()
+    logger.info(f"Connected to {session.name} ({session.address})")
+    session.stats.mtu = client.mtu_size
+    await client.start_notify(UART_UUID, session.notification_handler)
+    session.client = client
+    return session
+
+
+async def stop_session(session):
+    if session.client is None:
+        return
+    try:
+        await session.client.stop_notify(UART_UUID)
+        await session.client.disconnect()
+    except Exception as e:
+        logger.error(f"Disconnect from {session.address} failed: {e}")
+    finally:
+        if session.capture_log is not None:
+            session.capture_log.close()
+        logger.info(f"Disconnected from {session.address}")
+
+
+def log_stats(sessions):
+    total = 0.0
+    for session in sessions:
+        total += session.stats.snapshot().get('samples_per_sec', 0.0)
+        logger.info(f"{session.address}: {session.stats.samples} samples, {session.stats.summary()}")
+    logger.info(f"Aggregate: {total:.1f} samples/s from {len(sessions)} devices")
+
+
+async def capture_devices(devices, capture_time_sec=60.0, log_prefix=None, stats_interval=5.0,
+                          capacity=CAPTURE_CAPACITY, sample_rate=50):
+    """
+    Connect to every device and stream from all of them on the current event loop.
+    A device that fails to connect is logged and skipped. Returns the sessions that
+    were streaming.
+    """
+    start_time = datetime.now().astimezone()
+    sessions = []
+    for device in devices:
+        capture_log = None
+        if log_prefix is not None:
+            suffix = device.address.replace(':', '')
+            capture_log = CaptureLogWriter(f"{log_prefix}-{suffix}", fs=sample_rate,
+                                           timezone=start_time.tzname(), address=device.address,
+                                           start_time=start_time)
+        sessions.append(DeviceSession(device, capacity, capture_log, sample_rate))
+
+    connect_lock = asyncio.Lock()
+    results = await asyncio.gather(*(start_session(s, connect_lock) for s in sessions),
+                                   return_exceptions=True)
+    streaming = []
+    for session, result in zip(sessions, results):
+        if isinstance(result, Exception):
+            logger.error(f"Connection to {session.address} failed: {result}")
+            if session.capture_log is not None:
+                session.capture_log.close()
+        else:
+            streaming.append(session)
+
+    # Keeps each log on disk within a few seconds even if its device goes quiet
+    flushers = [asyncio.create_task(s.capture_log.flush_periodically())
+                for s in streaming if s.capture_log is not None]
+    try:
+        deadline = time.monotonic() + capture_time_sec
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(stats_interval, deadline - time.monotonic()))
+            log_stats(streaming)
+    finally:
+        for flusher in flushers:
+            flusher.cancel()
+        await asyncio.gather(*(stop_session(s) for s in streaming))
+
+    return streaming
+
+
+async def run(names, addresses, capture_time_sec, log_prefix):
+    devices = await discover_devices(names, addresses)
+    if not devices:
+        logger.error("No target BLE devices found.")
+        return []
+    return await capture_devices(devices, capture_time_sec, log_prefix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capture from several earworm sensors at once")
+    parser.add_argument("--name", action="append", help="device name to match (repeatable)")
+    parser.add_argument("--address", action="append", default=[], help="device address to match (repeatable)")
+    parser.add_argument("--time", type=float, default=60.0, help="capture length in seconds")
+    parser.add_argument("--log-prefix", help="write one capture log per device with this prefix")
+    args = parser.parse_args(argv)
+
+    names = args.name if args.name else ([] if args.address else [EARWORM_NAME])
+    asyncio.run(run(names, args.address, args.time, args.log_prefix))
+
+
+if __name__ == "__main__":
+    main()
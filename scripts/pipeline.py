@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# What a stage does when its input queue is full
+BLOCK = "block"              # wait for room (backpressure on the previous stage)
+DROP_OLDEST = "drop_oldest"  # discard the oldest queued item to make room
+DROP_NEWEST = "drop_newest"  # discard the item being added
+
+
+class Stage:
+    """
+    One step of a Pipeline: a function applied to every item of its input queue.
+
+    func may be a plain function or a coroutine function. Set in_executor for
+    CPU-heavy functions so they run in the pipeline's executor instead of on the
+    event loop. A func that returns None consumes the item without passing anything on.
+    """
+
+    def __init__(self, name, func, maxsize=64, policy=BLOCK, in_executor=False):
+        if policy not in (BLOCK, DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.name = name
+        self.func = func
+        self.maxsize = maxsize
+        self.policy = policy
+        self.in_executor = in_executor
+        self.queue = None
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.busy_time = 0.0
+
+
+class Pipeline:
+    """
+    Stages connected by bounded asyncio queues, all on one event loop.
+
+    submit() is what the BLE notification callback calls: it never waits, so a slow
+    consumer can only cause drops at the head of the pipeline (which is why the
+    first stage may not use the BLOCK policy), never a stalled callback. Anything
+    that must see every item, like a FrameDecoder carrying partial frames, belongs
+    in the callback before submit(), not in a stage. The output of the last stage
+    is handed to every sink.
+    """
+
+    def __init__(self, stages, sinks=(), executor=None):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        if stages[0].policy == BLOCK:
+            raise ValueError("The first stage is fed from a callback and cannot use the BLOCK policy")
+        self.stages = stages
+        self.sinks = list(sinks)
+        self.executor = executor
+        self._tasks = []
+
+    def _offer(self, stage, item):
+        """Non-blocking put that applies the stage's drop policy. False if item was dropped."""
+        queue = stage.queue
+        if queue.full():
+            stage.dropped += 1
+            if stage.policy == DROP_NEWEST:
+                return False
+            queue.get_nowait()
+            queue.task_done()
+        queue.put_nowait(item)
+        stage.max_depth = max(stage.max_depth, queue.qsize())
+        return True
+
+    def submit(self, item):
+        return self._offer(self.stages[0], item)
+
+    async def _put(self, stage, item):
+        if stage.policy == BLOCK:
+            await stage.queue.put(item)
+            stage.max_depth = max(stage.max_depth, stage.queue.qsize())
+        else:
+            self._offer(stage, item)
+
+    async def _run_stage(self, index):
+        loop = asyncio.get_running_loop()
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = await stage.queue.get()
+            try:
+                start = time.perf_counter()
+                if stage.in_executor:
+                    result = await loop.run_in_executor(self.executor, stage.func, item)
+                else:
+                    result = stage.func(item)
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                stage.busy_time += time.perf_counter() - start
+                stage.processed += 1
+
+                if result is None:
+                    continue
+                if next_stage is not None:
+                    await self._put(next_stage, result)
+                else:
+                    for sink in self.sinks:
+                        sink(result)
+            except Exception as e:
+                logger.error(f"Error in pipeline stage {stage.name}: {e}")
+            finally:
+                stage.queue.task_done()
+
+    async def start(self):
+        for stage in self.stages:
+            stage.queue = asyncio.Queue(maxsize=stage.maxsize)
+        self._tasks = [asyncio.create_task(self._run_stage(i)) for i in range(len(self.stages))]
+
+    async def stop(self, drain=True):
+        if drain:
+            for stage in self.stages:
+                await stage.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depths(self):
+        return {stage.name: stage.queue.qsize() if stage.queue is not None else 0 for stage in self.stages}
+
+    def stats(self):
+        return {stage.name: {'depth': stage.queue.qsize() if stage.queue is not None else 0,
+                             'max_depth': stage.max_depth,
+                             'capacity': stage.maxsize,
+                             'processed': stage.processed,
+                             'dropped': stage.dropped,
+                             'busy_sec': stage.busy_time}
+                for stage in self.stages}
+
+    async def report(self, interval=5.0):
+        """Log queue depth and drops per stage every `interval` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("Pipeline: " + ", ".join(
+                f"{name} {s['depth']}/{s['capacity']} (max {s['max_depth']}, dropped {s['dropped']})"
+                for name, s in self.stats().items()))
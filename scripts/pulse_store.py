@@ -0,0 +1,98 @@
+import numpy as np
+
+from ring_buffer import SampleRingBuffer
+
+PULSE_CAPACITY = 1 << 16  # readings kept; about 10 minutes at 100 Hz
+
+
+class PulseStore:
+    """
+    Time-ordered pulse sensor readings, bounded by count and optionally by age.
+
+    Timestamps and values live in two SampleRingBuffers, so any range comes back
+    as contiguous NumPy views, found by binary search on the timestamps
+    (np.searchsorted) instead of a scan. Readings older than `max_age` seconds
+    behind the newest are dropped as new ones arrive.
+
+    Safe for one writer (the serial reader coroutine on the BLE event loop) and
+    one reader (the plot thread): values are written before timestamps, and
+    readers go by the timestamp count.
+    Timestamps must not decrease; out-of-order readings are dropped.
+    """
+
+    def __init__(self, capacity=PULSE_CAPACITY, max_age=None, dtype=np.float64):
+        self.max_age = max_age
+        self._times = SampleRingBuffer(capacity, channels=1, dtype=np.float64)
+        self._values = SampleRingBuffer(capacity, channels=1, dtype=dtype)
+        self._oldest = 0  # absolute index of the oldest reading within max_age
+
+    @property
+    def capacity(self):
+        return self._times.capacity
+
+    def _first(self, total):
+        return max(self._oldest, total - self.capacity, 0)
+
+    def __len__(self):
+        total = self._times.total
+        return total - self._first(total)
+
+    def clear(self):
+        self._times.clear()
+        self._values.clear()
+        self._oldest = 0
+
+    def extend(self, timestamps, values):
+        timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+        values = np.asarray(values).ravel()
+        if len(timestamps) != len(values):
+            raise ValueError("timestamps and values must have the same length")
+        if len(timestamps) == 0:
+            return
+
+        # Keep the store sorted so binary search stays valid
+        last = self.last_time()
+        floor = np.maximum.accumulate(np.concatenate([[-np.inf if last is None else last], timestamps]))
+        keep = timestamps >= floor[:-1]
+        if not keep.all():
+            timestamps, values = timestamps[keep], values[keep]
+            if len(timestamps) == 0:
+                return
+
+        self._values.extend(values)
+        self._times.extend(timestamps)
+
+        if self.max_age is not None:
+            total = self._times.total
+            first = self._first(total)
+            cutoff = timestamps[-1] - self.max_age
+            self._oldest = first + int(np.searchsorted(self._times.window(first, total)[:, 0], cutoff))
+
+    def append(self, timestamp, value):
+        self.extend([timestamp], [value])
+
+    def last_time(self):
+        total = self._times.total
+        if total == self._first(total):
+            return None
+        return float(self._times.window(total - 1, total)[0, 0])
+
+    def range(self, start=-np.inf, stop=np.inf):
+        """(timestamps, values) read-only views of readings with start <= t < stop"""
+        total = self._times.total
+        first = self._first(total)
+        times = self._times.window(first, total)[:, 0]
+        lo = first + int(np.searchsorted(times, start, side='left'))
+        hi = first + int(np.searchsorted(times, stop, side='left'))
+        return self._times.window(lo, hi)[:, 0], self._values.window(lo, hi)[:, 0]
+
+    def latest(self, seconds, now=None):
+        """Readings since `seconds` before `now` (default: the newest reading's time)"""
+        if now is None:
+            now = self.last_time()
+            if now is None:
+                return self.range(0, 0)
+        return self.range(now - seconds)
+
+    def all(self):
+        return self.range()
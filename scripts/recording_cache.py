@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# dataset/*.csv schema is time,seconds_elapsed,z,y,x; the cache stores x, y, z in order
+TIME_COLUMN = 'time'
+AXIS_COLUMNS = ['x', 'y', 'z']
+CACHE_VERSION = 1
+
+Recording = namedtuple('Recording', ['path', 'time', 'xyz'])
+
+
+def cache_paths(csv_path, cache_dir=None):
+    """
+    Cache files for a recording. The stem carries a short hash of the CSV's
+    absolute path, so same-named recordings from different directories can
+    share a cache_dir without overwriting each other.
+    """
+    csv_path = os.path.abspath(csv_path)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(csv_path), ".cache")
+    path_hash = hashlib.sha1(csv_path.encode()).hexdigest()[:8]
+    stem = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(csv_path))[0]}-{path_hash}")
+    return {
+        'meta': stem + ".meta.json",
+        'time': stem + ".time.npy",
+        'xyz': stem + ".xyz.npy",
+    }
+
+
+def source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'version': CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def is_cached(csv_path, cache_dir=None):
+    paths = cache_paths(csv_path, cache_dir)
+    if not all(os.path.exists(path) for path in paths.values()):
+        return False
+    with open(paths['meta']) as f:
+        return json.load(f) == source_signature(csv_path)
+
+
+def build_cache(csv_path, cache_dir=None):
+    """Parse the CSV once and write its time and x, y, z columns as .npy files"""
+    import pandas as pd
+
+    paths = cache_paths(csv_path, cache_dir)
+    os.makedirs(os.path.dirname(paths['meta']), exist_ok=True)
+
+    signature = source_signature(csv_path)
+    df = pd.read_csv(csv_path, usecols=[TIME_COLUMN] + AXIS_COLUMNS)
+    columns = {
+        'time': df[TIME_COLUMN].to_numpy(dtype=np.int64),
+        'xyz': np.ascontiguousarray(df[AXIS_COLUMNS].to_numpy(dtype=np.float32)),
+    }
+
+    # The metadata goes last, so a cache is only valid once every column is complete
+    for name, array in columns.items():
+        tmp_path = paths[name] + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, paths[name])
+    with open(paths['meta'], 'w') as f:
+        json.dump(signature, f)
+
+    return paths
+
+
+def ensure_cached(csv_path, cache_dir=None):
+    if not is_cached(csv_path, cache_dir):
+        build_cache(csv_path, cache_dir)
+    return csv_path
+
+
+def load_recording(csv_path, cache_dir=None):
+    """
+    Memory-mapped time (int64, N) and xyz (float32, N x 3) columns of a recording.
+
+    The CSV is only parsed when the cache is missing or the file's mtime or size
+    changed since it was built.
+    """
+    ensure_cached(csv_path, cache_dir)
+    paths = cache_paths(csv_path, cache_dir)
+    return Recording(csv_path,
+                     np.load(paths['time'], mmap_mode='r'),
+                     np.load(paths['xyz'], mmap_mode='r'))
+
+
+def read_manifest(manifest_path):
+    """path,label rows; relative paths are taken relative to the manifest"""
+    import pandas as pd
+
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    df = pd.read_csv(manifest_path)
+    return [(path if os.path.isabs(path) else os.path.join(base, path), label)
+            for path, label in zip(df['path'], df['label'])]
+
+
+def load_manifest(manifest, cache_dir=None, max_workers=None):
+    """
+    Load many labelled recordings. manifest is a manifest CSV path or a list of
+    (csv_path, label) pairs. Stale caches are rebuilt in parallel worker processes;
+    returns a list of (Recording, label).
+    """
+    entries = read_manifest(manifest) if isinstance(manifest, str) else list(manifest)
+
+    stale = [path for path, _ in entries if not is_cached(path, cache_dir)]
+    if len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(build_cache, stale, [cache_dir] * len(stale)))
+    elif stale:
+        build_cache(stale[0], cache_dir)
+
+    return [(load_recording(path, cache_dir), label) for path, label in entries]
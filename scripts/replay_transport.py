@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import os
+import runpy
+import sys
+import types
+
+import numpy as np
+
+from data_paths import dataset_path, require
+
+# Firmware framing (src/ble/ble.c, include/accel.h)
+FRAME_SIZE = 6           # little-endian int16 x, y, z
+CHUNK_SIZE = 20          # bytes per notification in ble_send_thread
+SAMPLE_SET = 170         # ADXL367_SAMPLE_SET, samples per FIFO watermark burst
+SAMPLE_RATE = 50
+
+EARWORM_MAC = "EF:90:1:F7:43:EA"
+EARWORM_NAME = "earworm_ble"
+UART_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+
+GRAVITY = 9.8
+RESOLUTION = 14
+
+# Set by install(); what every ReplayScanner/ReplayClient replays
+_config = {}
+
+
+def to_raw(values, resolution=RESOLUTION):
+    """Inverse of convert_values: raw counts that convert back to `values`"""
+    min_val = 2**(resolution-1)
+    max_val = 2**resolution-1
+    scale_factor = (2 * GRAVITY) / (max_val - min_val)
+    raw = np.rint(np.asarray(values, dtype=np.float64) / scale_factor)
+    return np.clip(raw, -min_val, min_val - 1).astype(np.int16)
+
+
+def load_source(source):
+    """(N, 3) int16 samples from a dataset CSV or a capture log prefix"""
+    if source.endswith('.csv'):
+        from recording_cache import load_recording
+        return to_raw(load_recording(source).xyz)
+
+    from capture_log import load_capture
+    _, raw, _ = load_capture(source)
+    return raw
+
+
+def check_source(source):
+    """Exit with a clear message unless source is a CSV or the prefix of a capture log"""
+    if not source.endswith(".csv"):
+        from capture_log import segment_paths
+        if segment_paths(source):
+            return source
+    return require(source, "replay source")
+
+
+def firmware_bursts(raw, sample_set=SAMPLE_SET, chunk_size=CHUNK_SIZE):
+    """Split samples into FIFO bursts, each a list of notification payloads"""
+    payload = np.ascontiguousarray(raw, dtype='<i2').tobytes()
+    burst_bytes = sample_set * FRAME_SIZE
+    for start in range(0, len(payload) - burst_bytes + 1, burst_bytes):
+        burst = payload[start:start + burst_bytes]
+        yield [bytearray(burst[i:i + chunk_size]) for i in range(0, len(burst), chunk_size)]
+
+
+class ReplayDevice:
+    def __init__(self, name=EARWORM_NAME, address=EARWORM_MAC):
+        self.name = name
+        self.address = address
+        self.details = None
+
+    def __repr__(self):
+        return f"ReplayDevice({self.name!r}, {self.address!r})"
+
+
+class ReplayCharacteristic:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.properties = ['notify']
+
+    def __str__(self):
+        return f"{self.uuid} (replay)"
+
+
+class ReplayScanner:
+    """Stands in for BleakScanner: always finds the one replayed device"""
+
+    @staticmethod
+    async def discover(timeout=5.0, **kwargs):
+        return [ReplayDevice(_config.get('name', EARWORM_NAME), _config.get('address', EARWORM_MAC))]
+
+    @staticmethod
+    async def find_device_by_address(address, timeout=10.0, **kwargs):
+        return ReplayDevice(_config.get('name', EARWORM_NAME), address)
+
+
+class ReplayClient:
+    """
+    Stands in for BleakClient: replays samples as the firmware would send them.
+
+    Every SAMPLE_SET samples (one FIFO watermark) a burst of CHUNK_SIZE-byte
+    notifications is delivered to the notify callback. speed scales the clock
+    (2.0 is twice real time, None or 0 is as fast as possible).
+    """
+
+    def __init__(self, address_or_ble_device, *args, **kwargs):
+        if isinstance(address_or_ble_device, ReplayDevice):
+            address_or_ble_device = address_or_ble_device.address
+        self.address = address_or_ble_device
+        self.mtu_size = CHUNK_SIZE + 3
+        self._backend = types.SimpleNamespace()
+        self._connected = False
+        self._task = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self, **kwargs):
+        self._connected = True
+        return True
+
+    async def disconnect(self):
+        await self.stop_notify(UART_UUID)
+        self._connected = False
+        return True
+
+    async def get_services(self):
+        return []
+
+    @property
+    def services(self):
+        return []
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        raw = load_source(_config['source'])
+        self._task = asyncio.create_task(self._replay(ReplayCharacteristic(char_specifier), callback, raw))
+
+    async def stop_notify(self, char_specifier):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _replay(self, sender, callback, raw):
+        loop = asyncio.get_running_loop()
+        speed = _config.get('speed') or 0
+        fs = _config.get('sample_rate', SAMPLE_RATE)
+        sample_set = _config.get('sample_set', SAMPLE_SET)
+        chunk_size = _config.get('chunk_size', CHUNK_SIZE)
+        burst_period = sample_set / fs / speed if speed else 0.0
+
+        while True:
+            start = loop.time()
+            for i, burst in enumerate(firmware_bursts(raw, sample_set, chunk_size)):
+                # The burst goes out once the FIFO has filled to its watermark
+                delay = start + (i + 1) * burst_period - loop.time()
+                await asyncio.sleep(max(delay, 0))
+                for chunk in burst:
+                    callback(sender, chunk)
+            if not _config.get('loop', False):
+                break
+
+
+def install(source, speed=1.0, loop=False, **options):
+    """
+    Replace the `bleak` module with the replay transport, so scripts that do
+    `from bleak import BleakClient, BleakScanner` talk to the replay instead.
+    Call before importing the script.
+    """
+    _config.clear()
+    _config.update(source=source, speed=speed, loop=loop, **options)
+
+    fake = types.ModuleType('bleak')
+    fake.BleakClient = ReplayClient
+    fake.BleakScanner = ReplayScanner
+    sys.modules['bleak'] = fake
+    return fake
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a receiver script against a replayed recording instead of a sensor")
+    parser.add_argument("script", help="script to run, e.g. live_ML.py")
+    parser.add_argument("--source", default=dataset_path("test_mix2.csv"), help="dataset CSV or capture log prefix")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed (0 = as fast as possible)")
+    parser.add_argument("--loop", action="store_true", help="start over at the end of the recording")
+    args, script_args = parser.parse_known_args(argv)
+    check_source(args.source)
+
+    install(args.source, speed=args.speed, loop=args.loop)
+    sys.argv = [args.script] + script_args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
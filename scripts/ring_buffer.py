@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class SampleRingBuffer:
+    """
+    Fixed-capacity circular buffer of int16 x, y, z samples.
+
+    Every sample is stored twice, at slot i and i + capacity, so any window of up
+    to `capacity` samples is one contiguous slice of the backing array and can be
+    handed out as a view without copying.
+
+    Safe for one writer (the BLE callback) and one reader (the plot/inference
+    thread): the writer fills the slots before publishing the new sample count,
+    so a reader never sees a sample that has not been written. A returned view
+    stays valid until the writer has appended another `capacity - len(view)`
+    samples; copy it if it has to live longer than that.
+    """
+
+    def __init__(self, capacity, channels=3, dtype=np.int16):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self._buf = np.zeros((2 * self.capacity, channels), dtype=self.dtype)
+        self._total = 0
+
+    def __len__(self):
+        return min(self._total, self.capacity)
+
+    @property
+    def total(self):
+        """Absolute number of samples written since creation (or the last clear)"""
+        return self._total
+
+    @property
+    def first_index(self):
+        """Absolute index of the oldest sample still held"""
+        return max(0, self._total - self.capacity)
+
+    def clear(self):
+        self._total = 0
+
+    def extend(self, samples):
+        samples = np.asarray(samples, dtype=self.dtype).reshape(-1, self.channels)
+        n = len(samples)
+        if n == 0:
+            return
+
+        # Only the newest `capacity` samples can survive this write
+        skip = max(0, n - self.capacity)
+        samples = samples[skip:]
+        m = len(samples)
+
+        cap = self.capacity
+        pos = (self._total + skip) % cap
+        first = min(m, cap - pos)
+        self._buf[pos:pos + first] = samples[:first]
+        self._buf[pos + cap:pos + cap + first] = samples[:first]
+        rest = m - first
+        if rest:
+            self._buf[:rest] = samples[first:]
+            self._buf[cap:cap + rest] = samples[first:]
+
+        # Publish only after the data is in place
+        self._total += n
+
+    def append(self, sample):
+        self.extend(np.asarray(sample, dtype=self.dtype).reshape(1, self.channels))
+
+    def window(self, start, stop):
+        """Read-only view of samples [start, stop) by absolute sample index"""
+        total = self._total
+        if start < 0 or stop < start:
+            raise IndexError(f"Invalid window [{start}, {stop})")
+        if stop > total:
+            raise IndexError(f"Window [{start}, {stop}) reaches past the newest sample ({total})")
+        if start < total - self.capacity:
+            raise IndexError(f"Window [{start}, {stop}) has already been overwritten")
+
+        pos = start % self.capacity
+        view = self._buf[pos:pos + (stop - start)]
+        view.flags.writeable = False
+        return view
+
+    def latest(self, n=None):
+        """Read-only view of the newest n samples (fewer if not enough have arrived)"""
+        total = self._total
+        n = len(self) if n is None else min(n, self.capacity, total)
+        return self.window(total - n, total)
@@ -0,0 +1,206 @@
+import asyncio
+import io
+import re
+import time
+
+import numpy as np
+
+POLL_INTERVAL = 0.02  # seconds between reads of the port
+
+# Line formats sent by the Arduino sketches
+PULSE_RAW = 1   # "raw"          (read_serial_pulse)
+PULSE_CSV = 3   # "bpm,?,raw"    (pulse.py)
+VOLTAGE = 1     # "volts"        (capVolt.py)
+
+NUMBER = rb'[-+]?\d+(?:\.\d*)?'
+
+
+def line_pattern(columns):
+    """Regex for one line of `columns` comma-separated numbers"""
+    fields = rb'\s*,\s*'.join([rb'(' + NUMBER + rb')'] * columns)
+    return re.compile(rb'^\s*' + fields + rb'\s*\r?$', re.MULTILINE)
+
+
+def parse_lines(data, columns=1, pattern=None):
+    """
+    Parse every complete line in `data` at once.
+
+    Returns (values, rest, bad): a (lines, columns) float64 array of the lines
+    that match the format, the trailing partial line to prepend to the next
+    read, and the number of complete lines that did not match (noise, boot
+    messages, half lines after opening the port).
+    """
+    end = data.rfind(b'\n') + 1
+    complete, rest = data[:end], data[end:]
+    if not complete:
+        return np.empty((0, columns)), rest, 0
+
+    lines = complete.count(b'\n')
+    try:
+        # Fast path: NumPy's C parser, when every line is well formed
+        values = np.loadtxt(io.BytesIO(complete), delimiter=',', ndmin=2)
+        if values.shape[1] == columns:
+            return values, rest, lines - len(values)
+    except ValueError:
+        pass
+
+    # Otherwise pick out the lines that match with one regex pass
+    pattern = pattern or line_pattern(columns)
+    values = np.array(pattern.findall(complete), dtype=bytes).astype(np.float64).reshape(-1, columns)
+    return values, rest, lines - len(values)
+
+
+class SerialReader:
+    """
+    Reads a line-based serial port in bulk: everything waiting on the port is read
+    in one call and all complete lines are parsed together.
+
+    Lines that arrived in one read are given timestamps spread evenly between the
+    previous read and this one.
+    """
+
+    def __init__(self, ser, columns=1, poll_interval=POLL_INTERVAL):
+        self.ser = ser
+        self.columns = columns
+        self.poll_interval = poll_interval
+        self.pattern = line_pattern(columns)
+        self._rest = b''
+        self._last_read = None
+        self.bytes_read = 0
+        self.lines = 0
+        self.bad_lines = 0
+
+    def read_available(self):
+        """(timestamps, values) of the lines completed since the last call; never blocks"""
+        waiting = self.ser.in_waiting
+        now = time.time()
+        if self._last_read is None:
+            self._last_read = now
+        if not waiting:
+            return np.empty(0), np.empty((0, self.columns))
+
+        data = self.ser.read(waiting)
+        self.bytes_read += len(data)
+        values, self._rest, bad = parse_lines(self._rest + data, self.columns, self.pattern)
+        self.lines += len(values) + bad
+        self.bad_lines += bad
+
+        timestamps = np.linspace(self._last_read, now, len(values) + 1)[1:]
+        self._last_read = now
+        return timestamps, values
+
+    async def run(self, on_values, duration=None):
+        """
+        Poll the port on the running event loop and hand every batch to
+        on_values(timestamps, values) until `duration` seconds have passed
+        (forever if None) or the task is cancelled.
+        """
+        deadline = None if duration is None else time.monotonic() + duration
+        while deadline is None or time.monotonic() < deadline:
+            timestamps, values = self.read_available()
+            if len(values):
+                on_values(timestamps, values)
+            await asyncio.sleep(self.poll_interval)
+
+
+def open_port(port, baudrate, columns=PULSE_RAW):
+    """A pyserial port that never blocks on read, or a 100 Hz FakeSerial pulse sensor for port "fake" """
+    if port == "fake":
+        return FakeSerial(synthetic_pulse_lines(csv=columns == PULSE_CSV), baudrate, rate=100)
+    import serial
+    return serial.Serial(port, baudrate, timeout=0)
+
+
+async def read_into(pulse_data, port='COM3', baudrate=9600, columns=PULSE_RAW, column=-1, duration=None):
+    """
+    Coroutine that appends one column of a serial sensor to a PulseStore. Runs
+    next to the BLE client on the same event loop.
+    """
+    try:
+        ser = open_port(port, baudrate, columns)
+    except Exception as e:
+        print(f"Error opening serial port {port}: {e}")
+        return None
+    print(f"Serial port {port} opened.")
+
+    reader = SerialReader(ser, columns)
+    try:
+        await reader.run(lambda t, values: pulse_data.extend(t, values[:, column]), duration)
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"Error reading from serial: {e}")
+    finally:
+        ser.close()
+    return reader
+
+
+# ------------------------
+# Fake port for testing
+# ------------------------
+def synthetic_pulse_lines(bpm=72, rate=100, csv=False, seed=0):
+    """Endless pulse sensor lines: a 10-bit pulse wave, or bpm,ibi,raw when csv"""
+    rng = np.random.default_rng(seed)
+    i = 0
+    while True:
+        phase = (i / rate) * bpm / 60.0 % 1.0
+        raw = int(512 + 300 * np.exp(-((phase - 0.2) / 0.05) ** 2) + rng.normal(0, 5))
+        i += 1
+        yield f"{bpm},{int(60000 / bpm)},{raw}" if csv else f"{raw}"
+
+
+class FakeSerial:
+    """
+    Stands in for serial.Serial: serves the given lines at `rate` lines per
+    second, or as fast as the baud rate allows (about baudrate / 10 bytes per
+    second) when rate is None.
+    """
+
+    def __init__(self, lines, baudrate=9600, rate=None):
+        self.baudrate = baudrate
+        self.rate = rate
+        self.is_open = True
+        self._lines = iter(lines)
+        self._buffer = b''
+        self._start = time.monotonic()
+        self._bytes = 0
+        self._count = 0
+
+    def _fill(self):
+        elapsed = time.monotonic() - self._start
+        byte_budget = int(elapsed * self.baudrate / 10) - self._bytes
+        line_budget = None if self.rate is None else int(elapsed * self.rate) - self._count
+        chunks = []
+        while byte_budget > 0 and (line_budget is None or line_budget > 0):
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunk = (line if isinstance(line, bytes) else line.encode()) + b'\r\n'
+            chunks.append(chunk)
+            byte_budget -= len(chunk)
+            self._bytes += len(chunk)
+            self._count += 1
+            if line_budget is not None:
+                line_budget -= 1
+        self._buffer += b''.join(chunks)
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self):
+        self._fill()
+        end = self._buffer.find(b'\n') + 1
+        if not end:
+            return b''
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+    def close(self):
+        self.is_open = False
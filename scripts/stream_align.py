@@ -0,0 +1,247 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from ring_buffer import SampleRingBuffer
+
+LOOKBACK_SEC = 10.0    # streaming mode keeps (and refits the clock on) this much history
+MAX_GAP_SEC = 0.5      # grid points further than this from a real reading are NaN
+CLOCK_BLOCK_SEC = 10.0  # offline mode refits the clock offset every this many seconds
+MAX_RATE_ERROR = 0.05  # fitted sample rate may differ this much from the nominal one
+
+# Joint arrays on one grid: time (N,) host seconds, accel (N, 3), pulse (N,) or None
+Aligned = namedtuple('Aligned', ['time', 'accel', 'pulse'])
+
+
+# ------------------------
+# Sample clock
+# ------------------------
+class SampleClock:
+    """Host time of accelerometer sample `index`: offset + index * period"""
+
+    def __init__(self, fs, offset=0.0, period=None):
+        self.fs = fs
+        self.offset = offset
+        self.period = 1.0 / fs if period is None else period
+
+    def times(self, start, stop):
+        return self.offset + np.arange(start, stop) * self.period
+
+    def index(self, t):
+        """Fractional sample index at host time t"""
+        return (np.asarray(t) - self.offset) / self.period
+
+    def __repr__(self):
+        return f"SampleClock(fs={1.0 / self.period:.3f}, offset={self.offset:.3f})"
+
+
+def fit_period(indices, arrivals, fs):
+    """Sample period from a least-squares line through (index, arrival), kept near 1 / fs"""
+    nominal = 1.0 / fs
+    if len(indices) < 2 or indices[-1] - indices[0] < fs:
+        return nominal
+    period = np.polyfit(indices, arrivals, 1)[0]
+    return float(np.clip(period, nominal * (1 - MAX_RATE_ERROR), nominal * (1 + MAX_RATE_ERROR)))
+
+
+def fit_clock(indices, arrivals, fs):
+    """
+    SampleClock for samples with known host arrival times.
+
+    A sample arrives some time after it was taken (radio interval, host
+    scheduling), never before, and every sample of a notification shares one
+    arrival time. So the period comes from a line fit, and the offset is the
+    lower envelope of arrival - index * period: the least delayed sample sets it
+    and no sample is placed after it arrived.
+    """
+    indices = np.asarray(indices, dtype=np.float64)
+    arrivals = np.asarray(arrivals, dtype=np.float64)
+    period = fit_period(indices, arrivals, fs)
+    return SampleClock(fs, float(np.min(arrivals - indices * period)), period)
+
+
+def sample_times(arrivals, fs, block_sec=CLOCK_BLOCK_SEC):
+    """
+    Host time of every sample of a whole capture, from per-sample arrival times
+    (capture_log ArrivalTime). The offset is refit every `block_sec` seconds, so
+    a lost notification only shifts the samples of the block it falls in.
+    """
+    arrivals = np.asarray(arrivals, dtype=np.float64)
+    n = len(arrivals)
+    if n == 0:
+        return arrivals
+    indices = np.arange(n, dtype=np.float64)
+    period = fit_period(indices, arrivals, fs)
+
+    block = max(1, int(block_sec * fs))
+    starts = np.arange(0, n, block)
+    offsets = np.minimum.reduceat(arrivals - indices * period, starts)
+    return np.repeat(offsets, np.diff(np.append(starts, n))) + indices * period
+
+
+# ------------------------
+# Resampling
+# ------------------------
+def grid(start, stop, rate):
+    """Times k / rate within [start, stop]; anchored at 0 so successive grids line up"""
+    first = int(np.ceil(start * rate))
+    last = int(np.floor(stop * rate))
+    return np.arange(first, last + 1) / rate
+
+
+def resample(t, values, times, max_gap=MAX_GAP_SEC):
+    """
+    Linearly interpolate (N,) or (N, C) values taken at sorted times t onto
+    `times`. One binary search serves every channel. Points outside t, or
+    between two readings more than max_gap apart, are NaN.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.ndim == 1
+    values = values.reshape(len(t), -1)
+    times = np.asarray(times, dtype=np.float64)
+
+    out = np.full((len(times), values.shape[1]), np.nan)
+    if len(t) == 0 or len(times) == 0:
+        return out[:, 0] if flat else out
+    if len(t) == 1:
+        out[times == t[0]] = values[0]
+        return out[:, 0] if flat else out
+
+    hi = np.clip(np.searchsorted(t, times, side='right'), 1, len(t) - 1)
+    lo = hi - 1
+    span = t[hi] - t[lo]
+    weight = np.divide(times - t[lo], span, out=np.zeros_like(times), where=span > 0)
+
+    valid = (times >= t[0]) & (times <= t[-1]) & (span <= max_gap)
+    weight = weight[valid, np.newaxis]
+    out[valid] = values[lo[valid]] * (1 - weight) + values[hi[valid]] * weight
+    return out[:, 0] if flat else out
+
+
+def align(accel_t, accel, pulse_t=None, pulse=None, rate=50.0, max_gap=MAX_GAP_SEC):
+    """
+    Both streams resampled onto one `rate` Hz grid over the time they both
+    cover (the accelerometer's alone when there is no pulse data).
+    """
+    accel_t = np.asarray(accel_t, dtype=np.float64)
+    has_pulse = pulse_t is not None and len(pulse_t) > 0
+    if len(accel_t) == 0:
+        return Aligned(np.empty(0), np.empty((0, 3)), np.empty(0) if has_pulse else None)
+
+    start, stop = accel_t[0], accel_t[-1]
+    if has_pulse:
+        start, stop = max(start, pulse_t[0]), min(stop, pulse_t[-1])
+    times = grid(start, stop, rate)
+    return Aligned(times,
+                   resample(accel_t, accel, times, max_gap),
+                   resample(pulse_t, pulse, times, max_gap) if has_pulse else None)
+
+
+def align_capture(prefix, pulse_data=None, rate=None, convert=None):
+    """Offline mode: a whole capture log and a PulseStore on one grid (default: the sensor rate)"""
+    from capture_log import load_capture
+
+    header, raw, arrivals = load_capture(prefix)
+    fs = header['Fs']
+    accel = raw if convert is None else convert(raw)
+    pulse_t, pulse = pulse_data.all() if pulse_data is not None else (None, None)
+    return align(sample_times(arrivals, fs), accel, pulse_t, pulse, rate or fs)
+
+
+# ------------------------
+# Streaming
+# ------------------------
+class StreamAligner:
+    """
+    Streaming mode: puts a live SampleRingBuffer of accelerometer samples and a
+    PulseStore on the host clock and hands out joint arrays on a fixed-rate grid.
+
+    The BLE callback calls mark(buffer.total, arrival) after each extend(). The
+    sample clock is refit from the marks of the last `lookback` seconds only, so
+    memory and work stay bounded and the clock follows drift and lost
+    notifications. Like the buffers it reads, it is safe for one writer (mark)
+    and one reader.
+    """
+
+    def __init__(self, accel, pulse=None, fs=50.0, rate=None, lookback=LOOKBACK_SEC,
+                 max_gap=MAX_GAP_SEC, convert=None):
+        self.accel = accel
+        self.pulse = pulse
+        self.fs = fs
+        self.rate = rate or fs
+        self.lookback = lookback
+        self.max_gap = max_gap
+        self.convert = convert
+        # (index of the last sample of a notification, its arrival time)
+        self._marks = SampleRingBuffer(max(16, int(lookback * fs)), channels=2, dtype=np.float64)
+        self._next = None  # first grid time poll() has not returned yet
+
+    def mark(self, total, arrival=None):
+        if total > 0:
+            self._marks.append((total - 1, time.time() if arrival is None else arrival))
+
+    def clock(self):
+        marks = self._marks.latest()
+        if not len(marks):
+            return None
+        recent = marks[marks[:, 1] >= marks[-1, 1] - self.lookback]
+        return fit_clock(recent[:, 0], recent[:, 1], self.fs)
+
+    def accel_range(self, start=-np.inf, clock=None):
+        """(times, samples) of the buffered accelerometer samples taken at or after `start`"""
+        clock = clock or self.clock()
+        total = self.accel.total
+        if clock is None or total == 0:
+            return np.empty(0), np.empty((0, self.accel.channels))
+        first = self.accel.first_index
+        if np.isfinite(start):
+            first = min(max(first, int(np.ceil(clock.index(start)))), total)
+        samples = self.accel.window(first, total)
+        if self.convert is not None:
+            samples = self.convert(samples)
+        return clock.times(first, total), samples
+
+    def _empty(self):
+        return Aligned(np.empty(0), np.empty((0, self.accel.channels)),
+                       None if self.pulse is None else np.empty(0))
+
+    def _joint(self, start, stop, clock):
+        # Read one reading past each end so the grid edges can be interpolated
+        margin = 2.0 / self.rate
+        accel_t, accel = self.accel_range(start - margin, clock)
+        times = grid(start, stop, self.rate)
+        pulse = None
+        if self.pulse is not None:
+            pulse_t, pulse_v = self.pulse.range(start - self.max_gap)
+            pulse = resample(pulse_t, pulse_v, times, self.max_gap)
+        return Aligned(times, resample(accel_t, accel, times, self.max_gap), pulse)
+
+    def _end(self, clock):
+        # Newest time both streams have reached
+        end = clock.offset + (self.accel.total - 1) * clock.period
+        if self.pulse is not None:
+            last = self.pulse.last_time()
+            end = min(end, -np.inf if last is None else last)
+        return end
+
+    def window(self, seconds):
+        """Joint arrays for the newest `seconds` that both streams cover"""
+        clock = self.clock()
+        if clock is None:
+            return self._empty()
+        end = self._end(clock)
+        return self._joint(end - seconds, end, clock)
+
+    def poll(self):
+        """Joint arrays for the grid points that became available since the last call"""
+        clock = self.clock()
+        if clock is None:
+            return self._empty()
+        end = self._end(clock)
+        start = end - self.lookback if self._next is None else max(self._next, end - self.lookback)
+        aligned = self._joint(start, end, clock)
+        if len(aligned.time):
+            self._next = aligned.time[-1] + 0.5 / self.rate
+        return aligned
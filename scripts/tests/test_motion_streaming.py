@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from motionDetection import MotionDetection
+from motion_streaming import StreamingMotionDetection
+
+
+def full_window_logits(model, samples, window_size):
+    window = torch.from_numpy(np.ascontiguousarray(samples[-window_size:].T))[np.newaxis]
+    with torch.no_grad():
+        return model(window).numpy()
+
+
+def feed(streamer, model, samples, window_size, rng, fed=0):
+    """Feed samples[fed:] in random-length blocks, checking every update against the full forward pass"""
+    checked = 0
+    while fed < len(samples):
+        block = samples[fed:fed + int(rng.integers(1, 2 * window_size))]
+        fed += len(block)
+        logits = streamer.update(block)
+        if fed < window_size:
+            assert logits is None
+            continue
+        np.testing.assert_allclose(logits.numpy(), full_window_logits(model, samples[:fed], window_size),
+                                   rtol=1e-5, atol=1e-5)
+        checked += 1
+    return checked
+
+
+@pytest.mark.parametrize("window_size", [5, 16, 128])
+def test_update_matches_full_window(window_size):
+    torch.manual_seed(0)
+    rng = np.random.default_rng(window_size)
+    model = MotionDetection(input_channels=3, seq_len=window_size).eval()
+    streamer = StreamingMotionDetection(model, window_size=window_size)
+
+    # Long enough for the sample and activation ring buffers to wrap many times
+    samples = rng.standard_normal((40 * window_size, 3)).astype(np.float32)
+    assert feed(streamer, model, samples, window_size, rng) > 0
+
+    # After reset() nothing from before may leak into the new windows
+    streamer.reset()
+    samples = rng.standard_normal((10 * window_size, 3)).astype(np.float32) + 1.0
+    assert streamer.update(samples[:window_size - 1]) is None
+    assert feed(streamer, model, samples, window_size, rng, fed=window_size - 1) > 0
+
+
+def test_resync_keeps_running_sum_exact():
+    torch.manual_seed(1)
+    rng = np.random.default_rng(1)
+    model = MotionDetection(input_channels=3, seq_len=32).eval()
+    streamer = StreamingMotionDetection(model, window_size=32, resync_every=3)
+    samples = rng.standard_normal((2000, 3)).astype(np.float32)
+    assert feed(streamer, model, samples, 32, rng) > 0
@@ -0,0 +1,30 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sliding_windows(samples, window_size, hop=None):
+    """
+    Strided (num_windows, channels, window_size) view over (T, channels) samples.
+
+    hop defaults to window_size (non-overlapping chunks, as the scripts used so far).
+    No data is copied; call np.ascontiguousarray on the result if you need to write
+    to it or hand it to something that expects contiguous memory.
+    """
+    hop = window_size if hop is None else hop
+    if window_size <= 0 or hop <= 0:
+        raise ValueError("window_size and hop must be positive")
+
+    samples = np.asarray(samples)
+    if len(samples) < window_size:
+        return np.empty((0, samples.shape[1], window_size), dtype=samples.dtype)
+
+    # (T - window_size + 1, channels, window_size)
+    return sliding_window_view(samples, window_size, axis=0)[::hop]
+
+
+def window_starts(num_samples, window_size, hop=None):
+    """Index of the first sample of every window sliding_windows produces"""
+    hop = window_size if hop is None else hop
+    if num_samples < window_size:
+        return np.empty(0, dtype=np.int64)
+    return np.arange(0, num_samples - window_size + 1, hop, dtype=np.int64)